@@ -0,0 +1,134 @@
+# Async versions of the download and chunk upload views, routed in place of
+# the DRF views when ASYNC_VIEWS is set (ASGI deployments). A slow client
+# then holds a coroutine rather than a whole worker.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_http_methods
+from rest_framework.authentication import CSRFCheck
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+import asyncio
+
+from .links import FILE_GONE, aresolve_download_token, bound_to_other_user
+from .models import UploadSession
+from .serializers import UploadSessionSerializer
+from .utils import (
+    serve_file, make_etag, download_filename, accel_redirect_response, upload_session_path, write_range,
+)
+
+UNSAFE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+
+def _csrf_failure(request):
+    check = CSRFCheck(lambda request: None)
+    check.process_request(request)
+    return check.process_view(request, None, (), {})
+
+
+async def authenticate(request):
+    """
+    Resolve the user like API_AUTHENTICATION_CLASSES does, without blocking.
+
+    Bearer JWTs need no query, API tokens one async lookup and sessions go
+    through ``request.auser()``. Returns (user, error_response).
+    """
+    try:
+        result = JWTStatelessUserAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return None, JsonResponse({"error": "Invalid or expired token"}, status=401)
+    if result is not None:
+        return result[0], None
+
+    scheme, _, key = request.headers.get('Authorization', '').partition(' ')
+    if scheme == 'Token':
+        token = await Token.objects.select_related('user').filter(key=key.strip()).afirst()
+        if token is None or not token.user.is_active:
+            return None, JsonResponse({"error": "Invalid token"}, status=401)
+        return token.user, None
+
+    user = await request.auser()
+    # Like SessionAuthentication, cookie-authenticated writes need a CSRF token
+    if user.is_authenticated and request.method in UNSAFE_METHODS:
+        reason = _csrf_failure(request)
+        if reason:
+            return None, JsonResponse({"error": "CSRF Failed"}, status=403)
+    return user, None
+
+
+async def _require(request, role):
+    user, error = await authenticate(request)
+    if error:
+        return None, error
+    if not user.is_authenticated:
+        return None, JsonResponse({"error": "Authentication credentials were not provided."}, status=401)
+    if not getattr(user, role, False):
+        return None, JsonResponse({"error": "You do not have permission to perform this action."}, status=403)
+    return user, None
+
+
+async def file_response(request, file):
+    """Async files.views.file_response"""
+    if settings.SECURE_DOWNLOAD_BACKEND == 'nginx':
+        return accel_redirect_response(file.file.name, download_filename(file))
+
+    try:
+        fh = await asyncio.to_thread(default_storage.open, file.file.name, 'rb')
+    except FileNotFoundError:
+        return JsonResponse({"error": FILE_GONE}, status=410)
+    size = file.size if file.size is not None else await asyncio.to_thread(default_storage.size, file.file.name)
+    return serve_file(
+        request,
+        fh,
+        size=size,
+        filename=download_filename(file),
+        etag=make_etag(file.sha256 or file.file.name, size, file.uploaded_at.timestamp()),
+        last_modified=file.uploaded_at,
+        asynchronous=True,
+    )
+
+
+@require_GET
+async def signed_download(request, token):
+    """Async SignedDownloadView"""
+    payload, file, error = await aresolve_download_token(token)
+    if error:
+        message, status = error
+        return JsonResponse({"error": message}, status=status)
+
+    if payload['u'] is not None:
+        user, error = await authenticate(request)
+        if error:
+            return error
+        if bound_to_other_user(payload, user):
+            return JsonResponse({"error": "This link was issued to another user"}, status=403)
+
+    return await file_response(request, file)
+
+
+@csrf_exempt
+@require_http_methods(['PUT'])
+async def upload_chunk(request, session_id, index):
+    """Async UploadChunkView"""
+    user, error = await _require(request, 'is_ops')
+    if error:
+        return error
+
+    session = await UploadSession.objects.filter(id=session_id, uploader_id=user.id).afirst()
+    if session is None:
+        return JsonResponse({"error": "Upload session not found"}, status=404)
+    if not 0 <= index < session.chunk_count:
+        return JsonResponse({"error": "Invalid chunk number"}, status=400)
+
+    expected = session.expected_chunk_length(index)
+    written, oversized = await asyncio.to_thread(
+        write_range, request, upload_session_path(session), index * session.chunk_size, expected
+    )
+    session = await sync_to_async(session.record_chunk)(index, received=written == expected and not oversized)
+
+    if written != expected or oversized:
+        return JsonResponse({"error": f"Chunk {index} must be exactly {expected} bytes"}, status=400)
+    return JsonResponse(UploadSessionSerializer(session).data)
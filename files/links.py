@@ -0,0 +1,84 @@
+from django.conf import settings
+from django.core import signing
+from django.db.models import F
+import time
+
+from .models import UploadedFile
+
+LINK_SALT = 'files.download-link'
+
+# Everything a download needs from the file row
+LINK_FILE_FIELDS = ['file', 'original_name', 'size', 'sha256', 'uploaded_at', 'link_version']
+
+FILE_GONE = "This file is no longer available"
+
+LEGACY_LINK_RETIRED = "This link format has been retired, please request a new download link"
+
+
+def make_download_token(file, expires_in=None, user=None):
+    """
+    Sign the file id, an expiry, an optional user binding and the file's
+    current link version into a URL-safe token.
+
+    The storage path is looked up when the link is used, so links survive
+    the file's content being moved.
+    """
+    expires_in = min(expires_in or settings.SIGNED_LINK_MAX_AGE, settings.SIGNED_LINK_MAX_AGE)
+    payload = {
+        'f': file.pk,
+        'e': int(time.time()) + expires_in,
+        # As a string: JWT users carry their id as the (string) claim
+        'u': str(user.pk) if user is not None else None,
+        'v': file.link_version,
+    }
+    return signing.dumps(payload, salt=LINK_SALT, compress=True)
+
+
+def read_download_token(token):
+    """Check a download token's signature and expiry; returns (payload, error)"""
+    try:
+        payload = signing.loads(token, salt=LINK_SALT)
+    except signing.BadSignature:
+        return None, "Invalid or expired link"
+
+    if payload['e'] < time.time():
+        return None, "Invalid or expired link"
+    return payload, None
+
+
+def link_file_error(payload, file):
+    """(message, status) when the link's file, None if deleted, cannot be served by it, else None"""
+    if file is None:
+        return FILE_GONE, 410
+    if file.link_version != payload['v']:
+        return "This link has been revoked", 404
+    return None
+
+
+def resolve_download_token(token):
+    """Verify a download token and load its file; returns (payload, file, error)"""
+    payload, message = read_download_token(token)
+    if message:
+        return None, None, (message, 404)
+    file = UploadedFile.objects.only(*LINK_FILE_FIELDS).filter(pk=payload['f']).first()
+    return payload, file, link_file_error(payload, file)
+
+
+async def aresolve_download_token(token):
+    """Async resolve_download_token"""
+    payload, message = read_download_token(token)
+    if message:
+        return None, None, (message, 404)
+    file = await UploadedFile.objects.only(*LINK_FILE_FIELDS).filter(pk=payload['f']).afirst()
+    return payload, file, link_file_error(payload, file)
+
+
+def bound_to_other_user(payload, user):
+    """True for a link bound to someone other than ``user``, however either side authenticated"""
+    return payload['u'] is not None and str(getattr(user, 'id', None)) != str(payload['u'])
+
+
+def revoke_download_links(file):
+    """Invalidate every signed link issued so far for ``file``"""
+    UploadedFile.objects.filter(pk=file.pk).update(link_version=F('link_version') + 1)
+    file.refresh_from_db(fields=['link_version'])
@@ -0,0 +1,84 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+import hashlib
+
+from .models import ListingVersion
+from .utils import make_etag
+
+LISTING_VERSION_PK = 1
+
+
+def current_listing_version():
+    """(version, updated_at) of the file listing; one primary-key read"""
+    row = ListingVersion.objects.filter(pk=LISTING_VERSION_PK).values_list('version', 'updated_at').first()
+    if row is None:
+        row = ListingVersion.objects.get_or_create(pk=LISTING_VERSION_PK)[0]
+        return row.version, row.updated_at
+    return row
+
+
+def bump_listing_version():
+    """
+    Mark the listing as changed.
+
+    Called once the change is committed, so a reader that sees the new
+    version also sees the new rows; the update is a short statement of its
+    own rather than a lock held for the whole upload transaction.
+    """
+    updated = ListingVersion.objects.filter(pk=LISTING_VERSION_PK).update(
+        version=F('version') + 1, updated_at=timezone.now()
+    )
+    if not updated:
+        ListingVersion.objects.get_or_create(pk=LISTING_VERSION_PK, defaults={'version': 1})
+
+
+def listing_validators(*parts):
+    """ETag and Last-Modified timestamp for a listing; ``parts`` add what else the response depends on"""
+    version, updated_at = current_listing_version()
+    return make_etag('listing', version, *parts), int(updated_at.timestamp()), version
+
+
+def conditional_listing_response(request, etag, last_modified):
+    """
+    304 when the client's copy is current, else None.
+
+    Decided on the ETag alone: it carries the listing version, while
+    Last-Modified has one-second resolution and would hide a change made
+    within the same second as the client's copy.
+    """
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        set_listing_headers(response, etag, last_modified)
+    return response
+
+
+def set_listing_headers(response, etag, last_modified):
+    response.headers['ETag'] = etag
+    response.headers['Last-Modified'] = http_date(last_modified)
+    # Cached by the client but revalidated on every poll
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def listing_context(files, version):
+    """Template context for the dashboards' file tables, cached per listing version"""
+    return {'files': files, 'listing_version': version, 'listing_cache_seconds': settings.LISTING_CACHE_SECONDS}
+
+
+def cached_listing(version, url, build):
+    """
+    Serialized listing for ``url`` at ``version``, from the cache or ``build()``.
+
+    Keys include the version, so a change makes every cached page
+    unreachable instead of having to delete them.
+    """
+    key = f"files:listing:{version}:{hashlib.sha256(url.encode()).hexdigest()}"
+    data = cache.get(key)
+    if data is None:
+        data = build()
+        cache.set(key, data, settings.LISTING_CACHE_SECONDS)
+    return data
@@ -0,0 +1,72 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from files.listing import bump_listing_version
+from files.models import UploadedFile
+from files.utils import STREAM_CHUNK_SIZE
+import hashlib
+import mimetypes
+import os
+
+class Command(BaseCommand):
+    help = 'Fill in size, MIME type, SHA-256 and original filename for files uploaded before they were recorded'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of rows updated per query (default: 500)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        fields = ['size', 'content_type', 'sha256', 'original_name', 'extension']
+
+        pending = UploadedFile.objects.filter(
+            Q(size__isnull=True) | Q(sha256='') | Q(content_type='') | Q(original_name='')
+        ).select_related('blob').order_by('pk')
+
+        updated = missing = 0
+        batch = []
+        for f in pending.iterator(chunk_size=batch_size):
+            if not f.original_name:
+                f.original_name = os.path.basename(f.file.name)
+                f.extension = os.path.splitext(f.original_name)[1].lower()
+            if not f.content_type:
+                f.content_type = mimetypes.guess_type(f.original_name)[0] or ''
+
+            if f.blob is not None:
+                f.size, f.sha256 = f.blob.size, f.blob.sha256
+            elif f.size is None or not f.sha256:
+                try:
+                    f.size, f.sha256 = self.measure(f)
+                except FileNotFoundError:
+                    missing += 1
+                    self.stdout.write(self.style.WARNING(f'  ⚠️ File missing from storage: {f.file.name}'))
+
+            batch.append(f)
+            if len(batch) >= batch_size:
+                UploadedFile.objects.bulk_update(batch, fields)
+                updated += len(batch)
+                batch = []
+                self.stdout.write(f'  {updated} rows updated...')
+
+        UploadedFile.objects.bulk_update(batch, fields)
+        updated += len(batch)
+        if updated:
+            # bulk_update sends no signals
+            bump_listing_version()
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Successfully backfilled {updated} files ({missing} missing from storage)')
+        )
+
+    def measure(self, f):
+        """Size and SHA-256 of a stored file, read once"""
+        hasher = hashlib.sha256()
+        size = 0
+        with f.file.open('rb') as fh:
+            for chunk in iter(lambda: fh.read(STREAM_CHUNK_SIZE), b''):
+                hasher.update(chunk)
+                size += len(chunk)
+        return size, hasher.hexdigest()
@@ -0,0 +1,350 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.test import Client, RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from datetime import timedelta
+from files.links import make_download_token
+from files.listing import bump_listing_version
+from files.models import Blob, UploadedFile
+from files.storage import store_blob
+from rest_framework_simplejwt.tokens import AccessToken
+from users.models import CustomUser
+from users.serializers import add_role_claims
+from users.utils import create_magic_login_token
+import contextlib
+import io
+import json
+import random
+import re
+import requests
+import tempfile
+import threading
+import time
+import zipfile
+
+ENDPOINTS = ('upload', 'list', 'download', 'login_request', 'login')
+
+DOCX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+
+# Seeded rows are recognisable by their usernames and can be removed with --clean
+BENCH_PREFIX = 'bench-user-'
+
+
+def sample_docx(index, paragraphs=200):
+    """A small but valid .docx with some text in it"""
+    body = ''.join(
+        f'<w:p><w:r><w:t>Benchmark document {index}, paragraph {n}: quarterly figures and notes.</w:t></w:r></w:p>'
+        for n in range(paragraphs)
+    )
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types"/>')
+        archive.writestr(
+            'word/document.xml',
+            '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+            f'<w:body>{body}</w:body></w:document>',
+        )
+    return buffer.getvalue()
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarise(latencies, errors, elapsed):
+    ordered = sorted(latencies)
+    ms = lambda value: None if value is None else round(value * 1000, 2)
+    return {
+        'requests': len(latencies) + errors,
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'mean_ms': ms(sum(ordered) / len(ordered)) if ordered else None,
+        'p50_ms': ms(percentile(ordered, 0.50)),
+        'p95_ms': ms(percentile(ordered, 0.95)),
+        'p99_ms': ms(percentile(ordered, 0.99)),
+    }
+
+
+class Command(BaseCommand):
+    help = ('Seed benchmark data and load-test the upload, list, download and magic-login flows '
+            'against a running server, reporting throughput, latency percentiles and SQL query counts')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000',
+                            help='Base URL of the running server (default: http://127.0.0.1:8000)')
+        parser.add_argument('--endpoints', default=','.join(ENDPOINTS),
+                            help=f'Comma-separated flows to run (default: {",".join(ENDPOINTS)})')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per flow (default: 200)')
+        parser.add_argument('--concurrency', type=int, default=10, help='Concurrent clients (default: 10)')
+        parser.add_argument('--seed', action='store_true', help='Create the benchmark users and files first')
+        parser.add_argument('--seed-users', type=int, default=10_000, help='Users to seed (default: 10000)')
+        parser.add_argument('--seed-files', type=int, default=100_000, help='Files to seed (default: 100000)')
+        parser.add_argument('--clean', action='store_true', help='Delete the seeded data and exit')
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+        parser.add_argument('--compare', help='Earlier JSON results to compare against')
+
+    def handle(self, *args, **options):
+        if options['clean']:
+            deleted, _ = CustomUser.objects.filter(username__startswith=BENCH_PREFIX).delete()
+            self.stdout.write(self.style.SUCCESS(f'🧹 Removed {deleted} benchmark rows'))
+            return
+
+        endpoints = [name.strip() for name in options['endpoints'].split(',') if name.strip()]
+        unknown = set(endpoints) - set(ENDPOINTS)
+        if unknown:
+            raise CommandError(f'Unknown flows: {", ".join(sorted(unknown))}')
+
+        if options['seed']:
+            self.seed(options['seed_users'], options['seed_files'])
+
+        ops = CustomUser.objects.filter(username__startswith=BENCH_PREFIX, is_ops=True).first()
+        client = CustomUser.objects.filter(username__startswith=BENCH_PREFIX, is_client=True).first()
+        if ops is None or client is None:
+            raise CommandError('No benchmark data found; run with --seed first')
+
+        self.base_url = options['url'].rstrip('/')
+        self.ops_jwt = str(add_role_claims(AccessToken.for_user(ops), ops))
+        self.client_jwt = str(add_role_claims(AccessToken.for_user(client), client))
+        self.document = sample_docx(0)
+        # Signed links, as handed out by /api/download-file/<id>/
+        self.tokens = [
+            make_download_token(file)
+            for file in UploadedFile.objects.filter(uploader__username__startswith=BENCH_PREFIX)
+            .only('pk', 'link_version')[:5000]
+        ]
+        self.local = threading.local()
+
+        results = {
+            'meta': {
+                'url': self.base_url,
+                'requests': options['requests'],
+                'concurrency': options['concurrency'],
+                'started_at': timezone.now().isoformat(),
+                'files': UploadedFile.objects.count(),
+                'users': CustomUser.objects.count(),
+            },
+            'endpoints': {},
+        }
+        for name in endpoints:
+            self.stdout.write(f'🚀 {name}: {options["requests"]} requests, concurrency {options["concurrency"]}')
+            stats = self.run_load(name, options['requests'], options['concurrency'])
+            stats['queries'] = self.count_queries(name)
+            results['endpoints'][name] = stats
+
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as fh:
+                baseline = json.load(fh)
+        self.report(results, baseline)
+
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                json.dump(results, fh, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'📄 Results written to {options["output"]}'))
+
+    # -- seeding -----------------------------------------------------------
+
+    def seed(self, user_count, file_count):
+        existing = CustomUser.objects.filter(username__startswith=BENCH_PREFIX).count()
+        password = make_password('bench-password')
+        users = [
+            CustomUser(
+                username=f'{BENCH_PREFIX}{n}',
+                email=f'{BENCH_PREFIX}{n}@bench.local',
+                password=password,
+                # One in ten is an operations user
+                is_ops=n % 10 == 0,
+                is_client=n % 10 != 0,
+                email_verified=True,
+            )
+            for n in range(existing, user_count)
+        ]
+        CustomUser.objects.bulk_create(users, batch_size=2000)
+        self.stdout.write(f'👥 Seeded {len(users)} users')
+
+        uploaders = list(
+            CustomUser.objects.filter(username__startswith=BENCH_PREFIX, is_ops=True).values_list('id', flat=True)
+        )
+        blobs = [store_blob(ContentFile(sample_docx(n))) for n in range(10)]
+        existing = UploadedFile.objects.filter(uploader__username__startswith=BENCH_PREFIX).count()
+        now = timezone.now()
+        created = 0
+        for start in range(existing, file_count, 5000):
+            batch = []
+            for n in range(start, min(start + 5000, file_count)):
+                blob = blobs[n % len(blobs)]
+                batch.append(UploadedFile(
+                    uploader_id=uploaders[n % len(uploaders)],
+                    file=blob.file.name,
+                    blob=blob,
+                    original_name=f'report-{n}.docx',
+                    extension='.docx',
+                    size=blob.size,
+                    content_type=DOCX_CONTENT_TYPE,
+                    sha256=blob.sha256,
+                ))
+            with transaction.atomic():
+                rows = UploadedFile.objects.bulk_create(batch)
+                # Spread upload times over the past so listings page realistically
+                for offset, row in enumerate(rows):
+                    row.uploaded_at = now - timedelta(minutes=start + offset)
+                UploadedFile.objects.bulk_update(rows, ['uploaded_at'], batch_size=1000)
+            created += len(batch)
+            self.stdout.write(f'📁 Seeded {created} files')
+        # bulk_create skips the reference counting and signals of the upload views
+        for blob in blobs:
+            Blob.objects.filter(pk=blob.pk).update(ref_count=blob.files.count())
+        bump_listing_version()
+
+    # -- load --------------------------------------------------------------
+
+    def session(self):
+        if not hasattr(self.local, 'session'):
+            self.local.session = requests.Session()
+        return self.local.session
+
+    def prepare(self, name, count):
+        """Per-request inputs created before timing starts"""
+        if name == 'login':
+            users = CustomUser.objects.filter(username__startswith=BENCH_PREFIX, is_client=True)[:count]
+            request = RequestFactory().get('/request-magic-login/')
+            return [create_magic_login_token(user, request).raw_token for user in users]
+        if name == 'login_request':
+            return list(
+                CustomUser.objects.filter(username__startswith=BENCH_PREFIX).values_list('email', flat=True)[:count]
+            )
+        return [None] * count
+
+    def request(self, name, arg, index):
+        """Send one request for a flow; returns True on the expected response"""
+        http = self.session()
+        url = self.base_url
+        if name == 'upload':
+            response = http.post(
+                f'{url}/api/upload/',
+                files={'file': (f'bench-{index}.docx', self.document, DOCX_CONTENT_TYPE)},
+                headers={'Authorization': f'Bearer {self.ops_jwt}'},
+            )
+            return response.status_code == 200
+        if name == 'list':
+            response = http.get(f'{url}/api/list/', headers={'Authorization': f'Bearer {self.client_jwt}'})
+            return response.status_code == 200
+        if name == 'download':
+            # The signed link is the credential, no Authorization header
+            response = http.get(f'{url}/api/download/{self.tokens[index % len(self.tokens)]}/')
+            return response.status_code == 200 and len(response.content) > 0
+        if name == 'login_request':
+            if 'csrftoken' not in http.cookies:
+                http.get(f'{url}/request-magic-login/')
+            response = http.post(
+                f'{url}/request-magic-login/',
+                data={'email': arg, 'csrfmiddlewaretoken': http.cookies.get('csrftoken', '')},
+                headers={'Referer': f'{url}/request-magic-login/'},
+            )
+            return response.status_code == 200
+        if name == 'login':
+            response = http.get(f'{url}/magic-login/{arg}/', allow_redirects=False)
+            return response.status_code == 302 and 'dashboard' in response.headers.get('Location', '')
+        raise CommandError(f'Unknown flow {name}')
+
+    def run_load(self, name, count, concurrency):
+        args = self.prepare(name, count)
+        if len(args) < count:
+            raise CommandError(f'Not enough seeded data for {count} {name} requests')
+
+        def timed(index):
+            start = time.perf_counter()
+            try:
+                ok = self.request(name, args[index], index)
+            except requests.RequestException:
+                ok = False
+            return time.perf_counter() - start, ok
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            outcomes = list(pool.map(timed, range(count)))
+        elapsed = time.perf_counter() - started
+        connections.close_all()
+
+        latencies = [latency for latency, ok in outcomes if ok]
+        return summarise(latencies, len(outcomes) - len(latencies), elapsed)
+
+    # -- queries -----------------------------------------------------------
+
+    def count_queries(self, name):
+        """
+        SQL statements one request of the flow runs, measured in process.
+
+        The request goes through the same views and middleware as over HTTP;
+        its writes are rolled back, and an upload's blob goes to a scratch
+        MEDIA_ROOT that is removed afterwards.
+        """
+        client = Client()
+        auth = {}
+        arg = self.prepare(name, 1)[0]
+        if name in ('upload',):
+            auth = {'HTTP_AUTHORIZATION': f'Bearer {self.ops_jwt}'}
+        elif name == 'list':
+            auth = {'HTTP_AUTHORIZATION': f'Bearer {self.client_jwt}'}
+
+        with contextlib.ExitStack() as stack:
+            if name == 'upload':
+                stack.enter_context(override_settings(MEDIA_ROOT=stack.enter_context(tempfile.TemporaryDirectory())))
+            stack.enter_context(transaction.atomic())
+            with CaptureQueriesContext(connection) as queries:
+                if name == 'upload':
+                    response = client.post(
+                        '/api/upload/',
+                        {'file': ContentFile(self.document, name='bench.docx')},
+                        **auth,
+                    )
+                elif name == 'list':
+                    response = client.get('/api/list/', **auth)
+                elif name == 'download':
+                    response = client.get(f'/api/download/{self.tokens[0]}/')
+                elif name == 'login_request':
+                    response = client.post('/request-magic-login/', {'email': arg})
+                else:
+                    response = client.get(f'/magic-login/{arg}/')
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                response.close()
+            transaction.set_rollback(True)
+        # Savepoints are bookkeeping, not work done for the request
+        return sum(1 for query in queries.captured_queries if not re.match(r'(RELEASE )?SAVEPOINT', query['sql']))
+
+    # -- report ------------------------------------------------------------
+
+    def report(self, results, baseline):
+        self.stdout.write('')
+        self.stdout.write(f'{"flow":<14}{"req/s":>9}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}{"errors":>8}{"queries":>9}')
+        for name, stats in results['endpoints'].items():
+            self.stdout.write(
+                f'{name:<14}{stats["throughput_rps"] or 0:>9}{stats["p50_ms"] or 0:>10}{stats["p95_ms"] or 0:>10}'
+                f'{stats["p99_ms"] or 0:>10}{stats["errors"]:>8}{stats["queries"]:>9}'
+            )
+            before = (baseline or {}).get('endpoints', {}).get(name)
+            if before:
+                self.stdout.write(f'{"  vs baseline":<14}' + ''.join(
+                    f'{self.delta(before.get(key), stats.get(key)):>{width}}'
+                    for key, width in (('throughput_rps', 9), ('p50_ms', 10), ('p95_ms', 10), ('p99_ms', 10))
+                ) + f'{"":>8}{stats["queries"] - before.get("queries", 0):>+9}')
+            if stats['errors']:
+                self.stdout.write(self.style.WARNING(
+                    f'  ⚠️ {stats["errors"]} failed requests, see the server log '
+                    f'(login flows are rate limited unless THROTTLE_LOGIN_IP / THROTTLE_LOGIN_ACCOUNT are raised)'
+                ))
+
+    @staticmethod
+    def delta(before, after):
+        if not before or after is None:
+            return '-'
+        return f'{(after - before) / before * 100:+.0f}%'
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from files.models import UploadSession
+from files.utils import upload_session_path
+import os
+
+class Command(BaseCommand):
+    help = 'Remove abandoned resumable upload sessions and their partial files'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours',
+            type=int,
+            default=24,
+            help='Remove sessions started more than this many hours ago (default: 24)',
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timezone.timedelta(hours=options['hours'])
+
+        removed = 0
+        for session in UploadSession.objects.filter(created_at__lt=cutoff).iterator():
+            path = upload_session_path(session)
+            if os.path.exists(path):
+                os.remove(path)
+            session.delete()
+            removed += 1
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Successfully removed {removed} abandoned upload sessions')
+        )
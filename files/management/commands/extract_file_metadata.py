@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from files.previews import extract_pending_metadata
+import time
+
+class Command(BaseCommand):
+    help = 'Read document properties and thumbnails of newly uploaded files'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep running and pick up new uploads instead of exiting when all are processed',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5.0,
+            help='Seconds to wait between polls when nothing is pending (default: 5)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=50,
+            help='Number of files processed per batch (default: 50)',
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            extracted = extract_pending_metadata(options['batch_size'])
+            total += extracted
+            if extracted:
+                self.stdout.write(f'🖼️ Extracted metadata for {extracted} files')
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f'Metadata up to date: {total} files processed'))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from files.search import index_pending_files
+import time
+
+class Command(BaseCommand):
+    help = 'Extract the text of newly uploaded documents into the full-text search index'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep running and pick up new uploads instead of exiting when all are indexed',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5.0,
+            help='Seconds to wait between polls when nothing is pending (default: 5)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=20,
+            help='Number of files indexed per batch (default: 20)',
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            indexed = index_pending_files(options['batch_size'])
+            total += indexed
+            if indexed:
+                self.stdout.write(f'🔎 Indexed {indexed} files')
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f'Search index up to date: {total} files indexed'))
@@ -0,0 +1,108 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from files.listing import bump_listing_version
+from files.models import UploadedFile
+from files.storage import release_blob, store_blob_from_path
+import os
+import time
+
+# Legacy layout: every upload directly inside this directory
+LEGACY_DIR = 'uploads'
+
+class Command(BaseCommand):
+    help = ('Move files from the flat media/uploads/ layout into the sharded blob store, in batches '
+            'and while the site is up')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Files moved per batch (default: 500)',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0.1,
+            help='Seconds to pause between batches (default: 0.1)',
+        )
+        parser.add_argument(
+            '--start-after',
+            type=int,
+            default=None,
+            help='Resume a previous run after this file id',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report what would be moved',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            self.move(options)
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('\nInterrupted. Re-run with --start-after set to the last id shown to resume.'))
+
+    def move(self, options):
+        dry_run = options['dry_run']
+        # Files saved through the FileField are already sharded
+        legacy = (
+            UploadedFile.objects.filter(blob__isnull=True)
+            .exclude(file__regex=rf'^{LEGACY_DIR}/[0-9a-f]{{2}}/[0-9a-f]{{2}}/')
+            .order_by('pk')
+        )
+        last_pk = options['start_after']
+        moved = missing = 0
+
+        while True:
+            batch = legacy if last_pk is None else legacy.filter(pk__gt=last_pk)
+            rows = list(batch.values_list('pk', 'file', 'original_name')[:options['batch_size']])
+            if not rows:
+                break
+
+            batch_moved = 0
+            for pk, name, original_name in rows:
+                path = default_storage.path(name)
+                if not os.path.exists(path):
+                    self.stdout.write(self.style.WARNING(f'  ⚠️ File missing from storage: {name}'))
+                    missing += 1
+                    continue
+                if dry_run:
+                    batch_moved += 1
+                    continue
+
+                # Linked rather than moved: the old name stays valid until the
+                # row points at the blob
+                blob = store_blob_from_path(path, keep=True)
+                original_name = original_name or os.path.basename(name)
+                updated = UploadedFile.objects.filter(pk=pk, blob__isnull=True, file=name).update(
+                    file=blob.file.name,
+                    blob=blob,
+                    size=blob.size,
+                    sha256=blob.sha256,
+                    original_name=original_name,
+                    extension=os.path.splitext(original_name)[1].lower(),
+                )
+                if not updated:
+                    # Deleted or replaced while we were copying it
+                    release_blob(blob.pk)
+                    continue
+                if not UploadedFile.objects.filter(file=name).exists():
+                    default_storage.delete(name)
+                batch_moved += 1
+
+            moved += batch_moved
+            last_pk = rows[-1][0]
+            if batch_moved and not dry_run:
+                # Listings cached with the old URLs are dropped
+                bump_listing_version()
+            verb = 'would move' if dry_run else 'moved'
+            self.stdout.write(f'  up to id {last_pk}: {verb} {batch_moved} ({moved} so far)')
+            if options['sleep'] and not dry_run:
+                time.sleep(options['sleep'])
+
+        if dry_run:
+            self.stdout.write(self.style.SUCCESS(f'Dry run: {moved} files would be moved, {missing} missing'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'📦 Moved {moved} files into the sharded store, {missing} missing'))
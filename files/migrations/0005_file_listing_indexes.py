@@ -0,0 +1,53 @@
+# Generated by Django 5.2.3 on 2026-10-18 00:54
+
+import os
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def set_extensions(apps, schema_editor):
+    UploadedFile = apps.get_model("files", "UploadedFile")
+    batch = []
+    for f in UploadedFile.objects.only("id", "file", "original_name").iterator():
+        f.extension = os.path.splitext(f.original_name or f.file.name)[1].lower()
+        batch.append(f)
+        if len(batch) >= 1000:
+            UploadedFile.objects.bulk_update(batch, ["extension"])
+            batch = []
+    UploadedFile.objects.bulk_update(batch, ["extension"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("files", "0004_blob_store"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="uploadedfile",
+            name="extension",
+            field=models.CharField(blank=True, max_length=10),
+        ),
+        migrations.RunPython(set_extensions, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="uploadedfile",
+            index=models.Index(fields=["-uploaded_at", "-id"], name="file_listing_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="uploadedfile",
+            index=models.Index(
+                fields=["uploader", "-uploaded_at", "-id"],
+                name="file_listing_uploader_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="uploadedfile",
+            index=models.Index(
+                fields=["extension", "-uploaded_at", "-id"],
+                name="file_listing_extension_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.3 on 2026-10-18 00:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("files", "0005_file_listing_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="uploadedfile",
+            name="content_type",
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name="uploadedfile",
+            name="sha256",
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name="uploadedfile",
+            name="size",
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
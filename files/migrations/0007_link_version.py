@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 00:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("files", "0006_file_metadata"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="uploadedfile",
+            name="link_version",
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
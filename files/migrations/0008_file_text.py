@@ -0,0 +1,78 @@
+# Generated by Django 5.2.3 on 2026-10-18 01:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# External-content FTS5 table over files_filetext, kept in sync by triggers
+SQLITE_CREATE = [
+    "CREATE VIRTUAL TABLE files_filetext_fts USING fts5("
+    "content, content='files_filetext', content_rowid='file_id', tokenize='porter unicode61')",
+    "CREATE TRIGGER files_filetext_ai AFTER INSERT ON files_filetext BEGIN "
+    "INSERT INTO files_filetext_fts(rowid, content) VALUES (new.file_id, new.content); END",
+    "CREATE TRIGGER files_filetext_ad AFTER DELETE ON files_filetext BEGIN "
+    "INSERT INTO files_filetext_fts(files_filetext_fts, rowid, content) "
+    "VALUES ('delete', old.file_id, old.content); END",
+    "CREATE TRIGGER files_filetext_au AFTER UPDATE ON files_filetext BEGIN "
+    "INSERT INTO files_filetext_fts(files_filetext_fts, rowid, content) "
+    "VALUES ('delete', old.file_id, old.content); "
+    "INSERT INTO files_filetext_fts(rowid, content) VALUES (new.file_id, new.content); END",
+]
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS files_filetext_au",
+    "DROP TRIGGER IF EXISTS files_filetext_ad",
+    "DROP TRIGGER IF EXISTS files_filetext_ai",
+    "DROP TABLE IF EXISTS files_filetext_fts",
+]
+
+# Generated tsvector column with a GIN index
+POSTGRES_CREATE = [
+    "ALTER TABLE files_filetext ADD COLUMN search_vector tsvector "
+    "GENERATED ALWAYS AS (to_tsvector('english', content)) STORED",
+    "CREATE INDEX files_filetext_search_idx ON files_filetext USING GIN (search_vector)",
+]
+POSTGRES_DROP = [
+    "DROP INDEX IF EXISTS files_filetext_search_idx",
+    "ALTER TABLE files_filetext DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def _run(schema_editor, statements):
+    for sql in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+def create_search_index(apps, schema_editor):
+    _run(schema_editor, {"sqlite": SQLITE_CREATE, "postgresql": POSTGRES_CREATE})
+
+
+def drop_search_index(apps, schema_editor):
+    _run(schema_editor, {"sqlite": SQLITE_DROP, "postgresql": POSTGRES_DROP})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("files", "0007_link_version"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FileText",
+            fields=[
+                (
+                    "file",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="text",
+                        serialize=False,
+                        to="files.uploadedfile",
+                    ),
+                ),
+                ("content", models.TextField(blank=True)),
+                ("error", models.CharField(blank=True, max_length=255)),
+                ("extracted_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.3 on 2026-10-18 01:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("files", "0008_file_text"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FileMetadata",
+            fields=[
+                (
+                    "file",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="metadata",
+                        serialize=False,
+                        to="files.uploadedfile",
+                    ),
+                ),
+                ("title", models.CharField(blank=True, max_length=255)),
+                ("author", models.CharField(blank=True, max_length=255)),
+                ("pages", models.PositiveIntegerField(blank=True, null=True)),
+                ("slides", models.PositiveIntegerField(blank=True, null=True)),
+                ("sheets", models.PositiveIntegerField(blank=True, null=True)),
+                ("thumbnail", models.FileField(blank=True, upload_to="previews/")),
+                ("thumbnail_type", models.CharField(blank=True, max_length=50)),
+                ("error", models.CharField(blank=True, max_length=255)),
+                ("extracted_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.3 on 2026-10-18 01:29
+
+import files.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("files", "0010_listing_version"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="blob",
+            name="file",
+            field=models.FileField(upload_to=files.models.blob_upload_to),
+        ),
+        migrations.AlterField(
+            model_name="uploadedfile",
+            name="file",
+            field=models.FileField(upload_to=files.models.file_upload_to),
+        ),
+    ]
@@ -1,12 +1,209 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
 from users.models import CustomUser
+import os
 import uuid
 
+
+def sharded_name(prefix, key):
+    """``prefix/ab/cd/<key>``: two directory levels taken from the start of ``key``"""
+    return f"{prefix}/{key[:2]}/{key[2:4]}/{key}"
+
+
+def blob_upload_to(instance, filename):
+    return sharded_name('blobs', instance.sha256)
+
+
+def file_upload_to(instance, filename):
+    """
+    Name a file saved through ``UploadedFile.file`` by a random id.
+
+    No directory grows past a few thousand entries and names never collide;
+    the name the file was uploaded with is kept in ``original_name``.
+    """
+    if not instance.original_name:
+        instance.original_name = os.path.basename(filename)
+        instance.extension = os.path.splitext(instance.original_name)[1].lower()
+    return sharded_name('uploads', uuid.uuid4().hex)
+
+
+class Blob(models.Model):
+    """Content-addressed file body shared by every UploadedFile with the same bytes"""
+    sha256 = models.CharField(max_length=64, unique=True)
+    file = models.FileField(upload_to=blob_upload_to)
+    size = models.BigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.sha256
+
+
 class UploadedFile(models.Model):
     uploader = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
-    file = models.FileField(upload_to='uploads/')
+    file = models.FileField(upload_to=file_upload_to)
+    blob = models.ForeignKey(Blob, null=True, blank=True, on_delete=models.PROTECT, related_name='files')
+    original_name = models.CharField(max_length=255, blank=True)
+    extension = models.CharField(max_length=10, blank=True)
+    size = models.BigIntegerField(null=True, blank=True)
+    content_type = models.CharField(max_length=100, blank=True)
+    sha256 = models.CharField(max_length=64, blank=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
     secure_token = models.CharField(max_length=100, unique=True, default=uuid.uuid4)
+    # Bumped to revoke every signed download link issued for this file
+    link_version = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        # Keyset pagination seeks on (uploaded_at, id), optionally narrowed
+        # to one uploader or one extension
+        indexes = [
+            models.Index(fields=['-uploaded_at', '-id'], name='file_listing_idx'),
+            models.Index(fields=['uploader', '-uploaded_at', '-id'], name='file_listing_uploader_idx'),
+            models.Index(fields=['extension', '-uploaded_at', '-id'], name='file_listing_extension_idx'),
+        ]
+
+    @property
+    def display_name(self):
+        return self.original_name or self.file.name
+
+    def __str__(self):
+        return self.display_name
+
+
+class FileText(models.Model):
+    """
+    Text extracted from an uploaded document for full-text search.
+
+    Rows are filled in by the ``index_file_text`` worker; the search index
+    itself (FTS5 on SQLite, a tsvector column on PostgreSQL) is kept in sync
+    by the database.
+    """
+    file = models.OneToOneField(UploadedFile, on_delete=models.CASCADE, primary_key=True, related_name='text')
+    content = models.TextField(blank=True)
+    error = models.CharField(max_length=255, blank=True)
+    extracted_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Text of {self.file_id}"
+
+
+class FileMetadata(models.Model):
+    """
+    Document properties and embedded thumbnail of an uploaded file.
+
+    Filled in by the ``extract_file_metadata`` worker so listings can show
+    them without opening the document.
+    """
+    file = models.OneToOneField(UploadedFile, on_delete=models.CASCADE, primary_key=True, related_name='metadata')
+    title = models.CharField(max_length=255, blank=True)
+    author = models.CharField(max_length=255, blank=True)
+    pages = models.PositiveIntegerField(null=True, blank=True)
+    slides = models.PositiveIntegerField(null=True, blank=True)
+    sheets = models.PositiveIntegerField(null=True, blank=True)
+    # Named after the content hash, so files sharing a blob share it too
+    thumbnail = models.FileField(upload_to='previews/', blank=True)
+    thumbnail_type = models.CharField(max_length=50, blank=True)
+    error = models.CharField(max_length=255, blank=True)
+    extracted_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
-        return self.file.name
+        return f"Metadata of {self.file_id}"
+
+
+class UploadSession(models.Model):
+    """A resumable upload: chunks are written into a partial file until finalized"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    uploader = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100)
+    total_size = models.BigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    received_chunks = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @property
+    def chunk_count(self):
+        return max(1, -(-self.total_size // self.chunk_size))
+
+    def expected_chunk_length(self, index):
+        if index == self.chunk_count - 1:
+            return self.total_size - index * self.chunk_size
+        return self.chunk_size
+
+    @property
+    def received_offset(self):
+        """Number of contiguous bytes received from the start of the file"""
+        received = set(self.received_chunks)
+        index = 0
+        while index in received:
+            index += 1
+        return min(index * self.chunk_size, self.total_size)
+
+    @property
+    def is_complete(self):
+        return len(set(self.received_chunks)) == self.chunk_count
+
+    def record_chunk(self, index, received):
+        """
+        Mark a chunk as received, or as needing a re-send when its range may
+        now hold partial data. Returns the up-to-date session.
+        """
+        with transaction.atomic():
+            session = UploadSession.objects.select_for_update().get(pk=self.pk)
+            chunks = set(session.received_chunks)
+            if received:
+                chunks.add(index)
+            else:
+                chunks.discard(index)
+            session.received_chunks = sorted(chunks)
+            session.save(update_fields=['received_chunks'])
+        return session
+
+    def __str__(self):
+        return f"Upload session {self.id} ({self.filename})"
+
+
+class ListingVersion(models.Model):
+    """
+    Single row counting changes to the file listing.
+
+    Listings derive their ETag and Last-Modified from it, so a poll that
+    finds nothing new is answered without reading the files table.
+    """
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Listing version {self.version}"
+
+
+# UploadedFile columns shown by the API listing and the dashboards
+LISTED_FIELDS = frozenset(['file', 'original_name', 'size', 'content_type', 'sha256', 'uploader', 'uploaded_at'])
+
+
+@receiver(post_save, sender=UploadedFile)
+@receiver(post_delete, sender=UploadedFile)
+@receiver(post_save, sender=FileMetadata)
+@receiver(post_delete, sender=FileMetadata)
+def bump_listing(sender, instance, update_fields=None, **kwargs):
+    """Any save that may change a listed column, and every delete, changes the listing"""
+    if sender is FileMetadata or update_fields is None or LISTED_FIELDS & set(update_fields):
+        from .listing import bump_listing_version
+        transaction.on_commit(bump_listing_version)
+
+
+@receiver(post_delete, sender=UploadedFile)
+def release_file_blob(sender, instance, **kwargs):
+    """Drop the blob reference held by a deleted file"""
+    if instance.blob_id:
+        from .storage import release_blob
+        release_blob(instance.blob_id)
+
+
+@receiver(post_delete, sender=FileMetadata)
+def release_file_thumbnail(sender, instance, **kwargs):
+    """Forget the cached preview and delete the thumbnail once unused"""
+    from .previews import release_thumbnail
+    release_thumbnail(instance)
@@ -0,0 +1,135 @@
+from xml.etree.ElementTree import fromstring, iterparse
+import re
+import zipfile
+
+# Parts holding the visible text of each document type
+TEXT_PARTS = {
+    '.docx': re.compile(r'^word/(document|header\d*|footer\d*|footnotes|endnotes)\.xml$'),
+    '.pptx': re.compile(r'^ppt/(slides/slide|notesSlides/notesSlide)\d+\.xml$'),
+    '.xlsx': re.compile(r'^xl/(sharedStrings|worksheets/sheet\d+)\.xml$'),
+}
+
+# Runs of text are <w:t>, <a:t> or <t> elements in every format
+TEXT_TAG = 't'
+
+# Paragraph-like elements after which a line break is emitted
+BREAK_TAGS = {'p', 'si', 'row', 'tr'}
+
+# Guard against zip bombs: parts claiming more than this are skipped
+MAX_PART_SIZE = 64 * 1024 * 1024
+
+# Document properties parts are small; anything bigger is not trusted
+MAX_PROPERTIES_SIZE = 1024 * 1024
+
+# Embedded thumbnails that browsers can show directly
+THUMBNAIL_TYPES = {
+    'docProps/thumbnail.jpeg': 'image/jpeg',
+    'docProps/thumbnail.jpg': 'image/jpeg',
+    'docProps/thumbnail.png': 'image/png',
+}
+MAX_THUMBNAIL_SIZE = 2 * 1024 * 1024
+
+
+def _part_order(name):
+    # slide10.xml sorts after slide9.xml
+    return [int(piece) if piece.isdigit() else piece for piece in re.split(r'(\d+)', name)]
+
+
+def _iter_part_text(stream):
+    for _, elem in iterparse(stream, events=('end',)):
+        tag = elem.tag.rsplit('}', 1)[-1]
+        if tag == TEXT_TAG:
+            if elem.text:
+                yield elem.text
+        elif tag in BREAK_TAGS:
+            yield '\n'
+            # Finished paragraphs are dropped so memory stays flat
+            elem.clear()
+
+
+def iter_document_text(fh, extension):
+    """
+    Yield the text of an OOXML document piece by piece.
+
+    The XML parts are streamed out of the zip and parsed incrementally, so
+    large documents are never loaded into memory whole.
+    """
+    pattern = TEXT_PARTS[extension]
+    with zipfile.ZipFile(fh) as archive:
+        parts = [
+            info for info in archive.infolist()
+            if pattern.match(info.filename) and info.file_size <= MAX_PART_SIZE
+        ]
+        for info in sorted(parts, key=lambda info: _part_order(info.filename)):
+            with archive.open(info) as stream:
+                yield from _iter_part_text(stream)
+            yield '\n'
+
+
+def extract_text(fh, extension, max_chars):
+    """Text of an OOXML document, cut off after ``max_chars`` characters"""
+    pieces = []
+    length = 0
+    for piece in iter_document_text(fh, extension):
+        pieces.append(piece)
+        length += len(piece)
+        if length >= max_chars:
+            break
+    text = re.sub(r'\n\s*\n+', '\n', ''.join(pieces))
+    return text[:max_chars].strip()
+
+
+def _read_small_xml(archive, name):
+    try:
+        info = archive.getinfo(name)
+    except KeyError:
+        return None
+    if info.file_size > MAX_PROPERTIES_SIZE:
+        return None
+    return fromstring(archive.read(info))
+
+
+def _local_values(root):
+    return {elem.tag.rsplit('}', 1)[-1]: (elem.text or '').strip() for elem in root.iter()}
+
+
+def _count(value):
+    return int(value) if value and value.isdigit() else None
+
+
+def read_properties(fh, extension):
+    """
+    Read the document properties of an OOXML file.
+
+    Returns a dict with ``title``, ``author``, ``pages``, ``slides``,
+    ``sheets`` and ``thumbnail`` (a (content_type, bytes) pair or None).
+    Only the small docProps parts (and the workbook for sheet counts) are
+    read.
+    """
+    props = {'title': '', 'author': '', 'pages': None, 'slides': None, 'sheets': None, 'thumbnail': None}
+    with zipfile.ZipFile(fh) as archive:
+        core = _read_small_xml(archive, 'docProps/core.xml')
+        if core is not None:
+            values = _local_values(core)
+            props['title'] = values.get('title', '')[:255]
+            props['author'] = values.get('creator', '')[:255]
+
+        app = _read_small_xml(archive, 'docProps/app.xml')
+        if app is not None:
+            values = _local_values(app)
+            if extension == '.docx':
+                props['pages'] = _count(values.get('Pages'))
+            elif extension == '.pptx':
+                props['slides'] = _count(values.get('Slides'))
+
+        if extension == '.xlsx':
+            workbook = _read_small_xml(archive, 'xl/workbook.xml')
+            if workbook is not None:
+                props['sheets'] = sum(1 for elem in workbook.iter() if elem.tag.rsplit('}', 1)[-1] == 'sheet')
+
+        for info in archive.infolist():
+            content_type = THUMBNAIL_TYPES.get(info.filename)
+            if content_type and info.file_size <= MAX_THUMBNAIL_SIZE:
+                props['thumbnail'] = (content_type, archive.read(info))
+                break
+    return props
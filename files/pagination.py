@@ -0,0 +1,70 @@
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+import base64
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination on (uploaded_at, id), newest first.
+
+    Each page is a seek on the listing index instead of an OFFSET, so the
+    cost of a page does not grow with how deep the client has paged.
+    """
+    page_size = 50
+    max_page_size = 200
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+
+    def encode_cursor(self, obj):
+        raw = f"{obj.uploaded_at.isoformat()}|{obj.pk}"
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+            uploaded_at, pk = raw.split('|')
+            uploaded_at = parse_datetime(uploaded_at)
+            if uploaded_at is None:
+                raise ValueError
+            return uploaded_at, int(pk)
+        except (ValueError, UnicodeDecodeError):
+            raise ValidationError({"cursor": "Invalid cursor"})
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        limit = self.get_page_size(request)
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            uploaded_at, pk = self.decode_cursor(cursor)
+            queryset = queryset.filter(
+                Q(uploaded_at__lt=uploaded_at) | Q(uploaded_at=uploaded_at, id__lt=pk)
+            )
+
+        rows = list(queryset.order_by('-uploaded_at', '-id')[:limit + 1])
+        self.next_cursor = self.encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+        return rows[:limit]
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'next_cursor': self.next_cursor,
+            'results': data,
+        })
@@ -0,0 +1,118 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from .models import FileMetadata, UploadedFile, sharded_name
+from .ooxml import read_properties
+from .utils import ALLOWED_EXTENSIONS, make_etag
+
+THUMBNAIL_EXTENSIONS = {'image/jpeg': '.jpeg', 'image/png': '.png'}
+
+# Files without a thumbnail are re-checked this often, so a pending
+# extraction shows up soon
+PREVIEW_MISS_CACHE_SECONDS = 30
+
+# Fields copied between files that share stored content
+METADATA_FIELDS = ['title', 'author', 'pages', 'slides', 'sheets', 'thumbnail', 'thumbnail_type', 'error']
+
+
+def preview_cache_key(file_id):
+    return f'files:preview:{file_id}'
+
+
+def _store_thumbnail(file, content_type, data):
+    key = file.sha256 or f"{file.pk:04d}"
+    name = sharded_name('previews', key) + THUMBNAIL_EXTENSIONS[content_type]
+    if default_storage.exists(name):
+        return name
+    return default_storage.save(name, ContentFile(data))
+
+
+def extract_metadata(file):
+    """
+    Read the properties and thumbnail of one UploadedFile into FileMetadata.
+
+    Files sharing a blob reuse what was already extracted for it.
+    """
+    if file.blob_id is not None:
+        existing = (
+            FileMetadata.objects.filter(file__blob_id=file.blob_id, error='')
+            .exclude(file_id=file.pk)
+            .values(*METADATA_FIELDS)
+            .first()
+        )
+        if existing is not None:
+            metadata = FileMetadata.objects.update_or_create(file=file, defaults=existing)[0]
+            cache.delete(preview_cache_key(file.pk))
+            return metadata
+
+    defaults = {'error': ''}
+    try:
+        with default_storage.open(file.file.name, 'rb') as fh:
+            props = read_properties(fh, file.extension)
+    except Exception as exc:
+        # Unreadable documents get an empty row so they are not retried forever
+        defaults['error'] = f"{type(exc).__name__}: {exc}"[:255]
+    else:
+        thumbnail = props.pop('thumbnail')
+        defaults.update(props)
+        if thumbnail is not None:
+            defaults['thumbnail_type'], data = thumbnail
+            defaults['thumbnail'] = _store_thumbnail(file, defaults['thumbnail_type'], data)
+    metadata = FileMetadata.objects.update_or_create(file=file, defaults=defaults)[0]
+    cache.delete(preview_cache_key(file.pk))
+    return metadata
+
+
+def extract_pending_metadata(batch_size):
+    """Extract metadata for the next batch of files that have none yet; returns the count"""
+    files = list(
+        UploadedFile.objects.filter(metadata__isnull=True, extension__in=ALLOWED_EXTENSIONS)
+        .order_by('id')[:batch_size]
+    )
+    for file in files:
+        extract_metadata(file)
+    return len(files)
+
+
+def get_preview(file_id):
+    """
+    Thumbnail of a file as (etag, content_type, storage name), or None.
+
+    Previews never change for a given file, so after the first request
+    their validators are answered from the cache without touching the
+    database; the image itself is streamed from storage, not cached.
+    """
+    key = preview_cache_key(file_id)
+    preview = cache.get(key)
+    if preview is not None:
+        return preview or None
+
+    metadata = (
+        FileMetadata.objects.filter(file_id=file_id)
+        .exclude(thumbnail='')
+        .values('thumbnail', 'thumbnail_type', 'file__sha256')
+        .first()
+    )
+    preview = ()
+    if metadata is not None:
+        etag = make_etag('preview', metadata['file__sha256'] or metadata['thumbnail'])
+        preview = (etag, metadata['thumbnail_type'], metadata['thumbnail'])
+    timeout = settings.PREVIEW_CACHE_SECONDS if preview else PREVIEW_MISS_CACHE_SECONDS
+    cache.set(key, preview, timeout)
+    return preview or None
+
+
+def release_thumbnail(metadata):
+    """Drop the cached preview and delete the thumbnail once no file uses it"""
+    cache.delete(preview_cache_key(metadata.file_id))
+    name = metadata.thumbnail.name
+    if name:
+        transaction.on_commit(lambda: _delete_unused_thumbnail(name))
+
+
+def _delete_unused_thumbnail(name):
+    if not FileMetadata.objects.filter(thumbnail=name).exists():
+        default_storage.delete(name)
@@ -0,0 +1,120 @@
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import DataError, connection, transaction
+import re
+
+from .models import FileText, UploadedFile
+from .ooxml import extract_text
+from .utils import ALLOWED_EXTENSIONS
+
+SNIPPET_WORDS = 16
+
+# FTS5: bm25() is lower for better matches; snippet() marks hits with [ ]
+SQLITE_SEARCH = """
+    SELECT rowid, bm25(files_filetext_fts) AS rank,
+           snippet(files_filetext_fts, 0, '[', ']', '…', %s)
+    FROM files_filetext_fts
+    WHERE files_filetext_fts MATCH %s
+    ORDER BY rank
+    LIMIT %s
+"""
+
+# The headline is only built for the rows that made the cut
+POSTGRES_SEARCH = """
+    SELECT hits.file_id, hits.rank,
+           ts_headline('english', t.content, hits.query, %s)
+    FROM (
+        SELECT file_id, ts_rank_cd(search_vector, query) AS rank, query
+        FROM files_filetext, websearch_to_tsquery('english', %s) AS query
+        WHERE search_vector @@ query
+        ORDER BY rank DESC
+        LIMIT %s
+    ) AS hits
+    JOIN files_filetext t ON t.file_id = hits.file_id
+    ORDER BY hits.rank DESC
+"""
+
+
+def _fts5_query(query):
+    # Quote every word so user input can't break the MATCH syntax; words
+    # are ANDed, the last one matches as a prefix for search-as-you-type
+    words = re.findall(r'\w+', query)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def search_file_ids(query, limit):
+    """
+    Ranked full-text search; returns [(file_id, rank, snippet)] best first.
+
+    Uses FTS5 on SQLite and the tsvector index on PostgreSQL. Other
+    databases fall back to an unranked substring match.
+    """
+    vendor = connection.vendor
+    if vendor == 'sqlite':
+        match = _fts5_query(query)
+        if match is None:
+            return []
+        sql, params = SQLITE_SEARCH, [SNIPPET_WORDS, match, limit]
+    elif vendor == 'postgresql':
+        options = f'StartSel=[, StopSel=], MaxWords={SNIPPET_WORDS}, MinWords=5'
+        sql, params = POSTGRES_SEARCH, [options, query, limit]
+    else:
+        rows = FileText.objects.filter(content__icontains=query).values_list('file_id', flat=True)[:limit]
+        return [(file_id, None, '') for file_id in rows]
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [(file_id, rank, snippet) for file_id, rank, snippet in cursor.fetchall()]
+
+
+def index_file(file):
+    """
+    Extract and store the text of one UploadedFile.
+
+    Files sharing a blob have the same content, so text already extracted
+    for the blob is copied instead of parsing the document again.
+    """
+    if file.blob_id is not None:
+        existing = (
+            FileText.objects.filter(file__blob_id=file.blob_id, error='')
+            .exclude(file_id=file.pk)
+            .values_list('content', flat=True)
+            .first()
+        )
+        if existing is not None:
+            return _store_text(file, existing, '')
+
+    content, error = '', ''
+    try:
+        with default_storage.open(file.file.name, 'rb') as fh:
+            content = extract_text(fh, file.extension, settings.SEARCH_MAX_TEXT_CHARS)
+    except Exception as exc:
+        # Unreadable documents get an empty row so they are not retried forever
+        error = f"{type(exc).__name__}: {exc}"[:255]
+    return _store_text(file, content, error)
+
+
+def _store_text(file, content, error):
+    try:
+        with transaction.atomic():
+            return FileText.objects.update_or_create(file=file, defaults={'content': content, 'error': error})[0]
+    except DataError as exc:
+        # Text the search index refuses (PostgreSQL caps a tsvector at 1 MB)
+        # is recorded as an error, so the file is not retried on every pass
+        error = f"{type(exc).__name__}: {exc}"[:255]
+        return FileText.objects.update_or_create(file=file, defaults={'content': '', 'error': error})[0]
+
+
+def index_pending_files(batch_size):
+    """Index the next batch of files that have no extracted text yet; returns the count"""
+    files = list(
+        UploadedFile.objects.filter(text__isnull=True, extension__in=ALLOWED_EXTENSIONS)
+        .order_by('id')[:batch_size]
+    )
+    for file in files:
+        index_file(file)
+    return len(files)
@@ -1,7 +1,74 @@
 from rest_framework import serializers
-from .models import UploadedFile
+from django.conf import settings
+from .models import FileMetadata, UploadedFile, UploadSession
+from .utils import validate_upload
+import os
+
+class FileMetadataSerializer(serializers.ModelSerializer):
+    preview = serializers.SerializerMethodField()
+
+    class Meta:
+        model = FileMetadata
+        fields = ['title', 'author', 'pages', 'slides', 'sheets', 'preview']
+
+    def get_preview(self, obj):
+        return f"/api/files/{obj.file_id}/preview/" if obj.thumbnail else None
+
 
 class UploadedFileSerializer(serializers.ModelSerializer):
+    uploader = serializers.CharField(source='uploader.username', read_only=True)
+    # Null until the metadata worker has looked at the file
+    metadata = FileMetadataSerializer(read_only=True)
+
     class Meta:
         model = UploadedFile
-        fields = ['id', 'file', 'uploaded_at']
+        fields = ['id', 'file', 'original_name', 'size', 'content_type', 'sha256', 'uploader', 'uploaded_at',
+                  'metadata']
+
+
+class UploadByHashSerializer(serializers.Serializer):
+    sha256 = serializers.RegexField(r'^[0-9a-fA-F]{64}$')
+    filename = serializers.CharField(max_length=255)
+    content_type = serializers.CharField()
+
+    def validate_sha256(self, value):
+        return value.lower()
+
+    def validate(self, data):
+        error = validate_upload(data['filename'], data['content_type'])
+        if error:
+            raise serializers.ValidationError(error)
+        return data
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    chunk_size = serializers.IntegerField(required=False)
+    chunk_count = serializers.IntegerField(read_only=True)
+    received_offset = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'filename', 'content_type', 'total_size', 'chunk_size', 'chunk_count',
+                  'received_chunks', 'received_offset', 'created_at']
+        read_only_fields = ['id', 'received_chunks', 'created_at']
+
+    def validate(self, data):
+        # Reject disallowed documents before any bytes are sent
+        error = validate_upload(data['filename'], data['content_type'])
+        if error:
+            raise serializers.ValidationError(error)
+
+        total_size = data['total_size']
+        if not 0 < total_size <= settings.CHUNKED_UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError("Invalid total_size")
+        # The same per-type cap as single-request uploads
+        if total_size > settings.UPLOAD_MAX_SIZES[os.path.splitext(data['filename'])[1].lower()]:
+            raise serializers.ValidationError("File too large")
+
+        data.setdefault('chunk_size', settings.CHUNKED_UPLOAD_CHUNK_SIZE)
+        min_chunk_size = min(settings.CHUNKED_UPLOAD_MIN_CHUNK_SIZE, total_size)
+        if not min_chunk_size <= data['chunk_size'] <= settings.CHUNKED_UPLOAD_MAX_CHUNK_SIZE:
+            raise serializers.ValidationError("Invalid chunk_size")
+        if -(-total_size // data['chunk_size']) > settings.CHUNKED_UPLOAD_MAX_CHUNKS:
+            raise serializers.ValidationError("Too many chunks, use a larger chunk_size")
+        return data
@@ -0,0 +1,158 @@
+from django.core.files.move import file_move_safe
+from django.core.files.storage import default_storage
+from django.db import models, transaction
+from django.db.models import F
+import hashlib
+import os
+import shutil
+import tempfile
+
+from .models import Blob, UploadedFile, sharded_name
+from .utils import STREAM_CHUNK_SIZE
+
+# Staging area for blobs being written; on the same volume so the final
+# placement is an atomic rename
+BLOB_TMP_DIR = 'blobs/tmp'
+
+
+def blob_name(sha256):
+    """Storage name of the blob holding content with the given SHA-256"""
+    return sharded_name('blobs', sha256)
+
+
+def staging_dir():
+    """Directory for blob content still being written"""
+    tmp_dir = default_storage.path(BLOB_TMP_DIR)
+    os.makedirs(tmp_dir, exist_ok=True)
+    return tmp_dir
+
+
+def _staging_file():
+    return tempfile.mkstemp(dir=staging_dir())
+
+
+def _place_blob(sha256, size, tmp_path):
+    """Move a staged file into the store (unless present) and take one reference"""
+    name = blob_name(sha256)
+    with transaction.atomic():
+        blob, created = Blob.objects.select_for_update().get_or_create(
+            sha256=sha256, defaults={'file': name, 'size': size}
+        )
+        final_path = default_storage.path(blob.file.name)
+        if created or not os.path.exists(final_path):
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            os.replace(tmp_path, final_path)
+        else:
+            os.remove(tmp_path)
+        Blob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+    blob.refresh_from_db(fields=['ref_count'])
+    return blob
+
+
+def store_blob(content):
+    """
+    Hash ``content`` while writing it to the blob store.
+
+    Identical content is kept once; the returned Blob carries one new
+    reference for the caller. Uploads already hashed by the upload handler
+    are moved into place without being read again.
+    """
+    if getattr(content, 'sha256', None) and hasattr(content, 'temporary_file_path'):
+        fd, tmp_path = _staging_file()
+        os.close(fd)
+        file_move_safe(content.temporary_file_path(), tmp_path, allow_overwrite=True)
+        return _place_blob(content.sha256, content.size, tmp_path)
+
+    hasher = hashlib.sha256()
+    size = 0
+    fd, tmp_path = _staging_file()
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in content.chunks():
+                hasher.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return _place_blob(hasher.hexdigest(), size, tmp_path)
+
+
+def store_blob_from_path(path, keep=False):
+    """
+    Hash a file already on the media volume and move it into the blob store.
+
+    With ``keep`` the file stays where it is as well: the store gets a hard
+    link to it (a copy where links are not supported).
+    """
+    hasher = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(STREAM_CHUNK_SIZE), b''):
+            hasher.update(chunk)
+            size += len(chunk)
+    if keep:
+        fd, tmp_path = _staging_file()
+        os.close(fd)
+        os.remove(tmp_path)
+        try:
+            os.link(path, tmp_path)
+        except OSError:
+            shutil.copyfile(path, tmp_path)
+        path = tmp_path
+    return _place_blob(hasher.hexdigest(), size, path)
+
+
+def reference_blob(sha256):
+    """Take a new reference on existing content, or return None if it is unknown"""
+    with transaction.atomic():
+        blob = Blob.objects.select_for_update().filter(sha256=sha256).first()
+        if blob is None or not default_storage.exists(blob.file.name):
+            return None
+        Blob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+    return blob
+
+
+def release_blob(blob_id):
+    """
+    Drop one reference; the content is deleted once the last one is gone.
+
+    Only the count changes inside the caller's transaction. The file is
+    removed after that transaction commits, so a rollback never leaves rows
+    pointing at deleted content.
+    """
+    Blob.objects.filter(pk=blob_id, ref_count__gt=0).update(ref_count=F('ref_count') - 1)
+    transaction.on_commit(lambda: _delete_unreferenced_blob(blob_id))
+
+
+def _delete_unreferenced_blob(blob_id):
+    with transaction.atomic():
+        # A new reference may have been taken since it was released
+        blob = Blob.objects.select_for_update().filter(pk=blob_id, ref_count=0).first()
+        if blob is None:
+            return
+        # Under the row lock, so an upload of the same content waits and
+        # then writes it again
+        default_storage.delete(blob.file.name)
+        blob.delete()
+
+
+def create_uploaded_file(uploader, blob, name, content_type):
+    """
+    Create the UploadedFile row for content already in the blob store.
+
+    Size, type and checksum are recorded on the row so listings never have
+    to stat or read the stored file.
+    """
+    # JWT requests carry a TokenUser rather than a model instance
+    owner = {'uploader': uploader} if isinstance(uploader, models.Model) else {'uploader_id': uploader.pk}
+    return UploadedFile.objects.create(
+        **owner,
+        file=blob.file.name,
+        blob=blob,
+        original_name=name,
+        extension=os.path.splitext(name)[1].lower(),
+        size=blob.size,
+        content_type=content_type,
+        sha256=blob.sha256,
+    )
@@ -1,3 +1,660 @@
-from django.test import TestCase
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DataError, transaction
+from django.test import AsyncRequestFactory, TestCase, override_settings
+from django.utils.http import http_date, parse_http_date
+from rest_framework.test import APIClient
+import base64
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from unittest import mock
 
-# Create your tests here.
+from users.models import CustomUser
+from securefiles.testing import QueryBudgetMixin
+from users.serializers import RoleTokenObtainPairSerializer
+from . import async_views, previews, search
+from .links import make_download_token, revoke_download_links
+from .listing import current_listing_version
+from .models import Blob, FileMetadata, FileText, ListingVersion, UploadedFile
+from .previews import extract_metadata, extract_pending_metadata, preview_cache_key
+from .search import index_pending_files
+from .storage import create_uploaded_file, store_blob
+
+DOCX = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+PPTX = 'application/vnd.openxmlformats-officedocument.presentationml.presentation'
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def tearDownModule():
+    shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+
+def ooxml(main_part='word/document.xml', padding=0):
+    """A minimal OOXML package whose main part identifies the document type"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('[Content_Types].xml', '<Types/>')
+        archive.writestr(main_part, '<x/>' + 'a' * padding)
+    return buffer.getvalue()
+
+
+def docx(*paragraphs, title='', author='', pages=None, thumbnail=None):
+    """A Word document with the given paragraphs, properties and thumbnail bytes (PNG)"""
+    w = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+    body = ''.join(f'<w:p><w:r><w:t>{text}</w:t></w:r></w:p>' for text in paragraphs)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('[Content_Types].xml', '<Types/>')
+        archive.writestr('word/document.xml', f'<w:document xmlns:w="{w}"><w:body>{body}</w:body></w:document>')
+        archive.writestr('docProps/core.xml', (
+            '<cp:coreProperties xmlns:cp="http://schemas.openxmlformats.org/package/2006/metadata/core-properties" '
+            f'xmlns:dc="http://purl.org/dc/elements/1.1/"><dc:title>{title}</dc:title>'
+            f'<dc:creator>{author}</dc:creator></cp:coreProperties>'
+        ))
+        if pages is not None:
+            archive.writestr('docProps/app.xml', f'<Properties><Pages>{pages}</Pages></Properties>')
+        if thumbnail is not None:
+            archive.writestr('docProps/thumbnail.png', thumbnail)
+    return buffer.getvalue()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class FilesTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.ops = CustomUser.objects.create_user('ops', 'ops@example.com', 'pw', is_ops=True)
+        self.client_user = CustomUser.objects.create_user('client', 'client@example.com', 'pw', is_client=True)
+
+    def make_file(self, content=None, name='report.docx'):
+        blob = store_blob(ContentFile(content or ooxml()))
+        return create_uploaded_file(self.ops, blob, name, DOCX)
+
+    def api(self, user=None, jwt=False):
+        """
+        APIClient authenticated as ``user`` by session, or by a Bearer JWT.
+
+        ``jwt='str'`` carries the user id claim as a string, as newer
+        simplejwt releases issue it.
+        """
+        client = APIClient()
+        if user is not None and jwt:
+            access = RoleTokenObtainPairSerializer.get_token(user).access_token
+            if jwt == 'str':
+                access['user_id'] = str(user.pk)
+            client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+        elif user is not None:
+            client.force_login(user)
+        return client
+
+
+
+class BlobStoreTests(FilesTestCase):
+    def test_identical_content_is_stored_once(self):
+        first, second = self.make_file(), self.make_file(name='copy.docx')
+        self.assertEqual(first.blob_id, second.blob_id)
+        self.assertEqual(Blob.objects.get().ref_count, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(Blob.objects.get().ref_count, 1)
+        self.assertTrue(default_storage.exists(second.file.name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(Blob.objects.exists())
+        self.assertFalse(default_storage.exists(second.file.name))
+
+    def test_rolled_back_delete_keeps_content(self):
+        file = self.make_file()
+        file_id = file.pk
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    file.delete()
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        file = UploadedFile.objects.get(pk=file_id)
+        self.assertEqual(file.blob.ref_count, 1)
+        self.assertTrue(default_storage.exists(file.file.name))
+
+    def test_content_referenced_again_before_commit_is_kept(self):
+        file = self.make_file()
+        with self.captureOnCommitCallbacks(execute=True):
+            file.delete()
+            again = self.make_file()
+        self.assertEqual(again.blob.ref_count, 1)
+        self.assertTrue(default_storage.exists(again.file.name))
+
+    def test_upload_by_hash(self):
+        file = self.make_file()
+        client = self.api(self.ops)
+        response = client.post('/api/upload/by-hash/', {
+            'sha256': file.sha256.upper(), 'filename': 'again.docx', 'content_type': DOCX,
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['sha256'], file.sha256)
+        self.assertEqual(Blob.objects.get().ref_count, 2)
+
+        response = client.post('/api/upload/by-hash/', {
+            'sha256': 'f' * 64, 'filename': 'again.docx', 'content_type': DOCX,
+        }, format='json')
+        self.assertEqual(response.status_code, 404)
+        for body in ([file.sha256], {'sha256': 'abc', 'filename': 'a.docx', 'content_type': DOCX},
+                     {'sha256': file.sha256, 'filename': 'a.exe', 'content_type': DOCX}):
+            with self.subTest(body=body):
+                self.assertEqual(client.post('/api/upload/by-hash/', body, format='json').status_code, 400)
+        self.assertEqual(Blob.objects.get().ref_count, 2)
+
+
+@override_settings(UPLOAD_MAX_SIZES={'.docx': 10_000, '.pptx': 5000, '.xlsx': 10_000})
+class UploadValidationTests(FilesTestCase):
+    def upload(self, name, content, content_type=PPTX):
+        return self.api(self.ops).post(
+            '/api/upload/', {'file': SimpleUploadedFile(name, content, content_type=content_type)}, format='multipart'
+        )
+
+    def test_valid_document_is_stored_with_its_checksum(self):
+        content = ooxml('ppt/presentation.xml')
+        response = self.upload('deck.pptx', content)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['sha256'], hashlib.sha256(content).hexdigest())
+        self.assertEqual(response.data['size'], len(content))
+        # Nothing is left behind in the staging area
+        self.assertEqual(os.listdir(os.path.join(MEDIA_ROOT, 'blobs', 'tmp')), [])
+
+    def test_rejected_uploads(self):
+        cases = [
+            ('deck.pptx', b'plain text, not a zip', "File is not a valid Office document"),
+            ('deck.pptx', ooxml('word/document.xml'), "File is not a valid Office document"),
+            ('deck.pptx', ooxml('ppt/presentation.xml', padding=6000), "File too large"),
+            ('tool.exe', b'MZ', "Only .pptx, .docx, .xlsx files allowed"),
+        ]
+        for name, content, error in cases:
+            with self.subTest(error=error, name=name):
+                response = self.upload(name, content)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.data['error'], error)
+        self.assertFalse(UploadedFile.objects.exists())
+
+class SignedLinkTests(FilesTestCase):
+    def link_path(self, client, file, bind=False):
+        response = client.get(f'/api/download-file/{file.id}/', {'bind': '1' if bind else ''})
+        self.assertEqual(response.status_code, 200)
+        return response.data['download-link'].split('testserver', 1)[1]
+
+    def test_link_downloads_without_authentication(self):
+        file = self.make_file()
+        response = self.api().get(f'/api/download/{make_download_token(file)}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), file.blob.file.open('rb').read())
+        self.assertIn('report.docx', response['Content-Disposition'])
+
+    def test_expired_tampered_and_revoked_links(self):
+        file = self.make_file()
+        token = make_download_token(file)
+        with mock.patch('files.links.time.time', return_value=time.time() + settings.SIGNED_LINK_MAX_AGE + 1):
+            self.assertEqual(self.api().get(f'/api/download/{token}/').status_code, 404)
+        self.assertEqual(self.api().get(f'/api/download/{token[:-2]}xx/').status_code, 404)
+
+        response = self.api(self.ops).post(f'/api/files/{file.id}/revoke-links/')
+        self.assertEqual(response.data['link_version'], 1)
+        response = self.api().get(f'/api/download/{token}/')
+        self.assertEqual((response.status_code, response.data['error']), (404, 'This link has been revoked'))
+        file.refresh_from_db()
+        self.assertEqual(self.api().get(f'/api/download/{make_download_token(file)}/').status_code, 200)
+
+    def test_link_follows_moved_content_and_reports_gone_files(self):
+        file = self.make_file()
+        token = make_download_token(file)
+        # Content moved to another storage name after the link was issued
+        moved = default_storage.save('moved/report.docx', ContentFile(b'moved content'))
+        UploadedFile.objects.filter(pk=file.pk).update(file=moved, size=13, sha256='')
+        response = self.api().get(f'/api/download/{token}/')
+        self.assertEqual(b''.join(response.streaming_content), b'moved content')
+
+        default_storage.delete(moved)
+        self.assertEqual(self.api().get(f'/api/download/{token}/').status_code, 410)
+        with self.captureOnCommitCallbacks(execute=True):
+            file.delete()
+        self.assertEqual(self.api().get(f'/api/download/{token}/').status_code, 410)
+
+    def test_legacy_links_are_retired(self):
+        file = self.make_file()
+        response = self.api(self.client_user).get(f'/api/secure-download/{file.secure_token}/')
+        self.assertEqual(response.status_code, 410)
+        self.assertIn('request a new download link', response.data['error'])
+
+    def test_async_view(self):
+        file = self.make_file()
+        token = make_download_token(file, user=self.client_user)
+        request = AsyncRequestFactory().get(f'/api/download/{token}/')
+        request.auser = mock.AsyncMock(return_value=self.client_user)
+        response = async_to_sync(async_views.signed_download)(request, token)
+        self.assertEqual(response.status_code, 200)
+        request.auser = mock.AsyncMock(return_value=self.ops)
+        self.assertEqual(async_to_sync(async_views.signed_download)(request, token).status_code, 403)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            file.delete()
+        self.assertEqual(async_to_sync(async_views.signed_download)(request, token).status_code, 410)
+
+    def test_bound_link_across_auth_methods(self):
+        file = self.make_file()
+        for minted_with, used_with in [(True, False), (False, True), ('str', False), (False, 'str'), (True, 'str')]:
+            with self.subTest(minted_with=minted_with, used_with=used_with):
+                path = self.link_path(self.api(self.client_user, jwt=minted_with), file, bind=True)
+                response = self.api(self.client_user, jwt=used_with).get(path)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(b''.join(response.streaming_content), file.blob.file.open('rb').read())
+
+    def test_bound_link_refused_for_other_user(self):
+        other = CustomUser.objects.create_user('other', 'other@example.com', 'pw', is_client=True)
+        path = self.link_path(self.api(self.client_user, jwt=True), self.make_file(), bind=True)
+        self.assertEqual(self.api(other, jwt='str').get(path).status_code, 403)
+        self.assertEqual(self.api(other).get(path).status_code, 403)
+        self.assertEqual(self.api().get(path).status_code, 403)
+
+    def test_zip_of_links(self):
+        first, second = self.make_file(ooxml(padding=1)), self.make_file(ooxml(padding=2), name='other.docx')
+        tokens = [make_download_token(first), make_download_token(second)]
+        with self.assertNumQueries(1):
+            response = self.api().post('/api/download/zip/', {'tokens': tokens}, format='json')
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(archive.namelist(), ['report.docx', 'other.docx'])
+        self.assertEqual(archive.read('other.docx'), ooxml(padding=2))
+
+        revoke_download_links(second)
+        self.assertEqual(self.api().post('/api/download/zip/', {'tokens': tokens}, format='json').status_code, 404)
+        # Files by id need a signed-in client
+        self.assertEqual(self.api().post('/api/download/zip/', {'ids': [first.id]}, format='json').status_code, 401)
+        self.assertEqual(self.api(self.ops).post('/api/download/zip/', {'ids': [first.id]}, format='json').status_code, 403)
+        response = self.api(self.client_user).post('/api/download/zip/', {'ids': [first.id]}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(SECURE_DOWNLOAD_BACKEND='nginx')
+    def test_nginx_serves_the_bytes(self):
+        file = self.make_file(name='Résumé 2024.docx')
+        response = self.api().get(f'/api/download/{make_download_token(file)}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{file.file.name}')
+        self.assertEqual(response['Content-Type'], DOCX)
+        self.assertEqual(response['Content-Disposition'], "attachment; filename*=utf-8''R%C3%A9sum%C3%A9%202024.docx")
+
+
+    def test_zip_rejects_bodies_that_are_not_objects(self):
+        for body in ([1, 2], 'files', 3):
+            with self.subTest(body=body):
+                response = self.api(self.client_user).post('/api/download/zip/', body, format='json')
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.data['error'], 'Provide a list of file ids or download tokens')
+
+
+class RangeRequestTests(FilesTestCase):
+    def setUp(self):
+        super().setUp()
+        self.data = ooxml(padding=3)
+        self.url = f'/api/download/{make_download_token(self.make_file(self.data))}/'
+        full = self.api().get(self.url)
+        self.etag, self.last_modified = full['ETag'], full['Last-Modified']
+
+    def get(self, **headers):
+        return self.api().get(self.url, **{f'HTTP_{name.upper()}': value for name, value in headers.items()})
+
+    def body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_single_and_multiple_ranges(self):
+        response = self.get(range='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.data)}')
+        self.assertEqual(self.body(response), self.data[10:20])
+        self.assertEqual(self.body(self.get(range='bytes=-5')), self.data[-5:])
+
+        response = self.get(range='bytes=0-1,5-6')
+        self.assertEqual(response.status_code, 206)
+        self.assertTrue(response['Content-Type'].startswith('multipart/byteranges'))
+        body = self.body(response)
+        self.assertEqual(len(body), int(response['Content-Length']))
+        self.assertIn(self.data[5:7], body)
+
+        response = self.get(range=f'bytes={len(self.data)}-')
+        self.assertEqual((response.status_code, response['Content-Range']), (416, f'bytes */{len(self.data)}'))
+
+    def test_if_range(self):
+        self.assertEqual(self.get(range='bytes=0-9', if_range=self.etag).status_code, 206)
+        self.assertEqual(self.get(range='bytes=0-9', if_range=self.last_modified).status_code, 206)
+        later = http_date(parse_http_date(self.last_modified) + 60)
+        # Anything but an exact strong match sends the whole file
+        for if_range in ('"other"', f'W/{self.etag}', later, 'garbage'):
+            with self.subTest(if_range=if_range):
+                response = self.get(range='bytes=0-9', if_range=if_range)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(b''.join(response.streaming_content), self.data)
+
+    def test_not_modified(self):
+        response = self.get(if_none_match=self.etag)
+        self.assertEqual((response.status_code, response['ETag']), (304, self.etag))
+
+
+class SearchTests(FilesTestCase):
+    def setUp(self):
+        super().setUp()
+        self.budget = self.make_file(docx('Quarterly budget review', 'Budget figures for the board'), name='budget.docx')
+        self.notes = self.make_file(docx('Meeting notes', 'The budget was mentioned once'), name='notes.docx')
+        self.assertEqual(index_pending_files(10), 2)
+        self.client = self.api(self.client_user)
+
+    def search(self, q, **params):
+        return self.client.get('/api/search/', {'q': q, **params})
+
+    def test_ranked_results_with_snippets(self):
+        results = self.search('budget').data['results']
+        self.assertEqual([row['original_name'] for row in results], ['budget.docx', 'notes.docx'])
+        self.assertIn('[Budget]', results[0]['snippet'])
+        self.assertIsNotNone(results[0]['rank'])
+        # The last word matches as a prefix
+        self.assertEqual([row['original_name'] for row in self.search('meet').data['results']], ['notes.docx'])
+        self.assertEqual(len(self.search('budget', limit=1).data['results']), 1)
+
+    def test_malformed_queries(self):
+        for q in ('"', 'budget AND (', 'NEAR(', '*', '-budget'):
+            with self.subTest(q=q):
+                self.assertEqual(self.search(q).status_code, 200)
+        self.assertEqual(self.search('').status_code, 400)
+        self.assertEqual(self.search('budget', limit='many').status_code, 400)
+        self.assertEqual(self.api(self.ops).get('/api/search/', {'q': 'budget'}).status_code, 403)
+
+    def test_index_follows_updates_and_deletes(self):
+        self.notes.text.content = 'Holiday rota'
+        self.notes.text.save()
+        self.assertEqual([row['original_name'] for row in self.search('budget').data['results']], ['budget.docx'])
+        self.assertEqual(len(self.search('rota').data['results']), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.budget.delete()
+        self.assertEqual(self.search('budget').data['results'], [])
+
+    def test_indexer(self):
+        self.assertEqual(index_pending_files(10), 0)
+        broken = self.make_file(b'not a zip file', name='broken.docx')
+        with mock.patch('files.search.extract_text', wraps=search.extract_text) as extract:
+            copy = self.make_file(self.budget.blob.file.open('rb').read(), name='copy.docx')
+            out = io.StringIO()
+            call_command('index_file_text', stdout=out)
+        self.assertIn('2 files indexed', out.getvalue())
+        # Only the broken file is parsed; shared content reuses the text already extracted for it
+        self.assertEqual(extract.call_count, 1)
+        self.assertEqual(copy.text.content, self.budget.text.content)
+        broken.refresh_from_db()
+        self.assertEqual(broken.text.content, '')
+        self.assertIn('BadZipFile', broken.text.error)
+
+    @override_settings(SEARCH_MAX_TEXT_CHARS=10)
+    def test_text_is_capped_and_refused_text_recorded(self):
+        file = self.make_file(docx('A rather long paragraph of text'), name='long.docx')
+        self.assertEqual(search.index_file(file).content, 'A rather l')
+
+        real = FileText.objects.update_or_create
+
+        def refuse_text(**kwargs):
+            if kwargs['defaults']['content']:
+                raise DataError('string is too long for tsvector')
+            return real(**kwargs)
+
+        other = self.make_file(docx('Another document'), name='other.docx')
+        with mock.patch.object(FileText.objects, 'update_or_create', side_effect=refuse_text):
+            text = search.index_file(other)
+        self.assertEqual(text.content, '')
+        self.assertIn('tsvector', text.error)
+        self.assertEqual(index_pending_files(10), 0)
+
+
+class MetadataTests(FilesTestCase):
+    thumbnail = b'\x89PNG\r\n\x1a\n' + b'\0' * 100
+
+    def setUp(self):
+        super().setUp()
+        self.file = self.make_file(docx('Text', title='Annual report', author='Ada', pages=7, thumbnail=self.thumbnail))
+
+    def test_properties_and_thumbnail(self):
+        metadata = extract_metadata(self.file)
+        self.assertEqual((metadata.title, metadata.author, metadata.pages, metadata.error), ('Annual report', 'Ada', 7, ''))
+        self.assertEqual(metadata.thumbnail_type, 'image/png')
+        self.assertEqual(metadata.thumbnail.open('rb').read(), self.thumbnail)
+        row = self.api(self.client_user).get('/api/list/').data['results'][0]
+        self.assertEqual(row['metadata']['preview'], f'/api/files/{self.file.id}/preview/')
+
+    def test_pending_files_and_shared_content(self):
+        copy = self.make_file(self.file.blob.file.open('rb').read(), name='copy.docx')
+        broken = self.make_file(b'not a zip file', name='broken.docx')
+        with mock.patch('files.previews.read_properties', wraps=previews.read_properties) as read:
+            out = io.StringIO()
+            call_command('extract_file_metadata', stdout=out)
+        self.assertIn('3 files processed', out.getvalue())
+        # The copy reuses what was read for the original
+        self.assertEqual(read.call_count, 2)
+        self.assertEqual(FileMetadata.objects.get(file=copy).thumbnail, FileMetadata.objects.get(file=self.file).thumbnail)
+        self.assertIn('BadZipFile', FileMetadata.objects.get(file=broken).error)
+        self.assertEqual(extract_pending_metadata(10), 0)
+
+    def test_preview_view(self):
+        client = self.api(self.client_user, jwt=True)
+        url = f'/api/files/{self.file.id}/preview/'
+        self.assertEqual(client.get(url).status_code, 404)
+        extract_metadata(self.file)
+
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(b''.join(response.streaming_content), self.thumbnail)
+        # Only the validators are cached, never the image
+        self.assertNotIn(self.thumbnail, cache.get(preview_cache_key(self.file.id)))
+        with self.assertNumQueries(0):
+            response = client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        self.assertEqual(self.api(self.ops).get(url).status_code, 403)
+        self.assertEqual(client.get('/api/files/999999/preview/').status_code, 404)
+
+    def test_unused_thumbnail_is_deleted(self):
+        name = extract_metadata(self.file).thumbnail.name
+        with self.captureOnCommitCallbacks(execute=True):
+            self.file.delete()
+        self.assertFalse(default_storage.exists(name))
+
+
+class BackfillMetadataTests(FilesTestCase):
+    def test_backfill(self):
+        name = default_storage.save('uploads/old.docx', ContentFile(b'old content'))
+        legacy = UploadedFile.objects.create(uploader=self.ops, file=name)
+        missing = UploadedFile.objects.create(uploader=self.ops, file='uploads/gone.docx')
+        blob_file = self.make_file()
+        UploadedFile.objects.filter(pk=blob_file.pk).update(size=None, sha256='', content_type='')
+        version = current_listing_version()[0]
+
+        out = io.StringIO()
+        call_command('backfill_file_metadata', batch_size=2, stdout=out)
+        self.assertIn('backfilled 3 files (1 missing from storage)', out.getvalue())
+
+        legacy.refresh_from_db()
+        self.assertEqual((legacy.original_name, legacy.extension, legacy.content_type), ('old.docx', '.docx', DOCX))
+        self.assertEqual((legacy.size, legacy.sha256), (11, hashlib.sha256(b'old content').hexdigest()))
+        blob_file.refresh_from_db()
+        self.assertEqual((blob_file.size, blob_file.sha256), (blob_file.blob.size, blob_file.blob.sha256))
+        missing.refresh_from_db()
+        self.assertIsNone(missing.size)
+        self.assertGreater(current_listing_version()[0], version)
+
+
+class ShardLegacyUploadsTests(FilesTestCase):
+    def test_flat_uploads_move_into_the_blob_store(self):
+        legacy = []
+        for n in range(3):
+            name = default_storage.save(f'uploads/legacy-{n}.docx', ContentFile(b'same' if n < 2 else b'other'))
+            legacy.append(UploadedFile.objects.create(uploader=self.ops, file=name))
+        missing = UploadedFile.objects.create(uploader=self.ops, file='uploads/gone.docx')
+        token = make_download_token(legacy[0])
+
+        call_command('shard_legacy_uploads', batch_size=2, sleep=0, stdout=io.StringIO())
+
+        for file in legacy:
+            file.refresh_from_db()
+            self.assertRegex(file.file.name, r'^blobs/../../[0-9a-f]{64}$')
+            self.assertTrue(file.original_name.startswith('legacy-'))
+        self.assertEqual(legacy[0].blob_id, legacy[1].blob_id)
+        self.assertEqual(legacy[0].blob.ref_count, 2)
+        self.assertFalse(default_storage.exists('uploads/legacy-0.docx'))
+        missing.refresh_from_db()
+        self.assertIsNone(missing.blob_id)
+        # Links issued before the move still work
+        response = self.api().get(f'/api/download/{token}/')
+        self.assertEqual(b''.join(response.streaming_content), b'same')
+
+
+class QueryBudgetTests(QueryBudgetMixin, FilesTestCase):
+    """The listing costs the same number of queries however many files there are"""
+
+    def setUp(self):
+        super().setUp()
+        # Runs the listing version bumps, as a committed upload would
+        with self.captureOnCommitCallbacks(execute=True):
+            for n in range(30):
+                FileMetadata.objects.create(file=self.make_file(ooxml(padding=n), name=f'report-{n}.docx'), title=f'Report {n}')
+
+    def test_file_list_query_budget(self):
+        client = self.api(self.client_user, jwt=True)
+        # Listing version and one joined page query; JWTs need no lookup
+        with self.assertMaxQueries(2):
+            response = client.get('/api/list/')
+        self.assertEqual(len(response.data['results']), 30)
+        self.assertEqual(response.data['results'][0]['metadata']['title'], 'Report 29')
+        # Served from the listing cache
+        with self.assertMaxQueries(1):
+            client.get('/api/list/')
+
+
+class ListingTests(FilesTestCase):
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.files = [self.make_file(ooxml(padding=n), name=f'report-{n}.docx') for n in range(5)]
+        self.client = self.api(self.client_user, jwt=True)
+
+    def test_keyset_pages(self):
+        names, url = [], '/api/list/?limit=2'
+        while url:
+            response = self.client.get(url)
+            names += [row['original_name'] for row in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(names, [f'report-{n}.docx' for n in reversed(range(5))])
+
+    def test_unchanged_listing_is_not_modified(self):
+        response = self.client.get('/api/list/')
+        etag = response['ETag']
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/list/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_edits_change_the_etag(self):
+        etag = self.client.get('/api/list/')['ETag']
+        file = self.files[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            file.original_name = 'renamed.docx'
+            file.save(update_fields=['original_name'])
+        response = self.client.get('/api/list/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][-1]['original_name'], 'renamed.docx')
+
+        # Columns the listing does not show leave it alone
+        etag = response['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            file.save(update_fields=['link_version'])
+        self.assertEqual(self.client.get('/api/list/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_if_modified_since_alone_is_not_enough(self):
+        last_modified = self.client.get('/api/list/')['Last-Modified']
+        # A change within the same second keeps Last-Modified
+        same_second = ListingVersion.objects.get().updated_at
+        # The patch outlives the commit callbacks, where the bump happens
+        with mock.patch('files.listing.timezone.now', return_value=same_second), self.captureOnCommitCallbacks(execute=True):
+            self.make_file(ooxml(padding=9), name='late.docx')
+        response = self.client.get('/api/list/', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Last-Modified'], last_modified)
+        self.assertEqual(response.data['results'][0]['original_name'], 'late.docx')
+
+    def test_malformed_cursor_is_a_bad_request(self):
+        for cursor in ('not-base64!', 'bm9waXBl', base64.urlsafe_b64encode(b'2024-13-01T00:00:00|1').decode()):
+            with self.subTest(cursor=cursor):
+                response = self.client.get('/api/list/', {'cursor': cursor})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('cursor', response.data)
+
+
+@override_settings(CHUNKED_UPLOAD_DIR=f'{MEDIA_ROOT}/partial', CHUNKED_UPLOAD_MIN_CHUNK_SIZE=1024)
+class ChunkedUploadTests(FilesTestCase):
+    def start(self, client, total_size, chunk_size=1024, filename='big.docx'):
+        return client.post('/api/upload/sessions/', {
+            'filename': filename, 'content_type': DOCX, 'total_size': total_size, 'chunk_size': chunk_size,
+        }, format='json')
+
+    def send(self, client, session_id, index, data):
+        return client.put(f'/api/upload/sessions/{session_id}/chunks/{index}/', data,
+                          content_type='application/octet-stream')
+
+    def test_chunks_in_any_order_assemble_the_file(self):
+        client = self.api(self.ops)
+        content = ooxml(padding=3000)
+        session = self.start(client, len(content)).data
+        self.assertEqual(session['chunk_count'], -(-len(content) // 1024))
+
+        chunks = [content[n:n + 1024] for n in range(0, len(content), 1024)]
+        for index in reversed(range(1, len(chunks))):
+            self.assertEqual(self.send(client, session['id'], index, chunks[index]).status_code, 200)
+        self.assertEqual(client.post(f"/api/upload/sessions/{session['id']}/complete/").status_code, 409)
+        # A chunk of the wrong length is refused and has to be sent again
+        self.assertEqual(self.send(client, session['id'], 0, chunks[0][:10]).status_code, 400)
+        self.assertEqual(client.get(f"/api/upload/sessions/{session['id']}/").data['received_offset'], 0)
+        self.send(client, session['id'], 0, chunks[0])
+
+        response = client.post(f"/api/upload/sessions/{session['id']}/complete/")
+        self.assertEqual(response.status_code, 200)
+        file = UploadedFile.objects.get(pk=response.data['id'])
+        self.assertEqual(file.blob.file.open('rb').read(), content)
+        self.assertEqual(file.original_name, 'big.docx')
+
+    def test_session_limits(self):
+        client = self.api(self.ops)
+        # Tiny chunks would make the chunk list huge
+        self.assertEqual(self.start(client, 10_000, chunk_size=1).status_code, 400)
+        # A single chunk may be smaller than the minimum
+        self.assertEqual(self.start(client, 100, chunk_size=100).status_code, 201)
+        with self.settings(CHUNKED_UPLOAD_MAX_CHUNKS=5):
+            self.assertEqual(self.start(client, 10_000).status_code, 400)
+        with self.settings(UPLOAD_MAX_SIZES={'.docx': 5000, '.pptx': 5000, '.xlsx': 5000}):
+            self.assertEqual(self.start(client, 5001).data['non_field_errors'], ['File too large'])
+
+    def test_content_is_checked_on_complete(self):
+        client = self.api(self.ops)
+        for content in (b'not a zip at all', ooxml('ppt/presentation.xml')):
+            with self.subTest(content=content[:10]):
+                session = self.start(client, len(content), chunk_size=len(content)).data
+                self.send(client, session['id'], 0, content)
+                response = client.post(f"/api/upload/sessions/{session['id']}/complete/")
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.data['error'], 'File is not a valid Office document')
+        self.assertFalse(UploadedFile.objects.exists())
@@ -0,0 +1,113 @@
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile, UploadedFile
+from django.core.files.uploadhandler import StopUpload, TemporaryFileUploadHandler
+import hashlib
+import os
+import tempfile
+import zipfile
+
+from .storage import staging_dir
+from .utils import ALLOWED_EXTENSIONS
+
+# Every OOXML package is a zip archive starting with a local file header
+ZIP_SIGNATURE = b'PK\x03\x04'
+
+# Part names that must appear in the package: the content types manifest
+# and the main document part for the claimed kind of file
+CONTENT_TYPES_PART = b'[Content_Types].xml'
+MAIN_PARTS = {
+    '.docx': b'word/',
+    '.pptx': b'ppt/',
+    '.xlsx': b'xl/',
+}
+
+
+class StagedUploadedFile(TemporaryUploadedFile):
+    """Temporary upload written inside the blob store's staging area"""
+
+    def __init__(self, name, content_type, size, charset, content_type_extra=None):
+        # Same volume as the blobs, so storing the upload is a rename
+        file = tempfile.NamedTemporaryFile(suffix='.upload', dir=staging_dir())
+        UploadedFile.__init__(self, file, name, content_type, size, charset, content_type_extra)
+
+
+class OOXMLUploadHandler(TemporaryFileUploadHandler):
+    """
+    Validate office documents while the request body is written to disk.
+
+    Each chunk is hashed, counted against the size cap for its extension and
+    scanned for the zip signature and required part names, so a bad upload
+    stops the request there and the finished file never has to be read again.
+    The SHA-256 is left on the uploaded file as ``sha256`` for the blob store.
+    """
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        self.hasher = hashlib.sha256()
+        self.received = 0
+        self.head = b''
+        self.tail = b''
+
+        extension = os.path.splitext(file_name)[1].lower()
+        if extension not in ALLOWED_EXTENSIONS:
+            self.reject("Only .pptx, .docx, .xlsx files allowed")
+        self.max_size = settings.UPLOAD_MAX_SIZES[extension]
+        self.missing = {CONTENT_TYPES_PART, MAIN_PARTS[extension]}
+
+        # Refuse up front when the multipart part declares its own length
+        if content_length and content_length > self.max_size:
+            self.reject("File too large")
+
+        super(TemporaryFileUploadHandler, self).new_file(
+            field_name, file_name, content_type, content_length, charset, content_type_extra
+        )
+        self.file = StagedUploadedFile(self.file_name, self.content_type, 0, self.charset, self.content_type_extra)
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > self.max_size:
+            self.reject("File too large")
+
+        if len(self.head) < len(ZIP_SIGNATURE):
+            self.head += raw_data[:len(ZIP_SIGNATURE) - len(self.head)]
+            if not ZIP_SIGNATURE.startswith(self.head):
+                self.reject("File is not a valid Office document")
+
+        if self.missing:
+            # Keep the end of the previous chunk so names split across
+            # chunk boundaries are still found
+            window = self.tail + raw_data
+            self.missing = {name for name in self.missing if name not in window}
+            self.tail = window[-len(CONTENT_TYPES_PART):]
+
+        self.hasher.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        if len(self.head) < len(ZIP_SIGNATURE) or self.missing:
+            self.reject("File is not a valid Office document")
+        uploaded = super().file_complete(file_size)
+        uploaded.sha256 = self.hasher.hexdigest()
+        return uploaded
+
+    def reject(self, message):
+        """Record why the upload failed and stop reading the request body"""
+        self.request.upload_error = message
+        self.upload_interrupted()
+        raise StopUpload(connection_reset=True)
+
+
+def check_ooxml_file(path, extension):
+    """
+    Error message unless the file at ``path`` is an OOXML package of the
+    kind ``extension`` claims, for files that did not arrive through
+    OOXMLUploadHandler. Only the zip directory is read.
+    """
+    try:
+        with zipfile.ZipFile(path) as archive:
+            names = archive.namelist()
+    except (zipfile.BadZipFile, OSError):
+        return "File is not a valid Office document"
+    main_part = MAIN_PARTS[extension].decode()
+    if CONTENT_TYPES_PART.decode() not in names or not any(name.startswith(main_part) for name in names):
+        return "File is not a valid Office document"
+    return None
@@ -1,9 +1,34 @@
+from django.conf import settings
 from django.urls import path
-from .views import FileUploadView, FileListView, FileDownloadLinkView, SecureDownloadView
+from . import async_views
+from .views import (
+    FileUploadView, FileListView, FileDownloadLinkView, SecureDownloadView,
+    UploadSessionCreateView, UploadSessionView, UploadChunkView, UploadSessionCompleteView,
+    BlobExistsView, UploadByHashView, SignedDownloadView, RevokeDownloadLinksView, ZipDownloadView,
+    FileSearchView, FilePreviewView,
+)
+
+if settings.ASYNC_VIEWS:
+    signed_download = async_views.signed_download
+    upload_chunk = async_views.upload_chunk
+else:
+    signed_download = SignedDownloadView.as_view()
+    upload_chunk = UploadChunkView.as_view()
 
 urlpatterns = [
     path('upload/', FileUploadView.as_view()),
+    path('upload/sessions/', UploadSessionCreateView.as_view()),
+    path('upload/sessions/<uuid:session_id>/', UploadSessionView.as_view()),
+    path('upload/sessions/<uuid:session_id>/chunks/<int:index>/', upload_chunk),
+    path('upload/sessions/<uuid:session_id>/complete/', UploadSessionCompleteView.as_view()),
+    path('upload/by-hash/', UploadByHashView.as_view()),
+    path('blobs/<str:sha256>/', BlobExistsView.as_view()),
     path('list/', FileListView.as_view()),
+    path('search/', FileSearchView.as_view()),
     path('download-file/<int:file_id>/', FileDownloadLinkView.as_view()),
     path('secure-download/<str:token>/', SecureDownloadView.as_view()),
+    path('download/zip/', ZipDownloadView.as_view()),
+    path('download/<str:token>/', signed_download),
+    path('files/<int:file_id>/revoke-links/', RevokeDownloadLinksView.as_view()),
+    path('files/<int:file_id>/preview/', FilePreviewView.as_view()),
 ]
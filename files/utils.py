@@ -0,0 +1,396 @@
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+from datetime import datetime, time
+from securefiles.metrics import DOWNLOAD_BYTES, acount_download_bytes, count_download_bytes, view_label
+import asyncio
+import hashlib
+import mimetypes
+import os
+import uuid
+import zipfile
+from urllib.parse import quote
+
+ALLOWED_EXTENSIONS = ('.pptx', '.docx', '.xlsx')
+
+VALID_MIME_TYPES = [
+    'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+]
+
+# Size of the blocks read from storage when streaming a byte range
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Requests asking for more ranges than this are answered with the whole file
+MAX_RANGES = 16
+
+
+def validate_upload(name, content_type):
+    """Return an error message if the file is not an allowed document, else None"""
+    # Extension Check
+    if not name.endswith(ALLOWED_EXTENSIONS):
+        return "Only .pptx, .docx, .xlsx files allowed"
+
+    # MIME Type Check (additional security)
+    if content_type not in VALID_MIME_TYPES:
+        return "Invalid file MIME type"
+    return None
+
+
+def _parse_bound(value, end_of_day=False):
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            return None
+        moment = datetime.combine(day, time.max if end_of_day else time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def filter_files(queryset, params):
+    """
+    Apply the listing filters from the query string.
+
+    Supports ``uploader`` (user id), ``uploaded_after`` / ``uploaded_before``
+    (ISO date or datetime) and ``extension``. Returns (queryset, error).
+    """
+    uploader = params.get('uploader')
+    if uploader:
+        if not uploader.isdigit():
+            return queryset, "uploader must be a user id"
+        queryset = queryset.filter(uploader_id=int(uploader))
+
+    for param, lookup, end_of_day in (
+        ('uploaded_after', 'uploaded_at__gte', False),
+        ('uploaded_before', 'uploaded_at__lte', True),
+    ):
+        value = params.get(param)
+        if value:
+            bound = _parse_bound(value, end_of_day)
+            if bound is None:
+                return queryset, f"{param} must be an ISO date or datetime"
+            queryset = queryset.filter(**{lookup: bound})
+
+    extension = params.get('extension')
+    if extension:
+        extension = '.' + extension.lower().lstrip('.')
+        if extension not in ALLOWED_EXTENSIONS:
+            return queryset, "extension must be one of pptx, docx, xlsx"
+        queryset = queryset.filter(extension=extension)
+
+    return queryset, None
+
+
+def upload_session_path(session):
+    """Location of the partial file backing a resumable upload session"""
+    return os.path.join(settings.CHUNKED_UPLOAD_DIR, f"{session.id}.part")
+
+
+def make_etag(*parts):
+    """Build a strong ETag from the given pieces of stored file metadata"""
+    digest = hashlib.sha256(':'.join(str(part) for part in parts).encode()).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def parse_range_header(header, size):
+    """
+    Parse a ``Range: bytes=...`` header into sorted, merged (start, end) pairs.
+
+    Returns None when the header is absent or malformed (serve the whole file)
+    and an empty list when no range can be satisfied (416).
+    """
+    if not header or not header.startswith('bytes='):
+        return None
+
+    ranges = []
+    for spec in header[len('bytes='):].split(','):
+        spec = spec.strip()
+        if '-' not in spec:
+            return None
+        start, _, end = spec.partition('-')
+        try:
+            if start == '':
+                # Suffix range: the last N bytes
+                length = int(end)
+                if length <= 0:
+                    continue
+                start, end = max(size - length, 0), size - 1
+            else:
+                start = int(start)
+                end = int(end) if end else size - 1
+        except ValueError:
+            return None
+        if start >= size:
+            continue
+        if end < start:
+            return None
+        ranges.append((start, min(end, size - 1)))
+
+    if len(ranges) > MAX_RANGES:
+        return None
+
+    # Coalesce overlapping or adjacent ranges so each byte is sent once
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def if_range_matches(request, etag, last_modified):
+    """Check the If-Range precondition; a mismatch means the full file is sent"""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        # Only strong validators may be used with If-Range
+        return if_range == etag
+    # A date only matches the exact Last-Modified (RFC 9110 13.1.5), not any
+    # later one: the client's partial copy is of that version
+    date = parse_http_date_safe(if_range)
+    return date is not None and date == int(last_modified.timestamp())
+
+
+def iter_file_range(fh, start, end, chunk_size=STREAM_CHUNK_SIZE):
+    """Yield the bytes from start to end (inclusive) of an open file"""
+    fh.seek(start)
+    remaining = end - start + 1
+    while remaining > 0:
+        data = fh.read(min(chunk_size, remaining))
+        if not data:
+            break
+        remaining -= len(data)
+        yield data
+
+
+def _iter_multipart(fh, ranges, boundary, headers):
+    try:
+        for (start, end), header in zip(ranges, headers):
+            yield header
+            yield from iter_file_range(fh, start, end)
+        yield f'\r\n--{boundary}--\r\n'.encode()
+    finally:
+        fh.close()
+
+
+def _iter_single(fh, start, end):
+    try:
+        yield from iter_file_range(fh, start, end)
+    finally:
+        fh.close()
+
+
+async def aiter_file_range(fh, start, end, chunk_size=STREAM_CHUNK_SIZE):
+    """Async iter_file_range: blocking reads run in a worker thread"""
+    await asyncio.to_thread(fh.seek, start)
+    remaining = end - start + 1
+    while remaining > 0:
+        data = await asyncio.to_thread(fh.read, min(chunk_size, remaining))
+        if not data:
+            break
+        remaining -= len(data)
+        yield data
+
+
+async def _aiter_multipart(fh, ranges, boundary, headers):
+    # A client disconnect cancels the iteration (CancelledError); the file is
+    # closed either way
+    try:
+        for (start, end), header in zip(ranges, headers):
+            yield header
+            async for data in aiter_file_range(fh, start, end):
+                yield data
+        yield f'\r\n--{boundary}--\r\n'.encode()
+    finally:
+        fh.close()
+
+
+async def _aiter_single(fh, start, end):
+    try:
+        async for data in aiter_file_range(fh, start, end):
+            yield data
+    finally:
+        fh.close()
+
+
+def serve_file(request, fh, size, filename, etag, last_modified, asynchronous=False):
+    """
+    Build a download response for an open binary file.
+
+    Handles conditional requests (If-None-Match, If-Modified-Since and
+    friends), single byte ranges (206) and multiple byte ranges
+    (206 multipart/byteranges). ``fh`` is closed by the response. With
+    ``asynchronous`` the body is an async iterator, for async views under
+    ASGI.
+    """
+    iter_single = _aiter_single if asynchronous else _iter_single
+    iter_multipart = _aiter_multipart if asynchronous else _iter_multipart
+    count_bytes = acount_download_bytes if asynchronous else count_download_bytes
+
+    last_modified_ts = int(last_modified.timestamp())
+    validators = {
+        'ETag': etag,
+        'Last-Modified': http_date(last_modified_ts),
+        'Accept-Ranges': 'bytes',
+    }
+
+    conditional = get_conditional_response(request, etag=etag, last_modified=last_modified_ts)
+    if conditional is not None:
+        fh.close()
+        for header, value in validators.items():
+            conditional.headers[header] = value
+        return conditional
+
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    disposition = content_disposition_header(True, filename)
+
+    ranges = None
+    if if_range_matches(request, etag, last_modified):
+        ranges = parse_range_header(request.META.get('HTTP_RANGE'), size)
+
+    if ranges is None and asynchronous:
+        response = StreamingHttpResponse(count_bytes(request, iter_single(fh, 0, size - 1)), content_type=content_type)
+        response.headers['Content-Length'] = str(size)
+        response.headers['Content-Disposition'] = disposition
+    elif ranges is None:
+        response = FileResponse(fh, as_attachment=True, filename=filename)
+        # The WSGI server may send this with sendfile, out of our sight, so
+        # the whole file is counted up front
+        DOWNLOAD_BYTES.labels(view_label(request)).inc(size)
+    elif not ranges:
+        fh.close()
+        response = HttpResponse(status=416)
+        response.headers['Content-Range'] = f'bytes */{size}'
+    elif len(ranges) == 1:
+        start, end = ranges[0]
+        response = StreamingHttpResponse(
+            count_bytes(request, iter_single(fh, start, end)), status=206, content_type=content_type
+        )
+        response.headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response.headers['Content-Length'] = str(end - start + 1)
+        response.headers['Content-Disposition'] = disposition
+    else:
+        boundary = uuid.uuid4().hex
+        part_headers = [
+            (
+                f'\r\n--{boundary}\r\n'
+                f'Content-Type: {content_type}\r\n'
+                f'Content-Range: bytes {start}-{end}/{size}\r\n\r\n'
+            ).encode()
+            for start, end in ranges
+        ]
+        length = sum(len(h) for h in part_headers) + sum(end - start + 1 for start, end in ranges)
+        length += len(f'\r\n--{boundary}--\r\n')
+        response = StreamingHttpResponse(
+            count_bytes(request, iter_multipart(fh, ranges, boundary, part_headers)),
+            status=206,
+            content_type=f'multipart/byteranges; boundary={boundary}',
+        )
+        response.headers['Content-Length'] = str(length)
+        response.headers['Content-Disposition'] = disposition
+
+    for header, value in validators.items():
+        response.headers[header] = value
+    return response
+
+
+def write_range(stream, path, offset, length):
+    """
+    Copy exactly ``length`` bytes from a request body into a file at ``offset``.
+
+    Returns (written, oversized), where oversized means the body held more.
+    """
+    written = 0
+    with open(path, 'r+b') as fh:
+        fh.seek(offset)
+        while stream is not None and written < length:
+            data = stream.read(min(STREAM_CHUNK_SIZE, length - written))
+            if not data:
+                break
+            fh.write(data)
+            written += len(data)
+    oversized = stream is not None and bool(stream.read(1))
+    return written, oversized
+
+
+def download_filename(file):
+    """Name offered to the browser for an UploadedFile"""
+    return file.original_name or os.path.basename(file.file.name)
+
+
+def accel_redirect_response(storage_name, filename):
+    """
+    Hand the byte transfer of a stored file over to nginx.
+
+    The view has already done authentication and token checks; nginx serves
+    the file from its internal location (including Range and conditional
+    requests) so the app worker is released immediately.
+    """
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    response = HttpResponse(content_type=content_type)
+    response.headers['Content-Disposition'] = content_disposition_header(True, filename)
+    response.headers['X-Accel-Redirect'] = settings.SECURE_DOWNLOAD_INTERNAL_URL + quote(storage_name)
+    return response
+
+
+class _ZipSink:
+    """Write-only, unseekable target for ZipFile whose output is drained as it is produced"""
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.parts)
+        self.parts.clear()
+        return data
+
+
+def _unique_name(name, used):
+    base, ext = os.path.splitext(name)
+    candidate, n = name, 1
+    while candidate in used:
+        n += 1
+        candidate = f"{base} ({n}){ext}"
+    used.add(candidate)
+    return candidate
+
+
+def iter_zip(entries, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Yield a ZIP archive of stored files as it is built.
+
+    ``entries`` are (storage_name, filename, size, modified) tuples. Entries
+    are stored without recompression (OOXML is already deflated) and each
+    file is opened only while it is copied, so memory use stays constant and
+    nothing is written to disk.
+    """
+    sink = _ZipSink()
+    used = set()
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_STORED) as archive:
+        for storage_name, filename, size, modified in entries:
+            info = zipfile.ZipInfo(_unique_name(filename, used), date_time=modified.timetuple()[:6])
+            info.compress_type = zipfile.ZIP_STORED
+            info.file_size = size
+            with default_storage.open(storage_name, 'rb') as src, \
+                    archive.open(info, 'w', force_zip64=size > zipfile.ZIP64_LIMIT) as dest:
+                for chunk in iter(lambda: src.read(chunk_size), b''):
+                    dest.write(chunk)
+                    yield sink.drain()
+            yield sink.drain()
+    yield sink.drain()
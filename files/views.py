@@ -1,7 +1,11 @@
 from django.shortcuts import render, redirect
-from .models import UploadedFile
+from .models import UploadedFile, UploadSession, Blob
+from .storage import store_blob, store_blob_from_path, reference_blob, create_uploaded_file
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponseForbidden, FileResponse
+from django.conf import settings
+from django.http import FileResponse, HttpResponseForbidden, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header
 
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -9,76 +13,449 @@ from rest_framework.parsers import MultiPartParser
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.authentication import TokenAuthentication, SessionAuthentication
-from .serializers import UploadedFileSerializer
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from django.core.files.storage import default_storage
+from django.db import transaction
+from .listing import (
+    cached_listing, conditional_listing_response, current_listing_version, listing_context, listing_validators,
+    set_listing_headers,
+)
+from .links import (
+    FILE_GONE, LEGACY_LINK_RETIRED, LINK_FILE_FIELDS, bound_to_other_user, link_file_error, make_download_token,
+    read_download_token, resolve_download_token, revoke_download_links,
+)
+from .pagination import KeysetPagination
+from .previews import get_preview
+from .search import search_file_ids
+from .serializers import UploadByHashSerializer, UploadedFileSerializer, UploadSessionSerializer
+from .upload_handlers import OOXMLUploadHandler, check_ooxml_file
+from .utils import (
+    serve_file, make_etag, download_filename, accel_redirect_response,
+    validate_upload, upload_session_path, filter_files, iter_zip, write_range,
+)
 from users.permissions import IsOpsUser, IsClientUser
+from securefiles.metrics import count_download_bytes, observe_upload
 
-import uuid
-import mimetypes
+import os
+import time
+
+# Bearer JWTs are checked first: they authenticate and carry the role
+# claims without any database query
+API_AUTHENTICATION_CLASSES = [JWTStatelessUserAuthentication, SessionAuthentication, TokenAuthentication]
 
 
 class FileUploadView(APIView):
     parser_classes = [MultiPartParser]
-    authentication_classes = [SessionAuthentication, TokenAuthentication]
+    authentication_classes = API_AUTHENTICATION_CLASSES
     permission_classes = [IsAuthenticated, IsOpsUser]
 
+    def initialize_request(self, request, *args, **kwargs):
+        # Must be in place before anything reads the body
+        request.upload_handlers = [OOXMLUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
+
     def post(self, request):
+        # The body is only read (and hashed) once request.data is accessed
+        started = time.perf_counter()
         file_obj = request.data.get('file')
 
-        # Extension Check
-        if not file_obj.name.endswith(('.pptx', '.docx', '.xlsx')):
-            return Response({"error": "Only .pptx, .docx, .xlsx files allowed"}, status=400)
-
-        # MIME Type Check (additional security)
-        valid_mime_types = [
-            'application/vnd.openxmlformats-officedocument.presentationml.presentation',
-            'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-            'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        ]
-        if file_obj.content_type not in valid_mime_types:
-            return Response({"error": "Invalid file MIME type"}, status=400)
-
-        uploaded_file = UploadedFile.objects.create(
-            uploader=request.user,
-            file=file_obj,
-            secure_token=str(uuid.uuid4())
+        error = getattr(request._request, 'upload_error', None)
+        if error is None and file_obj is None:
+            error = "No file uploaded"
+        if error is None:
+            error = validate_upload(file_obj.name, file_obj.content_type)
+        if error:
+            return Response({"error": error}, status=400)
+
+        # Hashed and validated while written; identical content is only stored once
+        blob = store_blob(file_obj)
+        uploaded_file = create_uploaded_file(request.user, blob, file_obj.name, file_obj.content_type)
+        observe_upload(blob.size, time.perf_counter() - started)
+        return Response(UploadedFileSerializer(uploaded_file).data)
+
+
+class BlobExistsView(APIView):
+    """Tell a client whether content with this SHA-256 is already stored"""
+    authentication_classes = API_AUTHENTICATION_CLASSES
+    permission_classes = [IsAuthenticated, IsOpsUser]
+
+    def get(self, request, sha256):
+        blob = Blob.objects.filter(sha256=sha256.lower()).only('size').first()
+        return Response({
+            "sha256": sha256.lower(),
+            "exists": blob is not None,
+            "size": blob.size if blob else None,
+        })
+
+
+class UploadByHashView(APIView):
+    """Create a file from already stored content without re-sending the bytes"""
+    authentication_classes = API_AUTHENTICATION_CLASSES
+    permission_classes = [IsAuthenticated, IsOpsUser]
+
+    def post(self, request):
+        serializer = UploadByHashSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=400)
+        data = serializer.validated_data
+
+        blob = reference_blob(data['sha256'])
+        if blob is None:
+            return Response({"error": "Unknown content, upload the file instead"}, status=404)
+
+        uploaded_file = create_uploaded_file(request.user, blob, data['filename'], data['content_type'])
+        return Response(UploadedFileSerializer(uploaded_file).data)
+
+
+class UploadSessionCreateView(APIView):
+    """Start a resumable upload; chunks are then sent to UploadChunkView"""
+    authentication_classes = API_AUTHENTICATION_CLASSES
+    permission_classes = [IsAuthenticated, IsOpsUser]
+
+    def post(self, request):
+        serializer = UploadSessionSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=400)
+
+        session = serializer.save(uploader_id=request.user.id)
+        path = upload_session_path(session)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as fh:
+            fh.truncate(session.total_size)
+        return Response(UploadSessionSerializer(session).data, status=201)
+
+
+class UploadSessionView(APIView):
+    """Query the received chunks/offset of an upload session, or abort it"""
+    authentication_classes = API_AUTHENTICATION_CLASSES
+    permission_classes = [IsAuthenticated, IsOpsUser]
+
+    def get(self, request, session_id):
+        try:
+            session = UploadSession.objects.get(id=session_id, uploader_id=request.user.id)
+        except UploadSession.DoesNotExist:
+            return Response({"error": "Upload session not found"}, status=404)
+        return Response(UploadSessionSerializer(session).data)
+
+    def delete(self, request, session_id):
+        try:
+            session = UploadSession.objects.get(id=session_id, uploader_id=request.user.id)
+        except UploadSession.DoesNotExist:
+            return Response({"error": "Upload session not found"}, status=404)
+
+        path = upload_session_path(session)
+        if os.path.exists(path):
+            os.remove(path)
+        session.delete()
+        return Response(status=204)
+
+
+class UploadChunkView(APIView):
+    """
+    Receive one numbered chunk as the raw request body.
+
+    Chunks may arrive in any order and may be re-sent; each one is written
+    straight to its offset in the partial file.
+    """
+    authentication_classes = API_AUTHENTICATION_CLASSES
+    permission_classes = [IsAuthenticated, IsOpsUser]
+
+    def put(self, request, session_id, index):
+        try:
+            session = UploadSession.objects.get(id=session_id, uploader_id=request.user.id)
+        except UploadSession.DoesNotExist:
+            return Response({"error": "Upload session not found"}, status=404)
+
+        if not 0 <= index < session.chunk_count:
+            return Response({"error": "Invalid chunk number"}, status=400)
+
+        expected = session.expected_chunk_length(index)
+        written, oversized = write_range(
+            request.stream, upload_session_path(session), index * session.chunk_size, expected
         )
+        session = session.record_chunk(index, received=written == expected and not oversized)
+
+        if written != expected or oversized:
+            return Response({"error": f"Chunk {index} must be exactly {expected} bytes"}, status=400)
+        return Response(UploadSessionSerializer(session).data)
+
+
+class UploadSessionCompleteView(APIView):
+    """Assemble a fully received session into an UploadedFile"""
+    authentication_classes = API_AUTHENTICATION_CLASSES
+    permission_classes = [IsAuthenticated, IsOpsUser]
+
+    def post(self, request, session_id):
+        with transaction.atomic():
+            try:
+                session = UploadSession.objects.select_for_update().get(id=session_id, uploader_id=request.user.id)
+            except UploadSession.DoesNotExist:
+                return Response({"error": "Upload session not found"}, status=404)
+
+            if not session.is_complete:
+                missing = sorted(set(range(session.chunk_count)) - set(session.received_chunks))
+                return Response({"error": "Upload incomplete", "missing_chunks": missing[:100]}, status=409)
+
+            error = validate_upload(session.filename, session.content_type) or check_ooxml_file(
+                upload_session_path(session), os.path.splitext(session.filename)[1].lower()
+            )
+            if error:
+                return Response({"error": error}, status=400)
+
+            # The partial file is hashed and moved into the blob store as is
+            blob = store_blob_from_path(upload_session_path(session))
+            uploaded_file = create_uploaded_file(request.user, blob, session.filename, session.content_type)
+            session.delete()
+
         return Response(UploadedFileSerializer(uploaded_file).data)
 
 
 class FileListView(APIView):
-    authentication_classes = [SessionAuthentication, TokenAuthentication]
+    authentication_classes = API_AUTHENTICATION_CLASSES
     permission_classes = [IsAuthenticated, IsClientUser]
 
+    pagination_class = KeysetPagination
+
     def get(self, request):
-        files = UploadedFile.objects.all()
-        return Response(UploadedFileSerializer(files, many=True).data)
+        files, error = filter_files(UploadedFile.objects.select_related('uploader', 'metadata'), request.query_params)
+        if error:
+            return Response({"error": error}, status=400)
+
+        # Unchanged polls are answered from the listing version alone
+        etag, last_modified, version = listing_validators()
+        response = conditional_listing_response(request, etag, last_modified)
+        if response is not None:
+            return response
+
+        def build():
+            paginator = self.pagination_class()
+            page = paginator.paginate_queryset(files, request, view=self)
+            return paginator.get_paginated_response(UploadedFileSerializer(page, many=True).data).data
+
+        data = cached_listing(version, request.build_absolute_uri(), build)
+        return set_listing_headers(Response(data), etag, last_modified)
+
+
+class FileSearchView(APIView):
+    """Files ranked by how well their text matches ``q``"""
+    authentication_classes = API_AUTHENTICATION_CLASSES
+    permission_classes = [IsAuthenticated, IsClientUser]
+
+    default_limit = 20
+    max_limit = 100
+
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({"error": "q is required"}, status=400)
+        try:
+            limit = min(int(request.query_params.get('limit', self.default_limit)), self.max_limit)
+        except ValueError:
+            return Response({"error": "limit must be a number"}, status=400)
+
+        hits = search_file_ids(query, max(limit, 1))
+        files = UploadedFile.objects.select_related('uploader', 'metadata').in_bulk([file_id for file_id, _, _ in hits])
+        results = []
+        for file_id, rank, snippet in hits:
+            if file_id in files:
+                results.append({**UploadedFileSerializer(files[file_id]).data, "rank": rank, "snippet": snippet})
+        return Response({"results": results})
+
+
+class FilePreviewView(APIView):
+    """Embedded thumbnail of a document, served with an ETag"""
+    authentication_classes = API_AUTHENTICATION_CLASSES
+    permission_classes = [IsAuthenticated, IsClientUser]
+
+    def get(self, request, file_id):
+        preview = get_preview(file_id)
+        if preview is None:
+            return Response({"error": "No preview available"}, status=404)
+
+        etag, content_type, name = preview
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            try:
+                response = FileResponse(default_storage.open(name, 'rb'), content_type=content_type)
+            except FileNotFoundError:
+                return Response({"error": "No preview available"}, status=404)
+        response.headers['ETag'] = etag
+        response.headers['Cache-Control'] = f'private, max-age={settings.PREVIEW_CACHE_SECONDS}'
+        return response
 
 
 class FileDownloadLinkView(APIView):
-    authentication_classes = [SessionAuthentication, TokenAuthentication]
+    authentication_classes = API_AUTHENTICATION_CLASSES
     permission_classes = [IsAuthenticated, IsClientUser]
 
     def get(self, request, file_id):
         try:
             file = UploadedFile.objects.get(id=file_id)
-            return Response({
-                "download-link": f"http://localhost:8000/api/secure-download/{file.secure_token}/",
-                "message": "success"
-            })
         except UploadedFile.DoesNotExist:
             return Response({"error": "File not found"}, status=404)
 
+        # Optional: a shorter lifetime, and binding the link to this client
+        try:
+            expires_in = int(request.query_params.get('expires_in', 0)) or None
+        except ValueError:
+            return Response({"error": "expires_in must be a number of seconds"}, status=400)
+        bind = request.query_params.get('bind', '').lower() in ('1', 'true', 'yes')
+
+        token = make_download_token(file, expires_in=expires_in, user=request.user if bind else None)
+        return Response({
+            "download-link": request.build_absolute_uri(f"/api/download/{token}/"),
+            "message": "success"
+        })
 
-class SecureDownloadView(APIView):
-    authentication_classes = [SessionAuthentication, TokenAuthentication]
-    permission_classes = [IsAuthenticated, IsClientUser]
 
-    def get(self, request, token):
+class RevokeDownloadLinksView(APIView):
+    """Invalidate every signed download link issued for a file"""
+    authentication_classes = API_AUTHENTICATION_CLASSES
+    permission_classes = [IsAuthenticated, IsOpsUser]
+
+    def post(self, request, file_id):
         try:
-            file = UploadedFile.objects.get(secure_token=token)
-            return FileResponse(file.file, as_attachment=True, filename=file.file.name)
+            file = UploadedFile.objects.get(id=file_id)
         except UploadedFile.DoesNotExist:
-            return Response({"error": "Invalid or expired link"}, status=404)
+            return Response({"error": "File not found"}, status=404)
+
+        revoke_download_links(file)
+        return Response({"message": "Download links revoked", "link_version": file.link_version})
+
+
+class SignedDownloadView(APIView):
+    """
+    Serve a file from a signed, expiring link.
+
+    The link itself is the credential: one primary-key read finds the file
+    and its link version. Users are only authenticated for links bound to one.
+    """
+    authentication_classes = API_AUTHENTICATION_CLASSES
+    permission_classes = []
+
+    def perform_authentication(self, request):
+        # Authenticate lazily: only bound links need to know the user
+        pass
+
+    def get(self, request, token):
+        payload, file, error = resolve_download_token(token)
+        if error:
+            message, status_code = error
+            return Response({"error": message}, status=status_code)
+
+        if bound_to_other_user(payload, request.user):
+            return Response({"error": "This link was issued to another user"}, status=403)
+
+        return file_response(request, file)
+
+
+class ZipDownloadView(APIView):
+    """
+    Stream several files as one ZIP archive.
+
+    Files are named either by id (client users) or by signed download
+    tokens, which carry their own authorisation like SignedDownloadView.
+    """
+    authentication_classes = API_AUTHENTICATION_CLASSES
+    permission_classes = []
+
+    def perform_authentication(self, request):
+        # Token-only requests never need to know the user
+        pass
+
+    def post(self, request):
+        if not isinstance(request.data, dict):
+            return Response({"error": "Provide a list of file ids or download tokens"}, status=400)
+        ids = request.data.get('ids') or []
+        tokens = request.data.get('tokens') or []
+        if not isinstance(ids, list) or not isinstance(tokens, list) or not (ids or tokens):
+            return Response({"error": "Provide a list of file ids or download tokens"}, status=400)
+        if len(ids) + len(tokens) > settings.ZIP_DOWNLOAD_MAX_FILES:
+            return Response({"error": f"At most {settings.ZIP_DOWNLOAD_MAX_FILES} files per archive"}, status=400)
+
+        entries = []
+        if ids:
+            for permission in (IsAuthenticated(), IsClientUser()):
+                if not permission.has_permission(request, self):
+                    self.permission_denied(request)
+            try:
+                ids = [int(file_id) for file_id in ids]
+            except (TypeError, ValueError):
+                return Response({"error": "ids must be file ids"}, status=400)
+            files = UploadedFile.objects.in_bulk(ids)
+            missing = [file_id for file_id in ids if file_id not in files]
+            if missing:
+                return Response({"error": "File not found", "ids": missing}, status=404)
+            entries.extend(zip_entry(files[file_id]) for file_id in ids)
+
+        links = []
+        for token in tokens:
+            payload, error = read_download_token(str(token))
+            if error:
+                return Response({"error": error}, status=404)
+            if bound_to_other_user(payload, request.user):
+                return Response({"error": "A link was issued to another user"}, status=403)
+            links.append(payload)
+        # One query for the files behind all the links
+        linked = UploadedFile.objects.only(*LINK_FILE_FIELDS).in_bulk({payload['f'] for payload in links})
+        for payload in links:
+            file = linked.get(payload['f'])
+            error = link_file_error(payload, file)
+            if error:
+                message, status_code = error
+                return Response({"error": message}, status=status_code)
+            entries.append(zip_entry(file))
+
+        response = StreamingHttpResponse(count_download_bytes(request, iter_zip(entries)), content_type='application/zip')
+        response.headers['Content-Disposition'] = content_disposition_header(True, 'files.zip')
+        # Pass chunks straight through nginx instead of spooling them to disk
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+
+
+class SecureDownloadView(APIView):
+    """
+    Links from before signed links existed.
+
+    They could neither expire nor be revoked, so they are retired: every
+    one answers 410 and the client asks for a signed link instead.
+    """
+    authentication_classes = []
+    permission_classes = []
+
+    def get(self, request, token):
+        return Response({"error": LEGACY_LINK_RETIRED}, status=410)
+
+
+def file_response(request, file):
+    """
+    Serve an UploadedFile, or hand it to nginx.
+
+    Supports Range, If-Range and conditional GET so interrupted downloads
+    can resume and repeat downloads get a 304.
+    """
+    if settings.SECURE_DOWNLOAD_BACKEND == 'nginx':
+        return accel_redirect_response(file.file.name, download_filename(file))
+
+    try:
+        fh = default_storage.open(file.file.name, 'rb')
+    except FileNotFoundError:
+        return Response({"error": FILE_GONE}, status=410)
+    size = file.size if file.size is not None else default_storage.size(file.file.name)
+    return serve_file(
+        request,
+        fh,
+        size=size,
+        filename=download_filename(file),
+        etag=make_etag(file.sha256 or file.file.name, size, file.uploaded_at.timestamp()),
+        last_modified=file.uploaded_at,
+    )
+
+
+def zip_entry(file):
+    """(storage_name, filename, size, modified) of an UploadedFile for iter_zip"""
+    size = file.size if file.size is not None else default_storage.size(file.file.name)
+    return file.file.name, download_filename(file), size, file.uploaded_at
 
 
 @login_required
@@ -91,6 +468,8 @@ def generate_secure_link(request, file_id):
     except UploadedFile.DoesNotExist:
         return redirect('dashboard_client')  # Could also render with error
 
-    link = request.build_absolute_uri(f"/api/secure-download/{file.secure_token}/")
-    files = UploadedFile.objects.all()
-    return render(request, 'dashboard_client.html', {'files': files, 'link': link})
+    token = make_download_token(file, user=request.user)
+    link = request.build_absolute_uri(f"/api/download/{token}/")
+    files = UploadedFile.objects.select_related('metadata').order_by('-uploaded_at')
+    context = listing_context(files, current_listing_version()[0])
+    return render(request, 'dashboard_client.html', {**context, 'link': link})
@@ -0,0 +1,178 @@
+"""
+Prometheus metrics for the web app and workers.
+
+With PROMETHEUS_MULTIPROC_DIR set (gunicorn with several workers), every
+process writes its samples to files in that directory and ``/metrics``
+aggregates them, so a scrape sees the whole server rather than whichever
+worker answered it.
+"""
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, JsonResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess,
+)
+import hmac
+import os
+import time
+
+REQUEST_LATENCY = Histogram(
+    'securefiles_request_duration_seconds',
+    'Time until the response is ready, by view',
+    ['view', 'method', 'status'],
+)
+REQUEST_DB_QUERIES = Histogram(
+    'securefiles_request_db_queries',
+    'SQL queries run per request, by view',
+    ['view'],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144),
+)
+REQUEST_DB_SECONDS = Histogram(
+    'securefiles_request_db_seconds',
+    'Time spent in SQL per request, by view',
+    ['view'],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+DOWNLOAD_BYTES = Counter(
+    'securefiles_download_bytes',
+    'File bytes streamed by download views (not counted when nginx serves the file)',
+    ['view'],
+)
+UPLOAD_SIZE = Histogram(
+    'securefiles_upload_size_bytes',
+    'Size of uploaded files',
+    buckets=tuple(2 ** n for n in range(14, 32, 2)),
+)
+UPLOAD_DURATION = Histogram(
+    'securefiles_upload_duration_seconds',
+    'Time to receive, hash and store an uploaded file',
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+)
+EMAIL_SENDS = Counter(
+    'securefiles_email_sends',
+    'Emails handed to the mail server, by outcome',
+    ['outcome'],
+)
+EMAIL_SEND_SECONDS = Histogram(
+    'securefiles_email_send_duration_seconds',
+    'Time to send one email including retries, by outcome',
+    ['outcome'],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+
+# [query count, seconds] for the request being handled. A context variable
+# follows the request into sync_to_async and asyncio.to_thread calls.
+_request_db = ContextVar('request_db', default=None)
+
+
+def view_label(request):
+    """URL name (or dotted view path) of the matched route; keeps label values bounded"""
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None else 'unmatched'
+
+
+# Any other method a client sends is counted as 'other'
+HTTP_METHODS = frozenset(['GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'])
+
+
+def method_label(request):
+    """Request method, with unknown ones folded together so clients cannot mint series"""
+    return request.method if request.method in HTTP_METHODS else 'other'
+
+
+def _record_query(execute, sql, params, many, context):
+    stats = _request_db.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats[0] += 1
+        stats[1] += time.perf_counter() - start
+
+
+def _install_query_recorder(connection):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+# Connections opened in other threads (sync_to_async, asyncio.to_thread)
+connection_created.connect(
+    lambda sender, connection, **kwargs: _install_query_recorder(connection),
+    dispatch_uid='securefiles.metrics',
+    weak=False,
+)
+
+
+def start_request():
+    """Begin counting SQL for a request; pass the result to finish_request"""
+    for connection in connections.all():
+        _install_query_recorder(connection)
+    return time.perf_counter(), _request_db.set([0, 0.0])
+
+
+def finish_request(request, response, started):
+    start, token = started
+    stats = _request_db.get()
+    _request_db.reset(token)
+    view = view_label(request)
+    REQUEST_LATENCY.labels(view, method_label(request), f'{response.status_code // 100}xx').observe(
+        time.perf_counter() - start
+    )
+    REQUEST_DB_QUERIES.labels(view).observe(stats[0])
+    REQUEST_DB_SECONDS.labels(view).observe(stats[1])
+
+
+def observe_upload(size, seconds):
+    UPLOAD_SIZE.observe(size)
+    UPLOAD_DURATION.observe(seconds)
+
+
+def observe_email(error, seconds):
+    outcome = 'failed' if error is not None else 'sent'
+    EMAIL_SENDS.labels(outcome).inc()
+    EMAIL_SEND_SECONDS.labels(outcome).observe(seconds)
+
+
+def count_download_bytes(request, chunks):
+    """Pass ``chunks`` through, counting the bytes that actually reach the client"""
+    counter = DOWNLOAD_BYTES.labels(view_label(request))
+    try:
+        for chunk in chunks:
+            counter.inc(len(chunk))
+            yield chunk
+    finally:
+        # Closing the response must still close the file behind ``chunks``
+        chunks.close()
+
+
+async def acount_download_bytes(request, chunks):
+    counter = DOWNLOAD_BYTES.labels(view_label(request))
+    try:
+        async for chunk in chunks:
+            counter.inc(len(chunk))
+            yield chunk
+    finally:
+        await chunks.aclose()
+
+
+def registry():
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        collected = CollectorRegistry()
+        multiprocess.MultiProcessCollector(collected)
+        return collected
+    return REGISTRY
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint; requires ``Bearer METRICS_TOKEN``, open only under DEBUG"""
+    if not settings.METRICS_TOKEN and not settings.DEBUG:
+        return JsonResponse({"error": "Metrics are disabled until METRICS_TOKEN is set"}, status=403)
+    if settings.METRICS_TOKEN:
+        scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+        if scheme != 'Bearer' or not hmac.compare_digest(token.strip(), settings.METRICS_TOKEN):
+            return JsonResponse({"error": "Invalid metrics token"}, status=403)
+    return HttpResponse(generate_latest(registry()), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,35 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from .metrics import finish_request, start_request
+
+
+class MetricsMiddleware:
+    """
+    Record latency and SQL query count/time per view.
+
+    Listed first so redirects and errors from other middleware are measured
+    too. Works for sync and async views without forcing either into the
+    other mode.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        started = start_request()
+        response = self.get_response(request)
+        finish_request(request, response, started)
+        return response
+
+    async def __acall__(self, request):
+        started = start_request()
+        response = await self.get_response(request)
+        finish_request(request, response, started)
+        return response
@@ -0,0 +1,207 @@
+"""
+Opt-in request profiling (PROFILE_REQUESTS=1).
+
+Every SQL query of a request is recorded with the line of project code
+that ran it, so repeated queries (N+1s) can be traced back to a template
+or model method. Wall time is split between the database, file storage
+and template rendering; the split goes out in a ``Server-Timing`` header
+(shown in the browser's network panel) and one log line per request on
+the ``securefiles.profiling`` logger.
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from collections import Counter
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.files.storage import default_storage
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.base import Template
+from django.utils.functional import empty
+from functools import wraps
+import logging
+import os
+import re
+import sys
+import time
+
+logger = logging.getLogger('securefiles.profiling')
+
+# Storage methods whose time is counted as "storage"
+STORAGE_METHODS = ['open', 'save', 'exists', 'delete', 'size', 'listdir']
+
+# Repeated statements logged per request
+MAX_LOGGED_DUPLICATES = 5
+
+# Instrumentation frames, never reported as a query's call site
+SKIP_FILES = {
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), name)
+    for name in ('profiling.py', 'metrics.py', 'middleware.py')
+}
+
+_profile = ContextVar('request_profile', default=None)
+
+
+class RequestProfile:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = []
+        self.timings = {'db': 0.0, 'storage': 0.0, 'template': 0.0}
+        # Templates being rendered, innermost last
+        self.templates = []
+        self.depth = {'storage': 0, 'template': 0}
+
+    def duplicates(self):
+        """(count, sql, call sites) for statements run more than once, most repeated first"""
+        counts = Counter(normalise_sql(query['sql']) for query in self.queries)
+        found = []
+        for sql, count in counts.most_common():
+            if count < 2:
+                break
+            sites = Counter(query['site'] for query in self.queries if normalise_sql(query['sql']) == sql)
+            found.append((count, sql, [site for site, _ in sites.most_common(3)]))
+        return found
+
+    def server_timing(self):
+        total = (time.perf_counter() - self.started) * 1000
+        return ', '.join([
+            f'db;dur={self.timings["db"] * 1000:.1f};desc="{len(self.queries)} queries"',
+            f'storage;dur={self.timings["storage"] * 1000:.1f}',
+            f'template;dur={self.timings["template"] * 1000:.1f}',
+            f'total;dur={total:.1f}',
+        ])
+
+
+def normalise_sql(sql):
+    """SQL with literals and IN lists collapsed, so the same statement with other values compares equal"""
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'\b\d+\b', '?', sql)
+    return re.sub(r'\(\s*(?:\?|%s)(?:\s*,\s*(?:\?|%s))*\s*\)', '(...)', sql)
+
+
+def call_site(profile):
+    """First frame of project code (outside this module and installed packages) that led here"""
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if (filename.startswith(str(settings.BASE_DIR)) and 'site-packages' not in filename
+                and filename not in SKIP_FILES):
+            site = f'{os.path.relpath(filename, settings.BASE_DIR)}:{frame.f_lineno}'
+            break
+        frame = frame.f_back
+    else:
+        site = '?'
+    if profile.templates:
+        site = f'{site} (in {profile.templates[-1]})'
+    return site
+
+
+def _profile_query(execute, sql, params, many, context):
+    profile = _profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - start
+        profile.timings['db'] += duration
+        profile.queries.append({'sql': sql, 'time': duration, 'site': call_site(profile)})
+
+
+def _install_query_profiler(connection):
+    if _profile_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_profile_query)
+
+
+def _timed(section, method, name=None):
+    """Wrap ``method`` so its time counts towards ``section``; nested calls are counted once"""
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        profile = _profile.get()
+        if profile is None:
+            return method(*args, **kwargs)
+        if name is not None:
+            profile.templates.append(name(*args) or '<string>')
+        profile.depth[section] += 1
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            profile.depth[section] -= 1
+            if not profile.depth[section]:
+                profile.timings[section] += time.perf_counter() - start
+            if name is not None:
+                profile.templates.pop()
+    wrapper.profiled = True
+    return wrapper
+
+
+def _instrument():
+    """Hook timing into template rendering, file storage and DB connections (once per process)"""
+    if getattr(Template.render, 'profiled', False):
+        return
+    Template.render = _timed('template', Template.render, name=lambda template, *args: template.name)
+    if default_storage._wrapped is empty:
+        default_storage._setup()
+    storage = default_storage._wrapped
+    for method in STORAGE_METHODS:
+        setattr(storage, method, _timed('storage', getattr(storage, method)))
+    connection_created.connect(
+        lambda sender, connection, **kwargs: _install_query_profiler(connection),
+        dispatch_uid='securefiles.profiling',
+        weak=False,
+    )
+
+
+def report(request, response, profile):
+    response.headers['Server-Timing'] = profile.server_timing()
+    duplicates = profile.duplicates()
+    logger.info(
+        '%s %s: %d queries (%d repeated) in %.1f ms, storage %.1f ms, templates %.1f ms',
+        request.method, request.path, len(profile.queries), sum(count for count, _, _ in duplicates),
+        profile.timings['db'] * 1000, profile.timings['storage'] * 1000, profile.timings['template'] * 1000,
+    )
+    for count, sql, sites in duplicates[:MAX_LOGGED_DUPLICATES]:
+        logger.info('  %dx %s\n     from %s', count, sql[:300], ', '.join(sites))
+
+
+class ProfilingMiddleware:
+    """Profile each request when PROFILE_REQUESTS is set; removed from the stack otherwise"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.PROFILE_REQUESTS:
+            raise MiddlewareNotUsed
+        _instrument()
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def start(self):
+        for connection in connections.all():
+            _install_query_profiler(connection)
+        profile = RequestProfile()
+        return profile, _profile.set(profile)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        profile, token = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            _profile.reset(token)
+        report(request, response, profile)
+        return response
+
+    async def __acall__(self, request):
+        profile, token = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _profile.reset(token)
+        report(request, response, profile)
+        return response
@@ -0,0 +1,46 @@
+from django.db.models import Max
+import time
+
+
+def purge_in_batches(queryset, batch_size=1000, sleep=0.0, start_after=None, dry_run=False, progress=None):
+    """
+    Delete the rows of ``queryset`` in short primary-key range batches.
+
+    The table is walked in pk order: each step finds the pk ``batch_size``
+    rows further on and deletes the matching rows inside that range, so
+    every statement touches a bounded slice and holds its locks briefly.
+    Because the walk only moves forward, a run can be resumed with
+    ``start_after`` set to the last pk reported.
+
+    ``progress(last_pk, affected, total)`` is called after each batch.
+    With ``dry_run`` the matching rows are counted instead of deleted.
+    Returns (total, last_pk).
+    """
+    model = queryset.model
+    all_rows = model._default_manager.using(queryset.db).order_by('pk')
+    max_pk = all_rows.aggregate(max_pk=Max('pk'))['max_pk']
+
+    total = 0
+    last_pk = start_after
+    while max_pk is not None and (last_pk is None or last_pk < max_pk):
+        window = all_rows if last_pk is None else all_rows.filter(pk__gt=last_pk)
+        upper = window.values_list('pk', flat=True)[batch_size - 1:batch_size].first()
+        if upper is None:
+            upper = max_pk
+
+        batch = queryset.filter(pk__lte=upper)
+        if last_pk is not None:
+            batch = batch.filter(pk__gt=last_pk)
+        if dry_run:
+            affected = batch.count()
+        else:
+            affected, _ = batch.delete()
+
+        total += affected
+        last_pk = upper
+        if progress:
+            progress(last_pk, affected, total)
+        if sleep and not dry_run and last_pk < max_pk:
+            time.sleep(sleep)
+
+    return total, last_pk
@@ -11,7 +11,9 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 from pathlib import Path
+from datetime import timedelta
 import os
+from django.core.exceptions import ImproperlyConfigured
 from django.core.management.utils import get_random_secret_key
 from dotenv import load_dotenv
 
@@ -50,6 +52,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so it measures everything below it
+    "securefiles.middleware.MetricsMiddleware",
+    "securefiles.profiling.ProfilingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -143,16 +148,140 @@ AUTH_USER_MODEL = 'users.CustomUser'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
+        'rest_framework_simplejwt.authentication.JWTStatelessUserAuthentication',
         'rest_framework.authentication.TokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
-    ]
+    ],
+    # Sliding-window limits (users/throttling.py) for the login and signup
+    # forms and APIs: per client IP and per submitted email/username. Set
+    # NUM_PROXIES=1 behind nginx so the client IP comes from X-Forwarded-For
+    'DEFAULT_THROTTLE_RATES': {
+        'login_ip': os.getenv('THROTTLE_LOGIN_IP', '20/minute'),
+        'login_account': os.getenv('THROTTLE_LOGIN_ACCOUNT', '5/hour'),
+        'signup_ip': os.getenv('THROTTLE_SIGNUP_IP', '10/hour'),
+        'signup_account': os.getenv('THROTTLE_SIGNUP_ACCOUNT', '3/hour'),
+    },
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', '0')),
+}
+
+# Cache: Redis when REDIS_URL is set (shared by all workers), otherwise
+# a per-process local memory cache
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Where web sessions live (SESSION_TIER):
+#   db              django_session is read on every authenticated page view
+#   cached_db       write-through: reads come from the cache, writes go to both
+#   cache           cache only; everyone is logged out if the cache is flushed
+#   signed_cookies  stored in the cookie; logouts are recorded in the cache
+# All but db need the shared Redis cache (REDIS_URL) once more than one
+# worker runs, or a logout in one worker would not be seen by the others
+SESSION_TIER = os.getenv('SESSION_TIER', 'db')
+SESSION_ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'cache': 'django.contrib.sessions.backends.cache',
+    'signed_cookies': 'users.sessions',
+}
+if SESSION_TIER not in SESSION_ENGINES:
+    raise ImproperlyConfigured(f"SESSION_TIER must be one of {', '.join(SESSION_ENGINES)}")
+SESSION_ENGINE = SESSION_ENGINES[SESSION_TIER]
+
+# JWT API auth: the access token carries the role claims and is verified
+# without a database lookup (JWTStatelessUserAuthentication)
+SIMPLE_JWT = {
+    'ACCESS_TOKEN_LIFETIME': timedelta(minutes=int(os.getenv('JWT_ACCESS_MINUTES', '5'))),
+    'REFRESH_TOKEN_LIFETIME': timedelta(days=int(os.getenv('JWT_REFRESH_DAYS', '1'))),
+    'AUTH_HEADER_TYPES': ('Bearer',),
 }
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Secure downloads: 'django' streams the file from the app process,
+# 'nginx' hands the transfer to nginx via X-Accel-Redirect after the
+# auth and token checks (see the internal location in nginx.conf)
+SECURE_DOWNLOAD_BACKEND = os.getenv('SECURE_DOWNLOAD_BACKEND', 'django')
+SECURE_DOWNLOAD_INTERNAL_URL = os.getenv('SECURE_DOWNLOAD_INTERNAL_URL', '/protected-media/')
+
+# Serve downloads and chunk uploads from async views; set when running
+# under ASGI (uvicorn), see docker-compose.asgi.yml
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', '0').lower() in ('1', 'true', 'yes')
+
+# Prometheus scrapes /metrics with this bearer token; when empty the
+# endpoint is open under DEBUG and refused otherwise.
+# Under gunicorn set PROMETHEUS_MULTIPROC_DIR so all workers are reported
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Opt-in request profiling (securefiles/profiling.py): a Server-Timing
+# header plus a log line per request with query counts and repeated
+# queries traced to their call sites. Logged to PROFILE_LOG_FILE if set,
+# else to the console
+PROFILE_REQUESTS = os.getenv('PROFILE_REQUESTS', '0').lower() in ('1', 'true', 'yes')
+PROFILE_LOG_FILE = os.getenv('PROFILE_LOG_FILE', '')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'profiling': (
+            {'class': 'logging.FileHandler', 'filename': PROFILE_LOG_FILE}
+            if PROFILE_LOG_FILE else {'class': 'logging.StreamHandler'}
+        ),
+    },
+    'loggers': {
+        'securefiles.profiling': {'handlers': ['profiling'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
+# Signed download links: lifetime in seconds
+SIGNED_LINK_MAX_AGE = int(os.getenv('SIGNED_LINK_MAX_AGE', '3600'))
+
+# Per-type size caps, enforced while single-request uploads stream to disk
+UPLOAD_MAX_SIZES = {
+    '.docx': 50 * 1024 * 1024,
+    '.pptx': 100 * 1024 * 1024,
+    '.xlsx': 100 * 1024 * 1024,
+}
+
+# Largest number of files streamed in one ZIP download
+ZIP_DOWNLOAD_MAX_FILES = 200
+
+# Full-text search: characters of extracted text kept per document. Well
+# below PostgreSQL's 1 MB limit on the generated tsvector
+SEARCH_MAX_TEXT_CHARS = 200_000
+
+# Document thumbnails are immutable per file; how long they stay cached
+PREVIEW_CACHE_SECONDS = 24 * 60 * 60
+
+# Serialized listing pages and dashboard file tables are cached per listing
+# version; a change moves readers to a new key, so this only bounds how long
+# old pages linger
+LISTING_CACHE_SECONDS = int(os.getenv('LISTING_CACHE_SECONDS', '300'))
+
+# Resumable (chunked) uploads
+CHUNKED_UPLOAD_DIR = MEDIA_ROOT / 'partial'
+CHUNKED_UPLOAD_CHUNK_SIZE = 5 * 1024 * 1024
+CHUNKED_UPLOAD_MAX_CHUNK_SIZE = 50 * 1024 * 1024
+CHUNKED_UPLOAD_MAX_SIZE = 5 * 1024 * 1024 * 1024
+# Every chunk but the last is at least this big, and a session has at most
+# this many, so the received chunk list stays small
+CHUNKED_UPLOAD_MIN_CHUNK_SIZE = 1024 * 1024
+CHUNKED_UPLOAD_MAX_CHUNKS = 10_000
+
 # Email Configuration
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 
@@ -172,6 +301,15 @@ DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'Secure File Share <noreply
 # Email timeout settings
 EMAIL_TIMEOUT = 30
 
+# Email outbox: views queue messages, `manage.py send_queued_emails` delivers them
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.getenv('EMAIL_OUTBOX_MAX_ATTEMPTS', '6'))
+EMAIL_OUTBOX_BACKOFF_SECONDS = int(os.getenv('EMAIL_OUTBOX_BACKOFF_SECONDS', '30'))
+EMAIL_OUTBOX_LEASE_SECONDS = 300
+
+# Jittered backoff between reconnect attempts of a single delivery
+EMAIL_RETRY_BACKOFF_SECONDS = 0.5
+EMAIL_RETRY_MAX_BACKOFF_SECONDS = 10
+
 LOGIN_URL = '/login/'
 
 APPEND_SLASH = True
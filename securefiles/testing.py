@@ -0,0 +1,47 @@
+"""
+Test helpers.
+
+``QueryBudgetMixin.assertMaxQueries`` fails a test when code runs more SQL
+than a declared budget, and lists the queries (with repeated ones marked)
+so an N+1 is easy to spot:
+
+    class FileListTests(QueryBudgetMixin, TestCase):
+        def test_list_query_budget(self):
+            with self.assertMaxQueries(3):
+                self.client.get('/api/list/', HTTP_AUTHORIZATION=f'Bearer {token}')
+"""
+from collections import Counter
+from contextlib import contextmanager
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+
+from .profiling import normalise_sql
+
+# Statements that are transaction bookkeeping rather than work
+IGNORED_SQL = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+
+def budget_report(queries, budget):
+    """Failure message listing each query, with repeated statements counted"""
+    repeats = Counter(normalise_sql(query['sql']) for query in queries)
+    lines = [f'{len(queries)} queries executed, budget is {budget}:']
+    for number, query in enumerate(queries, 1):
+        count = repeats[normalise_sql(query['sql'])]
+        marker = f' [repeated {count}x]' if count > 1 else ''
+        lines.append(f'{number}. {query["sql"]}{marker}')
+    return '\n'.join(lines)
+
+
+class QueryBudgetMixin:
+    """Adds assertMaxQueries to a TestCase"""
+
+    @contextmanager
+    def assertMaxQueries(self, budget, using=DEFAULT_DB_ALIAS):
+        with CaptureQueriesContext(connections[using]) as context:
+            yield context
+        queries = [
+            query for query in context.captured_queries
+            if not query['sql'].upper().startswith(IGNORED_SQL)
+        ]
+        if len(queries) > budget:
+            self.fail(budget_report(queries, budget))
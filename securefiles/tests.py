@@ -0,0 +1,28 @@
+from django.test import TestCase, override_settings
+
+from .metrics import REQUEST_LATENCY
+
+
+class MetricsEndpointTests(TestCase):
+    @override_settings(DEBUG=False, METRICS_TOKEN='')
+    def test_closed_without_token_in_production(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+    @override_settings(DEBUG=True, METRICS_TOKEN='')
+    def test_open_under_debug(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'securefiles_request_duration_seconds', response.content)
+
+    @override_settings(DEBUG=False, METRICS_TOKEN='s3cret')
+    def test_bearer_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret').status_code, 200)
+
+    def test_unknown_methods_share_one_series(self):
+        for method in ('FOO1', 'FOO2'):
+            self.client.generic(method, '/')
+        labels = {sample.labels['method'] for metric in REQUEST_LATENCY.collect() for sample in metric.samples}
+        self.assertIn('other', labels)
+        self.assertFalse(labels & {'FOO1', 'FOO2'})
@@ -2,6 +2,7 @@ from django.contrib import admin
 from django.urls import path, include
 from users.views import user_login, user_logout, dashboard_ops, dashboard_client, home
 from files.views import generate_secure_link
+from .metrics import metrics_view
 
 from django.conf import settings
 from django.conf.urls.static import static
@@ -19,6 +20,9 @@ urlpatterns = [
     path('dashboard-client/', dashboard_client, name='dashboard_client'),
     path('generate-link/<int:file_id>/', generate_secure_link, name='generate_link'),
 
+    # Prometheus scrape endpoint
+    path('metrics', metrics_view, name='metrics'),
+
     # Include app URLs
     path('', include('users.urls')),
     path('api/', include('files.urls')),
@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import CustomUser, MagicLoginToken
+from django.utils import timezone
+from .models import CustomUser, MagicLoginToken, OutgoingEmail
 
 @admin.register(CustomUser)
 class CustomUserAdmin(admin.ModelAdmin):
@@ -24,13 +25,15 @@ class CustomUserAdmin(admin.ModelAdmin):
 class MagicLoginTokenAdmin(admin.ModelAdmin):
     list_display = ['user', 'token_preview', 'created_at', 'expires_at', 'is_used', 'is_valid_status', 'login_ip']
     list_filter = ['is_used', 'created_at', 'expires_at']
-    search_fields = ['user__username', 'user__email', 'token', 'login_ip']
-    readonly_fields = ['token', 'created_at', 'expires_at', 'is_valid_status']
+    search_fields = ['user__username', 'user__email', 'token_hash', 'login_ip']
+    readonly_fields = ['token_hash', 'created_at', 'expires_at', 'is_valid_status']
     ordering = ['-created_at']
+    # __str__ and the user column read the related user
+    list_select_related = ['user']
     
     def token_preview(self, obj):
-        return f"{obj.token[:8]}...{obj.token[-8:]}"
-    token_preview.short_description = 'Token Preview'
+        return f"{obj.token_hash[:8]}...{obj.token_hash[-8:]}"
+    token_preview.short_description = 'Token Hash'
     
     def is_valid_status(self, obj):
         return "✅ Valid" if obj.is_valid() else "❌ Invalid"
@@ -38,7 +41,7 @@ class MagicLoginTokenAdmin(admin.ModelAdmin):
     
     fieldsets = (
         ('Token Information', {
-            'fields': ('user', 'token', 'is_valid_status')
+            'fields': ('user', 'token_hash', 'is_valid_status')
         }),
         ('Timestamps', {
             'fields': ('created_at', 'expires_at', 'is_used')
@@ -47,3 +50,20 @@ class MagicLoginTokenAdmin(admin.ModelAdmin):
             'fields': ('login_ip', 'user_agent')
         }),
     )
+
+@admin.register(OutgoingEmail)
+class OutgoingEmailAdmin(admin.ModelAdmin):
+    list_display = ['subject', 'recipients', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['subject', 'recipients']
+    readonly_fields = ['created_at', 'sent_at', 'last_error']
+    ordering = ['-created_at']
+    actions = ['requeue']
+
+    @admin.action(description='Requeue selected emails')
+    def requeue(self, request, queryset):
+        # Sent and dead-lettered emails have no body left to send
+        updated = queryset.filter(status=OutgoingEmail.STATUS_PENDING).update(
+            attempts=0, next_attempt_at=timezone.now()
+        )
+        self.message_user(request, f'{updated} pending emails requeued')
@@ -1,6 +1,12 @@
-from django.core.mail import send_mail
+from django.core.mail import send_mail, get_connection, EmailMultiAlternatives
 from django.conf import settings
+from django.db import transaction
 from django.template.loader import render_to_string
+from django.utils import timezone
+from datetime import timedelta
+from securefiles.metrics import observe_email
+import random
+import time
 import traceback
 
 def test_email_configuration():
@@ -46,30 +52,180 @@ Secure File Share System
         print(f"Full error traceback:\n{traceback.format_exc()}")
         return False, error_msg
 
+def backoff_delay(attempt, base=None, cap=None):
+    """Full-jitter exponential backoff: a random delay up to base * 2**attempt"""
+    base = settings.EMAIL_RETRY_BACKOFF_SECONDS if base is None else base
+    cap = settings.EMAIL_RETRY_MAX_BACKOFF_SECONDS if cap is None else cap
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+def build_message(subject, message, recipient_list, html_message=None, from_email=None):
+    """Build an EmailMultiAlternatives the same way send_mail would"""
+    email = EmailMultiAlternatives(
+        subject=subject,
+        body=message,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        to=recipient_list,
+    )
+    if html_message:
+        email.attach_alternative(html_message, 'text/html')
+    return email
+
+class EmailDeliveryEngine:
+    """
+    Sends messages over one persistent SMTP connection.
+
+    The connection (TCP + TLS + AUTH) is opened once and reused for every
+    message in a batch; it is only re-established after a failure, with a
+    jittered backoff between attempts.
+    """
+
+    def __init__(self, max_retries=3, backend=None, **connection_kwargs):
+        self.max_retries = max_retries
+        self.backend = backend
+        self.connection_kwargs = connection_kwargs
+        self.connection = None
+        self.connects = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def open(self):
+        if self.connection is None:
+            self.connection = get_connection(self.backend, fail_silently=False, **self.connection_kwargs)
+            self.connection.open()
+            self.connects += 1
+        return self.connection
+
+    def close(self):
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except Exception:
+                pass
+            self.connection = None
+
+    def send(self, message):
+        """Send one message, reconnecting on failure; returns None or the last error"""
+        started = time.perf_counter()
+        error = self._send(message)
+        observe_email(error, time.perf_counter() - started)
+        return error
+
+    def _send(self, message):
+        error = None
+        for attempt in range(self.max_retries):
+            if attempt:
+                time.sleep(backoff_delay(attempt - 1))
+            try:
+                self.open().send_messages([message])
+                return None
+            except Exception as e:
+                error = e
+                # The session may be unusable now; start a fresh one next time
+                self.close()
+        return error
+
+    def send_batch(self, messages):
+        """Send messages in order over the shared connection; returns a list of errors (None = sent)"""
+        return [self.send(message) for message in messages]
+
 def send_email_with_retry(subject, message, recipient_list, html_message=None, max_retries=3):
     """Send email with retry mechanism"""
-    for attempt in range(max_retries):
-        try:
-            send_mail(
-                subject=subject,
-                message=message,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=recipient_list,
-                html_message=html_message,
-                fail_silently=False,
-            )
-            return True, "Email sent successfully"
-            
-        except Exception as e:
-            if attempt < max_retries - 1:
-                print(f"Email attempt {attempt + 1} failed: {str(e)}. Retrying...")
-                continue
-            else:
-                error_msg = f"Failed to send email after {max_retries} attempts: {str(e)}"
-                print(f"Full error traceback:\n{traceback.format_exc()}")
-                return False, error_msg
-    
-    return False, "Unknown error occurred"
+    with EmailDeliveryEngine(max_retries=max_retries) as engine:
+        error = engine.send(build_message(subject, message, recipient_list, html_message))
+
+    if error is None:
+        return True, "Email sent successfully"
+
+    error_msg = f"Failed to send email after {max_retries} attempts: {str(error)}"
+    print(f"Email delivery failed: {error_msg}")
+    return False, error_msg
+
+def enqueue_email(subject, message, recipient_list, html_message=None):
+    """
+    Queue an email in the outbox instead of talking to SMTP in the request.
+
+    The row is written in the caller's transaction, so it is only delivered
+    if the surrounding work (e.g. creating a login token) is committed.
+    """
+    from .models import OutgoingEmail
+    return OutgoingEmail.objects.create(
+        subject=subject,
+        body=message,
+        html_body=html_message or '',
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        recipients=list(recipient_list),
+    )
+
+def claim_due_emails(batch_size):
+    """Lease a batch of due outbox rows so concurrent workers don't send them twice"""
+    from .models import OutgoingEmail
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            OutgoingEmail.objects
+            .select_for_update(skip_locked=True)
+            .filter(status=OutgoingEmail.STATUS_PENDING, next_attempt_at__lte=now)
+            .order_by('next_attempt_at')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        OutgoingEmail.objects.filter(id__in=ids).update(
+            next_attempt_at=now + timedelta(seconds=settings.EMAIL_OUTBOX_LEASE_SECONDS)
+        )
+    return list(OutgoingEmail.objects.filter(id__in=ids).order_by('next_attempt_at'))
+
+def record_delivery_failure(email, error):
+    """Schedule the next attempt with exponential backoff, or dead-letter the email"""
+    email.attempts += 1
+    email.last_error = str(error)
+    if email.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+        email.status = email.STATUS_DEAD
+        # Never delivered, but the body may still hold a login link
+        email.body = email.html_body = ''
+    else:
+        delay = settings.EMAIL_OUTBOX_BACKOFF_SECONDS * (2 ** (email.attempts - 1))
+        email.next_attempt_at = timezone.now() + timedelta(seconds=delay)
+    email.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at', 'body', 'html_body'])
+
+def process_outbox(batch_size=50, engine=None):
+    """
+    Deliver one batch of due outbox emails; returns (sent, failed).
+
+    Pass a long-lived EmailDeliveryEngine to keep the SMTP session open
+    across batches.
+    """
+    emails = claim_due_emails(batch_size)
+    if not emails:
+        return 0, 0
+
+    own_engine = engine is None
+    engine = engine or EmailDeliveryEngine(max_retries=2)
+    try:
+        errors = engine.send_batch([
+            build_message(e.subject, e.body, e.recipients, e.html_body or None, e.from_email)
+            for e in emails
+        ])
+    finally:
+        if own_engine:
+            engine.close()
+
+    sent = failed = 0
+    for email, error in zip(emails, errors):
+        if error is not None:
+            record_delivery_failure(email, error)
+            failed += 1
+            continue
+        email.status = email.STATUS_SENT
+        email.attempts += 1
+        email.sent_at = timezone.now()
+        # Bodies can hold one-time login links; only the envelope is kept
+        email.body = email.html_body = ''
+        email.save(update_fields=['status', 'attempts', 'sent_at', 'body', 'html_body'])
+        sent += 1
+    return sent, failed
 
 def get_email_provider_settings(provider):
     """Get SMTP settings for common email providers"""
@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand
+from django.template import engines
+from django.template.loader import render_to_string
+from django.template.loaders.cached import Loader as CachedLoader
+from django.test import RequestFactory
+from files.listing import listing_context
+from files.models import UploadedFile
+from users.models import CustomUser
+import statistics
+import time
+import uuid
+
+class Command(BaseCommand):
+    help = ('Benchmark dashboard rendering at several table sizes: a full render when the listing has '
+            'changed vs a render served from the fragment cache')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', default='1000,10000,100000',
+                            help='Comma-separated table sizes (default: 1000,10000,100000)')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Cached renders timed per size; the median is reported (default: 5)')
+
+    def render(self, template, user, files, version):
+        request = RequestFactory().get('/')
+        request.user = user
+        start = time.perf_counter()
+        render_to_string(template, listing_context(files, version), request)
+        return time.perf_counter() - start
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['rows'].split(',')]
+        available = UploadedFile.objects.count()
+        cached_loader = isinstance(engines['django'].engine.template_loaders[0], CachedLoader)
+        self.stdout.write(f'📁 {available} files in the database; template loader: '
+                          f'{"cached" if cached_loader else "uncached"}')
+
+        dashboards = [
+            ('dashboard_ops.html', CustomUser(username='bench-ops', is_ops=True),
+             UploadedFile.objects.select_related('uploader', 'metadata').order_by('-uploaded_at')),
+            ('dashboard_client.html', CustomUser(username='bench-client', is_client=True),
+             UploadedFile.objects.select_related('metadata').order_by('-uploaded_at')),
+        ]
+
+        self.stdout.write(f'\n{"template":<24}{"rows":>8}{"full render":>14}{"cached":>12}{"speed-up":>10}')
+        for size in sizes:
+            if size > available:
+                self.stdout.write(self.style.WARNING(
+                    f'⚠️ Skipping {size} rows: seed more with manage.py benchmark --seed --seed-files {size}'
+                ))
+                continue
+            for template, user, files in dashboards:
+                # A version no earlier render used, as right after an upload
+                version = f'bench-{uuid.uuid4().hex}'
+                full = self.render(template, user, files[:size], version)
+                cached = statistics.median(
+                    self.render(template, user, files[:size], version) for _ in range(options['repeat'])
+                )
+                self.stdout.write(
+                    f'{template:<24}{size:>8}{full * 1000:>11.1f} ms{cached * 1000:>9.1f} ms{full / cached:>9.0f}x'
+                )
+
+        self.stdout.write(self.style.SUCCESS('✅ Dashboard render benchmark complete'))
@@ -0,0 +1,102 @@
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+from users.email_utils import EmailDeliveryEngine, build_message
+import socketserver
+import threading
+import time
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    """Minimal local SMTP server that accepts and discards every message"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, connect_delay=0.0):
+        self.connect_delay = connect_delay
+        self.messages = 0
+        self.lock = threading.Lock()
+        super().__init__(address, SMTPHandler)
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode())
+
+    def handle(self):
+        # Stands in for the TCP + TLS + AUTH cost of a real relay
+        time.sleep(self.server.connect_delay)
+        self.reply('220 localhost bench ESMTP')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors='replace').strip().upper()
+            if command.startswith(('EHLO', 'HELO')):
+                self.reply('250 localhost')
+            elif command == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                while self.rfile.readline() not in (b'.\r\n', b''):
+                    pass
+                with self.server.lock:
+                    self.server.messages += 1
+                self.reply('250 OK')
+            elif command == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('250 OK')
+
+class Command(BaseCommand):
+    help = 'Benchmark email throughput: one SMTP connection per message vs the pooled delivery engine'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=200, help='Messages sent per mode (default: 200)')
+        parser.add_argument('--host', default=None,
+                            help='Use an already running SMTP server (e.g. python -m aiosmtpd -n -l localhost:8025) '
+                                 'instead of the built-in stand-in')
+        parser.add_argument('--port', type=int, default=8025, help='Port of the SMTP server (default: 8025)')
+        parser.add_argument('--connect-delay', type=float, default=0.02,
+                            help='Simulated connection setup cost of the built-in stand-in, in seconds (default: 0.02)')
+
+    def handle(self, *args, **options):
+        server = None
+        host, port = options['host'], options['port']
+        if host is None:
+            server = SMTPStandIn(('127.0.0.1', 0), connect_delay=options['connect_delay'])
+            host, port = server.server_address
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            self.stdout.write(f'📮 SMTP stand-in listening on {host}:{port} '
+                              f'(connect delay {options["connect_delay"] * 1000:.0f} ms)')
+
+        connection_kwargs = {
+            'backend': 'django.core.mail.backends.smtp.EmailBackend',
+            'host': host, 'port': port, 'username': '', 'password': '',
+            'use_tls': False, 'use_ssl': False, 'timeout': 10,
+        }
+        messages = [
+            build_message('🔗 Benchmark login link', 'Click the link to log in.', [f'user{i}@example.com'])
+            for i in range(options['messages'])
+        ]
+
+        try:
+            # Old path: a new SMTP session for every message
+            start = time.perf_counter()
+            for message in messages:
+                connection = get_connection(fail_silently=False, **connection_kwargs)
+                connection.send_messages([message])
+            per_message = time.perf_counter() - start
+
+            # Pooled path: one persistent session for the whole batch
+            start = time.perf_counter()
+            with EmailDeliveryEngine(**connection_kwargs) as engine:
+                errors = engine.send_batch(messages)
+            pooled = time.perf_counter() - start
+        finally:
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+
+        count = len(messages)
+        failures = sum(error is not None for error in errors)
+        self.stdout.write(f'\nConnection per message: {count / per_message:8.1f} msg/s ({per_message:.2f}s)')
+        self.stdout.write(f'Pooled engine:          {count / pooled:8.1f} msg/s ({pooled:.2f}s, '
+                          f'{engine.connects} connection(s), {failures} failures)')
+        self.stdout.write(self.style.SUCCESS(f'Speed-up: {per_message / pooled:.1f}x'))
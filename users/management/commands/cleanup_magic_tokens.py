@@ -1,9 +1,11 @@
 from django.core.management.base import BaseCommand
+from django.db.models import Q
 from django.utils import timezone
+from securefiles.purge import purge_in_batches
 from users.models import MagicLoginToken
 
 class Command(BaseCommand):
-    help = 'Clean up expired magic login tokens'
+    help = 'Clean up expired and used magic login tokens in small batches'
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -12,23 +14,60 @@ class Command(BaseCommand):
             default=7,
             help='Remove tokens older than this many days (default: 7)',
         )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Rows scanned per delete statement (default: 1000)',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0.1,
+            help='Seconds to pause between batches (default: 0.1)',
+        )
+        parser.add_argument(
+            '--start-after',
+            type=int,
+            default=None,
+            help='Resume a previous run after this token id',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only count the tokens that would be removed',
+        )
 
     def handle(self, *args, **options):
-        days = options['days']
-        cutoff_date = timezone.now() - timezone.timedelta(days=days)
-        
-        # Delete expired tokens
-        expired_tokens = MagicLoginToken.objects.filter(expires_at__lt=timezone.now())
-        expired_count = expired_tokens.count()
-        expired_tokens.delete()
-        
-        # Delete old tokens (used or unused)
-        old_tokens = MagicLoginToken.objects.filter(created_at__lt=cutoff_date)
-        old_count = old_tokens.count()
-        old_tokens.delete()
-        
-        self.stdout.write(
-            self.style.SUCCESS(
-                f'Successfully cleaned up {expired_count} expired tokens and {old_count} old tokens'
-            )
+        now = timezone.now()
+        cutoff_date = now - timezone.timedelta(days=options['days'])
+        dry_run = options['dry_run']
+
+        # Expired or used tokens can never log anyone in; old ones go regardless
+        stale_tokens = MagicLoginToken.objects.filter(
+            Q(expires_at__lt=now) | Q(is_used=True) | Q(created_at__lt=cutoff_date)
         )
+
+        def progress(last_pk, affected, total):
+            verb = 'would remove' if dry_run else 'removed'
+            self.stdout.write(f'  up to id {last_pk}: {verb} {affected} ({total} so far)')
+
+        try:
+            total, last_pk = purge_in_batches(
+                stale_tokens,
+                batch_size=options['batch_size'],
+                sleep=options['sleep'],
+                start_after=options['start_after'],
+                dry_run=dry_run,
+                progress=progress,
+            )
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('\nInterrupted. Re-run with --start-after set to the last id shown to resume.'))
+            return
+
+        if dry_run:
+            self.stdout.write(self.style.SUCCESS(f'Dry run: {total} tokens would be removed'))
+        else:
+            self.stdout.write(
+                self.style.SUCCESS(f'Successfully cleaned up {total} expired, used or old tokens')
+            )
@@ -0,0 +1,62 @@
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from securefiles.purge import purge_in_batches
+
+class Command(BaseCommand):
+    help = 'Delete expired sessions from django_session in small batches (a batched clearsessions)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Rows scanned per delete statement (default: 1000)',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0.1,
+            help='Seconds to pause between batches (default: 0.1)',
+        )
+        parser.add_argument(
+            '--start-after',
+            default=None,
+            help='Resume a previous run after this session key',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only count the sessions that would be removed',
+        )
+
+    def handle(self, *args, **options):
+        if settings.SESSION_TIER not in ('db', 'cached_db'):
+            self.stdout.write(f'ℹ️ SESSION_TIER={settings.SESSION_TIER} keeps no session rows; nothing to do')
+            return
+
+        dry_run = options['dry_run']
+        expired = Session.objects.filter(expire_date__lt=timezone.now())
+
+        def progress(last_pk, affected, total):
+            verb = 'would remove' if dry_run else 'removed'
+            self.stdout.write(f'  up to key {last_pk}: {verb} {affected} ({total} so far)')
+
+        try:
+            total, last_pk = purge_in_batches(
+                expired,
+                batch_size=options['batch_size'],
+                sleep=options['sleep'],
+                start_after=options['start_after'],
+                dry_run=dry_run,
+                progress=progress,
+            )
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('\nInterrupted. Re-run with --start-after set to the last key shown to resume.'))
+            return
+
+        if dry_run:
+            self.stdout.write(self.style.SUCCESS(f'Dry run: {total} expired sessions would be removed'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'🧹 Removed {total} expired sessions'))
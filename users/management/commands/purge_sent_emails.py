@@ -0,0 +1,78 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+from securefiles.purge import purge_in_batches
+from users.models import OutgoingEmail
+
+class Command(BaseCommand):
+    help = 'Remove delivered and old dead-letter emails from the outbox in small batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=7,
+            help='Remove emails sent more than this many days ago (default: 7)',
+        )
+        parser.add_argument(
+            '--dead-days',
+            type=int,
+            default=30,
+            help='Remove dead letters queued more than this many days ago (default: 30)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Rows scanned per delete statement (default: 1000)',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0.1,
+            help='Seconds to pause between batches (default: 0.1)',
+        )
+        parser.add_argument(
+            '--start-after',
+            type=int,
+            default=None,
+            help='Resume a previous run after this email id',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only count the emails that would be removed',
+        )
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        dry_run = options['dry_run']
+
+        # Dead letters keep their body (and any login link in it) so they can
+        # be requeued; the links inside have long expired by the cutoff
+        stale_emails = OutgoingEmail.objects.filter(
+            Q(status=OutgoingEmail.STATUS_SENT, sent_at__lt=now - timezone.timedelta(days=options['days']))
+            | Q(status=OutgoingEmail.STATUS_DEAD, created_at__lt=now - timezone.timedelta(days=options['dead_days']))
+        )
+
+        def progress(last_pk, affected, total):
+            verb = 'would remove' if dry_run else 'removed'
+            self.stdout.write(f'  up to id {last_pk}: {verb} {affected} ({total} so far)')
+
+        try:
+            total, last_pk = purge_in_batches(
+                stale_emails,
+                batch_size=options['batch_size'],
+                sleep=options['sleep'],
+                start_after=options['start_after'],
+                dry_run=dry_run,
+                progress=progress,
+            )
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('\nInterrupted. Re-run with --start-after set to the last id shown to resume.'))
+            return
+
+        if dry_run:
+            self.stdout.write(self.style.SUCCESS(f'Dry run: {total} emails would be removed'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'🧹 Removed {total} sent or dead-letter emails'))
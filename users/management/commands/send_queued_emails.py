@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand
+from prometheus_client import start_http_server
+from users.email_utils import process_outbox, EmailDeliveryEngine
+import time
+
+class Command(BaseCommand):
+    help = 'Deliver queued emails from the outbox with retries, backoff and dead-lettering'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep running and poll the outbox instead of exiting when it is drained',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=2.0,
+            help='Seconds to wait between polls when the outbox is empty (default: 2)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=50,
+            help='Number of emails claimed per batch (default: 50)',
+        )
+        parser.add_argument(
+            '--metrics-port',
+            type=int,
+            help='Serve Prometheus metrics (send outcomes and latency) on this port',
+        )
+
+    def handle(self, *args, **options):
+        if options['metrics_port']:
+            start_http_server(options['metrics_port'])
+            self.stdout.write(f'📈 Metrics on port {options["metrics_port"]}')
+
+        total_sent = total_failed = 0
+        # One SMTP session is shared by consecutive batches and dropped
+        # whenever the outbox goes idle
+        engine = EmailDeliveryEngine(max_retries=2)
+        try:
+            while True:
+                sent, failed = process_outbox(batch_size=options['batch_size'], engine=engine)
+                total_sent += sent
+                total_failed += failed
+                if sent or failed:
+                    self.stdout.write(f'📧 Sent {sent}, failed {failed}')
+                    continue
+                engine.close()
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+        finally:
+            engine.close()
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Outbox drained: {total_sent} sent, {total_failed} failed')
+        )
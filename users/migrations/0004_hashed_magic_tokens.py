@@ -0,0 +1,44 @@
+# Generated by Django 5.2.3 on 2026-10-18 01:02
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def hash_existing_tokens(apps, schema_editor):
+    # Outstanding links keep working: their tokens are replaced by the hash
+    MagicLoginToken = apps.get_model("users", "MagicLoginToken")
+    for token in MagicLoginToken.objects.only("id", "token_hash").iterator():
+        token.token_hash = hashlib.sha256(token.token_hash.encode()).hexdigest()
+        token.save(update_fields=["token_hash"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0003_outgoingemail"),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name="magiclogintoken",
+            old_name="token",
+            new_name="token_hash",
+        ),
+        migrations.RunPython(hash_existing_tokens, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="magiclogintoken",
+            name="token_hash",
+            field=models.CharField(max_length=64, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name="magiclogintoken",
+            index=models.Index(
+                fields=["user", "is_used"], name="magictoken_user_used_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="magiclogintoken",
+            index=models.Index(fields=["expires_at"], name="magictoken_expires_idx"),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.3 on 2026-10-18 02:10
+
+from django.db import migrations
+
+
+def blank_sent_bodies(apps, schema_editor):
+    # Emails sent before bodies were dropped on delivery still hold login links
+    OutgoingEmail = apps.get_model("users", "OutgoingEmail")
+    OutgoingEmail.objects.filter(status="sent").update(body="", html_body="")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0004_hashed_magic_tokens"),
+    ]
+
+    operations = [
+        migrations.RunPython(blank_sent_bodies, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.3 on 2026-10-18 03:20
+
+from django.db import migrations
+
+
+def blank_dead_bodies(apps, schema_editor):
+    # Dead letters from before bodies were dropped on dead-lettering
+    OutgoingEmail = apps.get_model("users", "OutgoingEmail")
+    OutgoingEmail.objects.filter(status="dead").update(body="", html_body="")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0005_blank_sent_email_bodies"),
+    ]
+
+    operations = [
+        migrations.RunPython(blank_dead_bodies, migrations.RunPython.noop),
+    ]
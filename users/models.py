@@ -2,7 +2,6 @@ from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.utils import timezone
 from datetime import timedelta
-import uuid
 
 class CustomUser(AbstractUser):
     is_ops = models.BooleanField(default=False)
@@ -14,7 +13,8 @@ class CustomUser(AbstractUser):
 
 class MagicLoginToken(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
-    token = models.CharField(max_length=100, unique=True, default=uuid.uuid4)
+    # SHA-256 of the token sent by email; the token itself is never stored
+    token_hash = models.CharField(max_length=64, unique=True)
     created_at = models.DateTimeField(auto_now_add=True)
     expires_at = models.DateTimeField()
     is_used = models.BooleanField(default=False)
@@ -23,6 +23,10 @@ class MagicLoginToken(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'is_used'], name='magictoken_user_used_idx'),
+            models.Index(fields=['expires_at'], name='magictoken_expires_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         if not self.expires_at:
@@ -36,3 +40,34 @@ class MagicLoginToken(models.Model):
     def __str__(self):
         return f"Magic token for {self.user.username} - {'Valid' if self.is_valid() else 'Invalid'}"
 
+class OutgoingEmail(models.Model):
+    """Transactional outbox: rendered emails waiting for the send_queued_emails worker"""
+    STATUS_PENDING = 'pending'
+    STATUS_SENT = 'sent'
+    STATUS_DEAD = 'dead'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_SENT, 'Sent'),
+        (STATUS_DEAD, 'Dead letter'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(blank=True)
+    from_email = models.CharField(max_length=255)
+    recipients = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} to {', '.join(self.recipients)} - {self.get_status_display()}"
@@ -1,5 +1,8 @@
 from rest_framework.permissions import BasePermission
 
+# For JWT-authenticated requests request.user is a TokenUser and the role
+# flags below are read from the token's claims, not from the database
+
 class IsOpsUser(BasePermission):
     def has_permission(self, request, view):
         return request.user.is_authenticated and request.user.is_ops
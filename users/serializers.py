@@ -1,4 +1,7 @@
 from rest_framework import serializers
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.tokens import RefreshToken
 from .models import CustomUser
 from django.contrib.auth import authenticate
 
@@ -28,3 +31,25 @@ class LoginSerializer(serializers.Serializer):
         if user and user.is_active:
             return user
         raise serializers.ValidationError("Invalid credentials or unverified email")
+
+def add_role_claims(token, user):
+    """Put the role flags in a JWT so permissions can be checked without loading the user"""
+    token['username'] = user.username
+    token['is_ops'] = user.is_ops
+    token['is_client'] = user.is_client
+    return token
+
+class RoleTokenObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        return add_role_claims(super().get_token(user), user)
+
+class RoleTokenRefreshSerializer(TokenRefreshSerializer):
+    """Re-read the user's roles on refresh so role changes reach new access tokens"""
+
+    def validate(self, attrs):
+        refresh = RefreshToken(attrs['refresh'])
+        user = CustomUser.objects.filter(pk=refresh.get('user_id'), is_active=True).first()
+        if user is None:
+            raise AuthenticationFailed("No active account found for the given token.", "no_active_account")
+        return {'access': str(add_role_claims(refresh.access_token, user))}
@@ -0,0 +1,53 @@
+from django.conf import settings
+from django.contrib.sessions.backends import signed_cookies
+from django.core.cache import cache
+import secrets
+
+# Random id kept in the session data; survives every re-signing of the cookie
+SESSION_ID_KEY = '_sid'
+
+
+def _revoked_key(session_id):
+    return f"sessions:revoked:{session_id}"
+
+
+class SessionStore(signed_cookies.SessionStore):
+    """
+    Signed-cookie sessions that can still be logged out.
+
+    The session lives in the cookie, so reading it needs no storage at all.
+    Each session carries a random id; logging out (or logging in, which
+    issues a new id) records the old id in the cache until the cookie would
+    have expired anyway, and any copy of a cookie with that id is refused.
+    Use with a cache shared by all workers.
+    """
+
+    def load(self):
+        data = super().load()
+        session_id = data.get(SESSION_ID_KEY)
+        if session_id and cache.get(_revoked_key(session_id)):
+            self.create()
+            return {}
+        return data
+
+    def save(self, must_create=False):
+        self._session.setdefault(SESSION_ID_KEY, secrets.token_urlsafe(16))
+        super().save(must_create)
+
+    def _revoke(self):
+        session_id = self._session.get(SESSION_ID_KEY)
+        if session_id:
+            cache.set(_revoked_key(session_id), True, settings.SESSION_COOKIE_AGE)
+
+    def flush(self):
+        self._revoke()
+        super().flush()
+
+    async def aflush(self):
+        self._revoke()
+        await super().aflush()
+
+    def cycle_key(self):
+        self._revoke()
+        self._session.pop(SESSION_ID_KEY, None)
+        super().cycle_key()
@@ -1,3 +1,426 @@
-from django.test import TestCase
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core import mail
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.utils import timezone
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import mock
+import io
+import smtplib
+import shutil
+import tempfile
+import time
 
-# Create your tests here.
+from files.models import FileMetadata
+from files.storage import create_uploaded_file, store_blob
+from securefiles.testing import QueryBudgetMixin
+from .email_utils import EmailDeliveryEngine, backoff_delay, build_message, enqueue_email, process_outbox
+from .models import CustomUser, MagicLoginToken, OutgoingEmail
+from .sessions import SessionStore
+from .throttling import SlidingWindow
+from .utils import consume_magic_token, create_magic_login_token, hash_token, send_magic_login_email
+
+DOCX = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def tearDownModule():
+    shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class DashboardQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """The dashboards cost the same number of queries however many files there are"""
+
+    def setUp(self):
+        cache.clear()
+        self.ops = CustomUser.objects.create_user('ops', 'ops@example.com', 'pw', is_ops=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            for n in range(30):
+                blob = store_blob(ContentFile(f'report {n}'.encode()))
+                file = create_uploaded_file(self.ops, blob, f'report-{n}.docx', DOCX)
+                FileMetadata.objects.create(file=file, title=f'Report {n}')
+
+    def test_dashboard_ops_query_budget(self):
+        self.client.force_login(self.ops)
+        # Session, user, listing version and one joined query for the table
+        with self.assertMaxQueries(4):
+            response = self.client.get('/dashboard-ops/')
+        self.assertContains(response, 'report-29.docx')
+        # The table comes from the fragment cache
+        with self.assertMaxQueries(3):
+            self.client.get('/dashboard-ops/')
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class DashboardClientTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.ops = CustomUser.objects.create_user('ops', 'ops@example.com', 'pw', is_ops=True)
+        self.user = CustomUser.objects.create_user('client', 'client@example.com', 'pw', is_client=True)
+        self.upload('first.docx')
+        self.client.force_login(self.user)
+
+    def upload(self, name):
+        with self.captureOnCommitCallbacks(execute=True):
+            create_uploaded_file(self.ops, store_blob(ContentFile(name.encode())), name, DOCX)
+
+    def test_unchanged_dashboard_is_not_modified(self):
+        response = self.client.get('/dashboard-client/')
+        self.assertContains(response, 'first.docx')
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        response = self.client.get('/dashboard-client/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_upload_changes_the_page(self):
+        etag = self.client.get('/dashboard-client/')['ETag']
+        self.upload('second.docx')
+        response = self.client.get('/dashboard-client/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        # The cached table was for the previous listing version
+        self.assertContains(response, 'second.docx')
+
+    def test_profile_name_change_changes_the_page(self):
+        etag = self.client.get('/dashboard-client/')['ETag']
+        self.user.first_name = 'Ada'
+        self.user.save()
+        response = self.client.get('/dashboard-client/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        # Another user's copy is never theirs
+        other = CustomUser.objects.create_user('other', 'other@example.com', 'pw', is_client=True)
+        self.client.force_login(other)
+        self.assertEqual(self.client.get('/dashboard-client/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+
+@override_settings(
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+)
+class MagicLoginTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user('client', 'client@example.com', 'pw', is_client=True)
+        self.request = RequestFactory().get('/')
+
+    def test_token_is_stored_hashed_and_used_once(self):
+        # With UPDATE ... RETURNING and with the portable fallback
+        for returning in (True, False):
+            with self.subTest(returning=returning), mock.patch('users.utils._can_update_returning', return_value=returning):
+                raw = create_magic_login_token(self.user, self.request).raw_token
+                self.assertFalse(MagicLoginToken.objects.filter(token_hash=raw).exists())
+                self.assertTrue(MagicLoginToken.objects.filter(token_hash=hash_token(raw)).exists())
+
+                self.assertEqual(consume_magic_token(raw), (self.user, None))
+                user, error = consume_magic_token(raw)
+                self.assertIsNone(user)
+                self.assertIn('already used', error)
+
+    def test_expired_unknown_and_superseded_tokens(self):
+        first = create_magic_login_token(self.user, self.request).raw_token
+        second = create_magic_login_token(self.user, self.request)
+        # Requesting a new link invalidates the previous one
+        self.assertIn('already used', consume_magic_token(first)[1])
+
+        MagicLoginToken.objects.filter(pk=second.pk).update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertIn('expired', consume_magic_token(second.raw_token)[1])
+        self.assertIn('Invalid', consume_magic_token('no-such-token')[1])
+
+    def test_magic_login_view_logs_in_once(self):
+        raw = create_magic_login_token(self.user, self.request).raw_token
+        self.assertRedirects(self.client.get(f'/magic-login/{raw}/'), '/dashboard-client/', fetch_redirect_response=False)
+        self.client.logout()
+        self.assertRedirects(self.client.get(f'/magic-login/{raw}/'), '/', fetch_redirect_response=False)
+
+    def test_sent_email_does_not_keep_the_link(self):
+        self.assertTrue(send_magic_login_email(self.user, self.request)[0])
+        self.assertEqual(process_outbox(), (1, 0))
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn('/magic-login/', mail.outbox[0].body)
+        email = OutgoingEmail.objects.get()
+        self.assertEqual(email.status, OutgoingEmail.STATUS_SENT)
+        self.assertEqual((email.body, email.html_body), ('', ''))
+
+    def test_purge_sent_emails(self):
+        old = timezone.now() - timedelta(days=8)
+        OutgoingEmail.objects.create(subject='old', body='', from_email='a@b.c', recipients=['x@y.z'],
+                                     status=OutgoingEmail.STATUS_SENT, sent_at=old)
+        OutgoingEmail.objects.create(subject='recent', body='', from_email='a@b.c', recipients=['x@y.z'],
+                                     status=OutgoingEmail.STATUS_SENT, sent_at=timezone.now())
+        OutgoingEmail.objects.create(subject='pending', body='link', from_email='a@b.c', recipients=['x@y.z'])
+
+        call_command('purge_sent_emails', sleep=0, stdout=io.StringIO())
+        self.assertEqual(sorted(OutgoingEmail.objects.values_list('subject', flat=True)), ['pending', 'recent'])
+
+    def test_cleanup_magic_tokens(self):
+        live = create_magic_login_token(self.user, self.request)
+        other = CustomUser.objects.create_user('other', 'other@example.com', 'pw', is_client=True)
+        used = create_magic_login_token(other, self.request)
+        consume_magic_token(used.raw_token)
+        expired = [create_magic_login_token(CustomUser.objects.create_user(f'u{n}', f'u{n}@example.com', 'pw'), self.request)
+                   for n in range(3)]
+        MagicLoginToken.objects.filter(pk__in=[t.pk for t in expired]).update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        out = io.StringIO()
+        call_command('cleanup_magic_tokens', batch_size=2, sleep=0, dry_run=True, stdout=out)
+        self.assertIn('4 tokens would be removed', out.getvalue())
+        self.assertEqual(MagicLoginToken.objects.count(), 5)
+
+        call_command('cleanup_magic_tokens', batch_size=2, sleep=0, stdout=io.StringIO())
+        self.assertEqual(list(MagicLoginToken.objects.values_list('pk', flat=True)), [live.pk])
+        self.assertEqual(consume_magic_token(live.raw_token), (self.user, None))
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ThrottlingTests(TestCase):
+    rates = {'login_ip': '3/minute', 'login_account': '2/minute', 'signup_ip': '100/minute', 'signup_account': '100/minute'}
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.dict('django.conf.settings.REST_FRAMEWORK', {'DEFAULT_THROTTLE_RATES': self.rates})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_limit_slides_over_the_previous_window(self):
+        limit = SlidingWindow('login_ip')
+        with mock.patch('users.throttling.time.time', return_value=60.0):
+            self.assertEqual([limit.consume('1.2.3.4') for _ in range(3)], [0, 0, 0])
+            self.assertEqual(limit.consume('1.2.3.4'), 60)
+            # Rejected requests are refunded
+            self.assertEqual(cache.get(limit.cache_key('1.2.3.4', 1)), 3)
+            self.assertEqual(limit.consume('5.6.7.8'), 0)
+        # A third of the previous window has slid out: one slot is free
+        with mock.patch('users.throttling.time.time', return_value=140.0):
+            self.assertEqual(limit.consume('1.2.3.4'), 0)
+            self.assertAlmostEqual(limit.consume('1.2.3.4'), 20)
+        with mock.patch('users.throttling.time.time', return_value=180.0):
+            self.assertEqual(limit.consume('1.2.3.4'), 0)
+
+    def test_concurrent_requests_never_exceed_the_limit(self):
+        limit = SlidingWindow('login_ip')
+        with ThreadPoolExecutor(8) as pool:
+            waits = list(pool.map(lambda _: limit.consume('1.2.3.4'), range(40)))
+        self.assertEqual(waits.count(0), 3)
+
+    def test_login_form_and_api_answer_429(self):
+        for _ in range(2):
+            self.client.post('/client-login/', {'email': 'a@example.com', 'password': 'wrong'})
+        response = self.client.post('/client-login/', {'email': 'A@example.com ', 'password': 'wrong'})
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(int(response['Retry-After']) > 0)
+
+        # Same IP, different account: the per-IP limit still applies
+        response = self.client.post('/api/token/', {'username': 'b@example.com', 'password': 'wrong'})
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+    def test_api_body_that_is_not_an_object(self):
+        for url in ('/api/token/', '/api/login/', '/api/signup/'):
+            for body in (['a@example.com'], 'a@example.com'):
+                with self.subTest(url=url, body=body):
+                    response = self.client.post(url, body, content_type='application/json')
+                    self.assertEqual(response.status_code, 400)
+
+    def test_login_api_is_open_and_throttled(self):
+        body = {'username': 'client', 'password': 'wrong'}
+        CustomUser.objects.create_user('client', 'client@example.com', 'pw', is_client=True)
+        self.assertEqual(self.client.post('/api/login/', body).status_code, 400)
+        self.assertEqual(self.client.post('/api/login/', {'username': 'client', 'password': 'pw'}).status_code, 200)
+        self.assertEqual(self.client.post('/api/login/', body).status_code, 429)
+
+
+@override_settings(
+    SESSION_TIER='signed_cookies', SESSION_ENGINE='users.sessions',
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+)
+class SignedCookieSessionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user('client', 'client@example.com', 'pw', is_client=True)
+
+    def logged_in_cookie(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get('/dashboard-client/').status_code, 200)
+        return self.client.cookies[settings.SESSION_COOKIE_NAME].value
+
+    def replay(self, cookie):
+        client = Client()
+        client.cookies[settings.SESSION_COOKIE_NAME] = cookie
+        return client.get('/dashboard-client/')
+
+    def test_session_needs_no_storage(self):
+        cookie = self.logged_in_cookie()
+        # Session and user are read from the cookie and the users table only
+        with self.assertNumQueries(2):
+            self.assertEqual(self.replay(cookie).status_code, 200)
+
+    def test_cookie_replayed_after_logout_is_refused(self):
+        cookie = self.logged_in_cookie()
+        self.client.get('/logout/')
+        response = self.replay(cookie)
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response['Location'].startswith('/login/'))
+
+    def test_login_revokes_the_previous_session(self):
+        store = SessionStore()
+        store['cart'] = 'kept out of the new session'
+        store.save()
+        old_key = store.session_key
+        store.cycle_key()
+        self.assertNotEqual(store.session_key, old_key)
+        self.assertEqual(SessionStore(old_key).load(), {})
+        self.assertEqual(SessionStore(store.session_key).load()['cart'], 'kept out of the new session')
+
+    def test_expired_cookie_is_refused(self):
+        cookie = self.logged_in_cookie()
+        later = time.time() + settings.SESSION_COOKIE_AGE + 1
+        with mock.patch('django.core.signing.time.time', return_value=later):
+            self.assertEqual(self.replay(cookie).status_code, 302)
+
+
+class PurgeExpiredSessionsTests(TestCase):
+    @override_settings(SESSION_TIER='db')
+    def test_expired_rows_are_deleted(self):
+        now = timezone.now()
+        for n in range(3):
+            Session.objects.create(session_key=f'expired{n}', session_data='', expire_date=now - timedelta(seconds=1))
+        Session.objects.create(session_key='live', session_data='', expire_date=now + timedelta(days=1))
+
+        out = io.StringIO()
+        call_command('purge_expired_sessions', batch_size=2, sleep=0, dry_run=True, stdout=out)
+        self.assertIn('3 expired sessions would be removed', out.getvalue())
+        self.assertEqual(Session.objects.count(), 4)
+
+        call_command('purge_expired_sessions', batch_size=2, sleep=0, stdout=io.StringIO())
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), ['live'])
+
+    @override_settings(SESSION_TIER='signed_cookies')
+    def test_nothing_to_do_without_session_rows(self):
+        out = io.StringIO()
+        call_command('purge_expired_sessions', stdout=out)
+        self.assertIn('nothing to do', out.getvalue())
+
+
+@override_settings(
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    EMAIL_OUTBOX_MAX_ATTEMPTS=3, EMAIL_OUTBOX_BACKOFF_SECONDS=60,
+)
+class OutboxRetryTests(TestCase):
+    def setUp(self):
+        self.email = enqueue_email('Your login link', 'https://example.com/magic-login/secret/', ['a@example.com'],
+                                   html_message='<a href="https://example.com/magic-login/secret/">Log in</a>')
+        patcher = mock.patch('users.email_utils.time.sleep')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_due(self):
+        OutgoingEmail.objects.filter(pk=self.email.pk).update(next_attempt_at=timezone.now())
+
+    def test_backoff_then_dead_letter(self):
+        failure = mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages',
+                             side_effect=OSError('connection refused'))
+        with failure:
+            started = timezone.now()
+            self.assertEqual(process_outbox(), (0, 1))
+            email = OutgoingEmail.objects.get()
+            self.assertEqual((email.status, email.attempts, email.last_error), ('pending', 1, 'connection refused'))
+            self.assertIn('magic-login', email.body)
+            # 60 seconds after the first failure, then doubled
+            self.assertAlmostEqual((email.next_attempt_at - started).total_seconds(), 60, delta=5)
+            self.assertEqual(process_outbox(), (0, 0))
+
+            self.make_due()
+            process_outbox()
+            email.refresh_from_db()
+            self.assertAlmostEqual((email.next_attempt_at - timezone.now()).total_seconds(), 120, delta=5)
+
+            self.make_due()
+            process_outbox()
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), ('dead', 3))
+        self.assertEqual((email.body, email.html_body), ('', ''))
+        self.assertEqual(email.last_error, 'connection refused')
+        self.make_due()
+        self.assertEqual(process_outbox(), (0, 0))
+        self.assertEqual(mail.outbox, [])
+
+    def test_retry_succeeds(self):
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=OSError('down')):
+            process_outbox()
+        self.make_due()
+        self.assertEqual(process_outbox(), (1, 0))
+        self.assertEqual(mail.outbox[0].to, ['a@example.com'])
+        self.assertEqual(OutgoingEmail.objects.get().attempts, 2)
+
+
+class FlakyBackend(BaseEmailBackend):
+    """Test SMTP backend: opening or sending fails while ``failures`` lists errors to raise"""
+    failures = []
+    opened = []
+    sent = []
+
+    def open(self):
+        FlakyBackend.opened.append(self)
+        if FlakyBackend.failures and FlakyBackend.failures[0] == 'open':
+            FlakyBackend.failures.pop(0)
+            raise ConnectionRefusedError('connect failed')
+
+    def send_messages(self, messages):
+        if FlakyBackend.failures:
+            raise FlakyBackend.failures.pop(0)
+        FlakyBackend.sent.extend(messages)
+        return len(messages)
+
+
+class DeliveryEngineTests(TestCase):
+    backend = 'users.tests.FlakyBackend'
+
+    def setUp(self):
+        FlakyBackend.failures, FlakyBackend.opened, FlakyBackend.sent = [], [], []
+        patcher = mock.patch('users.email_utils.time.sleep')
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def message(self, n):
+        return build_message(f'Message {n}', 'body', ['a@example.com'])
+
+    def test_one_connection_for_a_batch(self):
+        with EmailDeliveryEngine(backend=self.backend) as engine:
+            self.assertEqual(engine.send_batch([self.message(n) for n in range(5)]), [None] * 5)
+        self.assertEqual((engine.connects, len(FlakyBackend.sent)), (1, 5))
+        self.sleep.assert_not_called()
+
+    def test_reconnects_after_a_failure_with_jittered_backoff(self):
+        FlakyBackend.failures = [smtplib.SMTPServerDisconnected('gone'), 'open']
+        with mock.patch('users.email_utils.random.uniform', return_value=0.25) as jitter, \
+                EmailDeliveryEngine(max_retries=3, backend=self.backend) as engine:
+            errors = engine.send_batch([self.message(0), self.message(1)])
+        self.assertEqual(errors, [None, None])
+        # Dropped session, failed reconnect, then a fresh session for the rest
+        self.assertEqual(engine.connects, 2)
+        self.assertEqual(len(FlakyBackend.opened), 3)
+        self.assertEqual([m.subject for m in FlakyBackend.sent], ['Message 0', 'Message 1'])
+        self.assertEqual(jitter.call_args_list, [mock.call(0, 0.5), mock.call(0, 1.0)])
+        self.assertEqual(self.sleep.call_args_list, [mock.call(0.25), mock.call(0.25)])
+
+    def test_gives_up_after_max_retries(self):
+        FlakyBackend.failures = [smtplib.SMTPException('no')] * 3
+        with EmailDeliveryEngine(max_retries=2, backend=self.backend) as engine:
+            error = engine.send(self.message(0))
+            self.assertIsInstance(error, smtplib.SMTPException)
+            self.assertIsNone(engine.connection)
+            # The next message gets a new connection
+            FlakyBackend.failures = []
+            self.assertIsNone(engine.send(self.message(1)))
+        self.assertEqual(engine.connects, 3)
+
+    def test_backoff_is_capped(self):
+        with mock.patch('users.email_utils.random.uniform', side_effect=lambda low, high: high):
+            self.assertEqual([backoff_delay(n, base=1, cap=5) for n in range(5)], [1, 2, 4, 5, 5])
@@ -0,0 +1,151 @@
+from collections.abc import Mapping
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from functools import wraps
+from rest_framework.throttling import BaseThrottle
+import hashlib
+import math
+import time
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """'5/hour' -> (5, 3600), in the same notation as DRF throttle rates"""
+    count, period = rate.split('/')
+    return int(count), PERIODS[period[0]]
+
+
+class SlidingWindow:
+    """
+    Rate limit kept in the shared cache, ``count`` requests per ``period``.
+
+    Requests are counted per fixed window with atomic ``add``/``incr``, and
+    the previous window's count is weighted by how much of it still
+    overlaps the sliding period. Concurrent workers can never both take the
+    last slot, and rejected requests are refunded so they cost nothing.
+    """
+
+    def __init__(self, scope):
+        self.scope = scope
+        rate = settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'].get(scope)
+        self.capacity = self.period = None
+        if rate is not None:
+            self.capacity, self.period = parse_rate(rate)
+
+    def cache_key(self, ident, window):
+        return f'throttle:{self.scope}:{ident}:{window}'
+
+    def increment(self, key, delta=1):
+        # The previous window is still read during the next one
+        cache.add(key, 0, 2 * self.period)
+        try:
+            return cache.incr(key, delta)
+        except ValueError:
+            # Expired between add and incr
+            cache.add(key, delta, 2 * self.period)
+            return delta
+
+    def consume(self, ident):
+        """Count one request for ``ident``; returns 0 when allowed, else seconds to wait"""
+        if self.capacity is None:
+            return 0
+        window, offset = divmod(time.time(), self.period)
+        key = self.cache_key(ident, int(window))
+        used = self.increment(key)
+        previous = cache.get(self.cache_key(ident, int(window) - 1), 0)
+        overlap = 1 - offset / self.period
+        if previous * overlap + used <= self.capacity:
+            return 0
+        self.increment(key, -1)
+        used -= 1
+        if previous and used < self.capacity:
+            # Until enough of the previous window has slid out
+            return max(1, (1 - (self.capacity - used - 1) / previous) * self.period - offset)
+        return self.period - offset
+
+
+def client_ip(request):
+    """Client address, honouring X-Forwarded-For from NUM_PROXIES trusted proxies"""
+    return BaseThrottle().get_ident(request)
+
+
+def account_ident(value):
+    """Cache-safe identifier for a submitted email or username"""
+    value = (value or '').strip().lower()
+    return hashlib.sha256(value.encode()).hexdigest() if value else None
+
+
+def check_throttles(request, scope, account):
+    """
+    Count against the per-IP limit, then the per-account limit of ``scope``.
+
+    Returns 0 when the request may proceed, else seconds to wait. Only reads
+    the request and the cache.
+    """
+    wait = SlidingWindow(f'{scope}_ip').consume(client_ip(request))
+    if wait:
+        return wait
+    ident = account_ident(account)
+    if ident is None:
+        return 0
+    return SlidingWindow(f'{scope}_account').consume(ident)
+
+
+def throttle_login(scope):
+    """Answer over-limit POSTs to a login form with a 429 before the view runs"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method == 'POST':
+                wait = check_throttles(request, scope, request.POST.get('email'))
+                if wait:
+                    response = HttpResponse(
+                        'Too many login attempts. Please try again later.', status=429, content_type='text/plain'
+                    )
+                    response.headers['Retry-After'] = str(math.ceil(wait))
+                    return response
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class SlidingWindowThrottle(BaseThrottle):
+    """
+    DRF throttle backed by SlidingWindow.
+
+    The view names the rate group with ``throttle_scope``; the rate used is
+    ``<throttle_scope>_<kind>`` from DEFAULT_THROTTLE_RATES. Keyed on the
+    client IP unless a subclass overrides ``get_ident_for``.
+    """
+    kind = 'ip'
+
+    def get_ident_for(self, request):
+        return self.get_ident(request)
+
+    def allow_request(self, request, view):
+        ident = self.get_ident_for(request)
+        if ident is None:
+            return True
+        self.wait_seconds = SlidingWindow(f'{view.throttle_scope}_{self.kind}').consume(ident)
+        return not self.wait_seconds
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class IPRateThrottle(SlidingWindowThrottle):
+    kind = 'ip'
+
+
+class AccountRateThrottle(SlidingWindowThrottle):
+    """Keyed on the email (or username) the request is about"""
+    kind = 'account'
+
+    def get_ident_for(self, request):
+        data = request.data
+        if not isinstance(data, Mapping):
+            # Not an object: there is no account to key on, the view rejects it
+            return None
+        return account_ident(data.get('email') or data.get('username'))
@@ -1,7 +1,7 @@
 from django.urls import path
 from .views import (
     user_login, user_logout, dashboard_ops, dashboard_client, 
-    ClientSignupView, VerifyEmailView, LoginView,
+    ClientSignupView, VerifyEmailView, LoginView, JWTObtainView, JWTRefreshView,
     home, ops_register, client_register, ops_login, client_login, magic_login, request_magic_login
 )
 
@@ -29,4 +29,6 @@ urlpatterns = [
     path('api/signup/', ClientSignupView.as_view(), name='client_signup'),
     path('api/verify-email/<str:token>/', VerifyEmailView.as_view(), name='verify_email'),
     path('api/login/', LoginView.as_view(), name='api_login'),
+    path('api/token/', JWTObtainView.as_view(), name='token_obtain'),
+    path('api/token/refresh/', JWTRefreshView.as_view(), name='token_refresh'),
 ]
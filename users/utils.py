@@ -4,9 +4,11 @@ from django.utils.html import strip_tags
 from django.conf import settings
 from django.urls import reverse
 from django.utils import timezone
-from .models import MagicLoginToken
-from .email_utils import send_email_with_retry
-import uuid
+from django.db import connection, transaction
+from .models import CustomUser, MagicLoginToken
+from .email_utils import enqueue_email
+import hashlib
+import secrets
 
 def get_client_ip(request):
     """Get the client's IP address from the request"""
@@ -21,18 +23,31 @@ def get_user_agent(request):
     """Get the user agent from the request"""
     return request.META.get('HTTP_USER_AGENT', '')
 
+def hash_token(token_string):
+    """Hash stored in place of a magic login token"""
+    return hashlib.sha256(token_string.encode()).hexdigest()
+
 def create_magic_login_token(user, request):
-    """Create a magic login token for the user"""
-    # Invalidate any existing unused tokens for this user
-    MagicLoginToken.objects.filter(user=user, is_used=False).update(is_used=True)
+    """
+    Create a magic login token for the user.
+
+    Only the hash is saved; the token itself is available on the returned
+    object as ``raw_token`` until it has been emailed.
+    """
+    # Invalidate any still-valid unused tokens for this user
+    MagicLoginToken.objects.filter(
+        user=user, is_used=False, expires_at__gt=timezone.now()
+    ).update(is_used=True)
     
     # Create new token
+    raw_token = secrets.token_urlsafe(32)
     token = MagicLoginToken.objects.create(
         user=user,
-        token=str(uuid.uuid4()),
+        token_hash=hash_token(raw_token),
         login_ip=get_client_ip(request),
         user_agent=get_user_agent(request)
     )
+    token.raw_token = raw_token
     return token
 
 def send_magic_login_email(user, request):
@@ -42,52 +57,90 @@ def send_magic_login_email(user, request):
         return False, "Verification login is only available for registered users"
     
     try:
-        # Create magic token
-        magic_token = create_magic_login_token(user, request)
-        
-        # Build the verification link
-        magic_link = request.build_absolute_uri(
-            reverse('magic_login', kwargs={'token': magic_token.token})
-        )
-        
-        # Prepare email context
-        context = {
-            'user': user,
-            'magic_link': magic_link,
-            'login_time': timezone.now().strftime('%B %d, %Y at %I:%M %p'),
-            'user_ip': get_client_ip(request),
-            'user_agent': get_user_agent(request),
-        }
+        # Token and queued email are committed together; the outbox worker
+        # delivers the email, so the request never waits on SMTP
+        with transaction.atomic():
+            # Create magic token
+            magic_token = create_magic_login_token(user, request)
+            
+            # Build the verification link
+            magic_link = request.build_absolute_uri(
+                reverse('magic_login', kwargs={'token': magic_token.raw_token})
+            )
+            
+            # Prepare email context
+            context = {
+                'user': user,
+                'magic_link': magic_link,
+                'login_time': timezone.now().strftime('%B %d, %Y at %I:%M %p'),
+                'user_ip': get_client_ip(request),
+                'user_agent': get_user_agent(request),
+            }
+            
+            # Render email templates
+            html_message = render_to_string('emails/magic_login.html', context)
+            plain_message = render_to_string('emails/magic_login.txt', context)
+            
+            enqueue_email(
+                subject='🔗 Your Verification Login Link - Secure File Share',
+                message=plain_message,
+                recipient_list=[user.email],
+                html_message=html_message,
+            )
         
-        # Render email templates
-        html_message = render_to_string('emails/magic_login.html', context)
-        plain_message = render_to_string('emails/magic_login.txt', context)
-        
-        # Send email with retry mechanism
-        success, message = send_email_with_retry(
-            subject='🔗 Your Verification Login Link - Secure File Share',
-            message=plain_message,
-            recipient_list=[user.email],
-            html_message=html_message,
-            max_retries=3
-        )
-        
-        if success:
-            return True, f"Verification login link sent to {user.email}"
-        else:
-            return False, message
+        return True, f"Verification login link sent to {user.email}"
         
     except Exception as e:
         return False, f"Failed to send email: {str(e)}"
 
-def validate_magic_token(token_string):
-    """Validate and return magic login token if valid"""
-    try:
-        token = MagicLoginToken.objects.get(token=token_string)
-        if token.is_valid():
-            return token, None
-        else:
-            error = "expired" if timezone.now() >= token.expires_at else "already used"
-            return None, f"This verification link has {error}. Please request a new one."
-    except MagicLoginToken.DoesNotExist:
+def _can_update_returning():
+    """Whether the database supports UPDATE ... RETURNING (PostgreSQL, SQLite 3.35+)"""
+    if connection.vendor == 'postgresql':
+        return True
+    return connection.vendor == 'sqlite' and connection.Database.sqlite_version_info >= (3, 35)
+
+def _claim_token(token_hash, now):
+    """Mark a valid token used in one conditional UPDATE; returns its user id or None"""
+    if _can_update_returning():
+        # UPDATE ... RETURNING: a single round-trip, and only one of several
+        # concurrent clicks can match is_used = false
+        table = connection.ops.quote_name(MagicLoginToken._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {table} SET is_used = %s "
+                f"WHERE token_hash = %s AND is_used = %s AND expires_at > %s "
+                f"RETURNING user_id",
+                [True, token_hash, False, connection.ops.adapt_datetimefield_value(now)],
+            )
+            row = cursor.fetchone()
+        return row[0] if row else None
+
+    # Backends without RETURNING: the conditional UPDATE still decides the winner
+    with transaction.atomic():
+        claimed = MagicLoginToken.objects.filter(
+            token_hash=token_hash, is_used=False, expires_at__gt=now
+        ).update(is_used=True)
+        if not claimed:
+            return None
+        return MagicLoginToken.objects.filter(token_hash=token_hash).values_list('user_id', flat=True).first()
+
+def consume_magic_token(token_string):
+    """
+    Atomically use up a magic login token.
+
+    Returns (user, None) for the first valid use, or (None, error message).
+    """
+    token_hash = hash_token(token_string)
+    now = timezone.now()
+
+    user_id = _claim_token(token_hash, now)
+    if user_id is not None:
+        user = CustomUser.objects.filter(pk=user_id).first()
+        if user is not None:
+            return user, None
+
+    token = MagicLoginToken.objects.filter(token_hash=token_hash).values('is_used', 'expires_at').first()
+    if token is None:
         return None, "Invalid verification link. Please check the URL or request a new one."
+    error = "expired" if now >= token['expires_at'] else "already used"
+    return None, f"This verification link has {error}. Please request a new one."
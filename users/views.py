@@ -1,22 +1,36 @@
 from django.shortcuts import render, redirect
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
+from files.listing import (
+    conditional_listing_response, current_listing_version, listing_context, listing_validators, set_listing_headers,
+)
 from files.models import UploadedFile
+from files.storage import store_blob, create_uploaded_file
+from files.upload_handlers import OOXMLUploadHandler
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
 from django.urls import reverse
 from django.contrib import messages
 from django.db import models
 from .forms import OpsUserRegistrationForm, ClientUserRegistrationForm
-from .utils import send_magic_login_email, validate_magic_token
+from .utils import send_magic_login_email, consume_magic_token
 
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.permissions import AllowAny
 from .models import CustomUser
-from .serializers import ClientSignupSerializer, LoginSerializer
-from django.core.mail import send_mail
+from .serializers import (
+    ClientSignupSerializer, LoginSerializer, RoleTokenObtainPairSerializer, RoleTokenRefreshSerializer,
+)
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from django.conf import settings
+from django.db import transaction
+from .email_utils import enqueue_email
+from .throttling import throttle_login, IPRateThrottle, AccountRateThrottle
 from itsdangerous import URLSafeTimedSerializer
 from rest_framework.authtoken.models import Token
+from securefiles.metrics import observe_upload
+import time
 
 serializer = URLSafeTimedSerializer(settings.SECRET_KEY)
 
@@ -24,20 +38,25 @@ serializer = URLSafeTimedSerializer(settings.SECRET_KEY)
 # ✅ API Views
 # -----------------------------
 class ClientSignupView(APIView):
+    # Anonymous by nature; the throttles are what guards them
+    permission_classes = [AllowAny]
+    throttle_classes = [IPRateThrottle, AccountRateThrottle]
+    throttle_scope = 'signup'
+
     def post(self, request):
-        serializer = ClientSignupSerializer(data=request.data)
-        if serializer.is_valid():
-            user = serializer.save()
-            token = serializer.dumps(user.email, salt='email-verify')
-            link = f"http://localhost:8000/api/verify-email/{token}/"
-            send_mail(
-                subject="Verify your email",
-                message=f"Click here to verify your email: {link}",
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[user.email]
-            )
+        signup_serializer = ClientSignupSerializer(data=request.data)
+        if signup_serializer.is_valid():
+            with transaction.atomic():
+                user = signup_serializer.save()
+                token = serializer.dumps(user.email, salt='email-verify')
+                link = f"http://localhost:8000/api/verify-email/{token}/"
+                enqueue_email(
+                    subject="Verify your email",
+                    message=f"Click here to verify your email: {link}",
+                    recipient_list=[user.email]
+                )
             return Response({"message": "Verification email sent", "verification_link": link})
-        return Response(serializer.errors, status=400)
+        return Response(signup_serializer.errors, status=400)
 
 class VerifyEmailView(APIView):
     def get(self, request, token):
@@ -54,6 +73,11 @@ class VerifyEmailView(APIView):
             return Response({"error": "Invalid or expired token"}, status=400)
 
 class LoginView(APIView):
+    # Anonymous by nature; the throttles are what guards them
+    permission_classes = [AllowAny]
+    throttle_classes = [IPRateThrottle, AccountRateThrottle]
+    throttle_scope = 'login'
+
     def post(self, request):
         serializer = LoginSerializer(data=request.data)
         if serializer.is_valid():
@@ -62,6 +86,15 @@ class LoginView(APIView):
             return Response({"token": token.key})
         return Response(serializer.errors, status=400)
 
+class JWTObtainView(TokenObtainPairView):
+    """Short-lived access + refresh JWTs carrying the is_ops/is_client role claims"""
+    serializer_class = RoleTokenObtainPairSerializer
+    throttle_classes = [IPRateThrottle, AccountRateThrottle]
+    throttle_scope = 'login'
+
+class JWTRefreshView(TokenRefreshView):
+    serializer_class = RoleTokenRefreshSerializer
+
 # -----------------------------
 # ✅ Web Views (Template-based)
 # -----------------------------
@@ -94,6 +127,7 @@ def client_register(request):
         form = ClientUserRegistrationForm()
     return render(request, 'register_client.html', {'form': form})
 
+@throttle_login('login')
 def user_login(request):
     """General login view - Verification link only"""
     if request.method == 'POST':
@@ -133,27 +167,50 @@ def user_logout(request):
     logout(request)
     return redirect('login')
 
+@csrf_exempt
 @login_required
 def dashboard_ops(request):
     if not request.user.is_ops:
         return redirect('login')
-    
-    if request.method == 'POST' and request.FILES.get('file'):
-        f = request.FILES['file']
-        if f.name.endswith(('.docx', '.pptx', '.xlsx')):
-            UploadedFile.objects.create(uploader=request.user, file=f)
+    # The upload handler has to be installed before the CSRF check reads the body
+    request.upload_handlers = [OOXMLUploadHandler(request)]
+    return _dashboard_ops(request, time.perf_counter())
+
+@csrf_protect
+def _dashboard_ops(request, started):
+    if request.method == 'POST':
+        f = request.FILES.get('file')
+        error = getattr(request, 'upload_error', None)
+        if error:
+            messages.error(request, error)
+        elif f:
+            blob = store_blob(f)
+            create_uploaded_file(request.user, blob, f.name, f.content_type)
+            observe_upload(blob.size, time.perf_counter() - started)
 
-    files = UploadedFile.objects.all()
-    return render(request, 'dashboard_ops.html', {'files': files})
+    # Names, sizes, uploaders and document details all come from one joined
+    # query, which only runs when the cached table is out of date
+    files = UploadedFile.objects.select_related('uploader', 'metadata').order_by('-uploaded_at')
+    version, _ = current_listing_version()
+    return render(request, 'dashboard_ops.html', listing_context(files, version))
 
 @login_required
 def dashboard_client(request):
     if not request.user.is_client:
         return redirect('login')
     
-    files = UploadedFile.objects.all()
-    return render(request, 'dashboard_client.html', {'files': files})
+    # The page is the listing plus who is looking at it
+    user = request.user
+    etag, last_modified, version = listing_validators(user.pk, user.username, user.get_full_name())
+    response = conditional_listing_response(request, etag, last_modified)
+    if response is not None:
+        return response
 
+    files = UploadedFile.objects.select_related('metadata').order_by('-uploaded_at')
+    response = render(request, 'dashboard_client.html', listing_context(files, version))
+    return set_listing_headers(response, etag, last_modified)
+
+@throttle_login('login')
 def ops_login(request):
     """Login view specifically for operations users - Verification link only"""
     if request.method == 'POST':
@@ -188,6 +245,7 @@ def ops_login(request):
     
     return render(request, 'login_ops.html')
 
+@throttle_login('login')
 def client_login(request):
     """Login view specifically for client users - Verification link only"""
     if request.method == 'POST':
@@ -224,25 +282,22 @@ def client_login(request):
 
 def magic_login(request, token):
     """Handle verification login from email link"""
-    magic_token, error = validate_magic_token(token)
+    # Token is checked and marked used in one atomic statement
+    user, error = consume_magic_token(token)
     
     if error:
         messages.error(request, error)
         return redirect('home')
     
-    if magic_token:
-        # Mark token as used
-        magic_token.is_used = True
-        magic_token.save()
-        
+    if user:
         # Log the user in
-        login(request, magic_token.user)
-        messages.success(request, f'Welcome back, {magic_token.user.get_full_name() or magic_token.user.username}! You have been automatically logged in.')
+        login(request, user)
+        messages.success(request, f'Welcome back, {user.get_full_name() or user.username}! You have been automatically logged in.')
         
         # Redirect to appropriate dashboard based on user type
-        if magic_token.user.is_ops:
+        if user.is_ops:
             return redirect('dashboard_ops')
-        elif magic_token.user.is_client:
+        elif user.is_client:
             return redirect('dashboard_client')
         else:
             return redirect('home')
@@ -250,6 +305,7 @@ def magic_login(request, token):
     messages.error(request, 'Invalid verification link.')
     return redirect('home')
 
+@throttle_login('login')
 def request_magic_login(request):
     """Allow users to request a verification login link via email"""
     if request.method == 'POST':